@@ -0,0 +1,65 @@
+"""
+قياس تقارير المرور الكامل: مسار بايثون (get_full_report + فرز كامل لأضعف 5) مقابل اللقطة العمودية (core.columns).
+تشغيل: python -m benchmarks.bench_analytics [عدد_الأسئلة ...]
+"""
+import random, sys, time
+from datetime import datetime, timedelta, timezone
+
+from core.analytics_engine import analytics
+from core.columns import BankSnapshot
+from core.models import Question
+
+TAGS = ["قدرات", "إنجليزي", "رياضيات", "فيزياء", "كيمياء", "أحياء", "تاريخ", "جغرافيا"]
+
+
+def make_bank(n: int, now: datetime, rng: random.Random):
+    bank = []
+    for i in range(n):
+        total = rng.randint(0, 30)
+        wrong = rng.randint(0, total)
+        bank.append(Question(
+            id=i + 1, text="", tags=rng.sample(TAGS, rng.randint(0, 3)), auto_captured=rng.random() < 0.1,
+            ease_factor=round(rng.uniform(1.3, 3.0), 2), interval=rng.randint(0, 60),
+            next_review=(now + timedelta(hours=rng.randint(-240, 240))).isoformat(),
+            total_reviews=total, correct_count=total - wrong, wrong_count=wrong,
+        ))
+    return bank
+
+
+def legacy(bank, now):
+    """المسار السابق: التقرير الكامل ثم فرز القائمة كلها لأخذ الأضعف."""
+    report = analytics.get_full_report(bank)
+    weak   = sorted(bank, key=lambda q: (q.ease_factor, -q.wrong_count, q.id))[:5]
+    return report, [q.id for q in weak], analytics.card_stats(bank, 5, now)
+
+
+def columnar(snap, now):
+    cards = analytics.snapshot_cards(snap, 5, now)
+    return analytics.snapshot_report(snap), cards["weakest"], cards
+
+
+def _time(fn, reps):
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        out = fn()
+    return (time.perf_counter() - t0) / reps, out
+
+
+def run(n: int, reps: int = 5):
+    rng = random.Random(n)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    ts  = now.timestamp()
+    bank = make_bank(n, now, rng)
+
+    build, snap = _time(lambda: BankSnapshot.from_questions(bank), 1)
+    slow, ref   = _time(lambda: legacy(bank, ts), reps)
+    fast, got   = _time(lambda: columnar(snap, ts), reps)
+    assert got == ref
+
+    print(f"n={n:>7,}  snapshot={build*1e3:8.1f} ms (مرة لكل تغيير)  "
+          f"python={slow*1e3:8.1f} ms  numpy={fast*1e3:7.2f} ms  speedup×{slow/fast:,.0f}")
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [10_000, 100_000]:
+        run(n)
@@ -0,0 +1,226 @@
+"""
+قياس محلل الرسائل: النسخة القديمة متعددة المرات (نسخة مجمّدة هنا كمرجع للاختبار الذهبي)
+مقابل core.parser بمرور واحد — رسائل/ثانية لمسار الاستيراد الجماعي ولمسار سحب أرشيف القنوات.
+تشغيل: python -m benchmarks.bench_parser [عدد_الرسائل ...]
+"""
+import random, re, sys, time
+from typing import List, Optional, Tuple
+
+from core.parser import LABELS, parse_message
+
+# ── المرجع: clean_text + extract_options كما كانتا قبل المحلل ذي المرور الواحد ──
+_ARABIC_LABELS = {
+    "أ": 0, "ا": 0, "ب": 1, "ج": 2, "د": 3,
+    "ه": 4, "هـ": 4, "و": 5, "ز": 6, "ح": 7,
+}
+_OPTION_RE   = re.compile(r"^(?P<label>[أ-يa-zA-Z\d])\s*[\)\-\.–—]\s*(?P<body>.+)", re.UNICODE)
+_CORRECT_RE  = re.compile(
+    r"(?:الإجابة\s*الصحيحة|الجواب\s*الصحيح|✅)"
+    r"[^\u0600-\u06FFa-zA-Z\d]*(?P<label>[أ-يa-zA-Z]|\d+)",
+    re.UNICODE,
+)
+_EXPL_START  = re.compile(r"^(?:شرح|توضيح|ملاحظة|تنبيه|📝|💡|🔍|لأن|السبب|وبالتالي|إذن)", re.UNICODE)
+_EXPL_INLINE = re.compile(r"(?:لأن|حيث|بمعنى|يعني|أي أن|وهو|نلاحظ|وبالتالي|لذلك)", re.UNICODE)
+_TIMER_RE    = re.compile(r"^[0-9]{1,2}[:\.][0-9]{1,2}$")
+_TIMER_KW    = {"ثانية", "ثوان", "الوقت المتبقي", "time left", "sec"}
+
+
+def _legacy_label_to_index(label: str, options: List[str]) -> int:
+    """تحويل حرف/رقم → index — يبحث في الخيارات أولاً ثم الخريطة."""
+    for i, opt in enumerate(options):
+        m = _OPTION_RE.match(opt)
+        if m and m.group("label") == label:
+            return i
+    if label in _ARABIC_LABELS:
+        return _ARABIC_LABELS[label]
+    if label.isdigit():
+        return int(label) - 1
+    if label.isascii() and label.isalpha():
+        return ord(label.lower()) - ord("a")
+    return -1
+
+
+def legacy_clean_text(raw: str) -> str:
+    """إزالة المؤقتات والضجيج من النص."""
+    result = []
+    for line in raw.splitlines():
+        s = line.strip()
+        if not s:
+            result.append(line); continue
+        if any(ch in s for ch in "⏳⌛⏱⏰"):
+            continue
+        if any(kw in s.lower() for kw in _TIMER_KW) and len(s) <= 30:
+            continue
+        if _TIMER_RE.fullmatch(s):
+            continue
+        result.append(line)
+    return "\n".join(result)
+
+
+def legacy_extract_options(text: str) -> Tuple[str, List[str], int, Optional[str]]:
+    """
+    يستخرج: (نص_السؤال, خيارات, index_الإجابة, شرح)
+    
+    يدعم:
+    • أحرف عربية/لاتينية/أرقام مع ) - . – —
+    • ✅ داخل سطر الخيار أو في سطر منفصل
+    • شرح متعدد الأسطر
+    • fallback للخيارات بدون فاصل (أ النص)
+    """
+    lines           = text.splitlines()
+    options         : List[str]  = []
+    correct_index   : int        = -1
+    option_set      : set[int]   = set()
+    correct_line    : int        = -1
+    expl_set        : set[int]   = set()
+
+    # ── 1. رصد الخيارات ──────────────────────────────────────────────
+    for i, line in enumerate(lines):
+        s = line.strip()
+        if not s:
+            continue
+        if _OPTION_RE.match(s):
+            if "✅" in s:
+                correct_line = i
+                clean = re.sub(r"\s*✅.*$", "", s).strip()
+                options.append(clean)
+                correct_index = len(options) - 1
+            else:
+                options.append(s)
+            option_set.add(i)
+
+    # fallback: "أ النص" بدون فاصل
+    if not options:
+        _NP = re.compile(r"^(?P<label>[أ-دa-dA-D])\s+(?P<body>\S.+)", re.UNICODE)
+        for i, line in enumerate(lines):
+            s = line.strip()
+            if _NP.match(s):
+                options.append(s)
+                option_set.add(i)
+
+    # ── 2. الإجابة الصحيحة (سطر منفصل) ──────────────────────────────
+    if correct_line == -1:
+        for i, line in enumerate(lines):
+            if i in option_set:
+                continue
+            m = _CORRECT_RE.search(line)
+            if m:
+                correct_line  = i
+                correct_index = _legacy_label_to_index(m.group("label"), options)
+                break
+        if correct_line == -1:
+            for i, line in enumerate(lines):
+                if i in option_set or "✅" not in line:
+                    continue
+                correct_line = i
+                for pat in (r"[أ-ي]", r"[a-zA-Z]", r"\d+"):
+                    lm = re.search(pat, line)
+                    if lm:
+                        correct_index = _legacy_label_to_index(lm.group(), options)
+                        break
+                break
+
+    # ── 3. الشرح (متعدد الأسطر) ──────────────────────────────────────
+    excluded   = option_set | ({correct_line} if correct_line != -1 else set())
+    expl_parts : List[str] = []
+    in_expl    = False
+
+    for i, line in enumerate(lines):
+        if i in excluded:
+            continue
+        s = line.strip()
+        if not s:
+            if in_expl:
+                break
+            continue
+        if _EXPL_START.match(s) or (not in_expl and _EXPL_INLINE.search(s)):
+            in_expl = True
+            expl_parts.append(s)
+            expl_set.add(i)
+        elif in_expl:
+            expl_parts.append(s)
+            expl_set.add(i)
+
+    explanation = "\n".join(expl_parts).strip() or None
+
+    # ── 4. نص السؤال ─────────────────────────────────────────────────
+    all_excl = excluded | expl_set
+    q_lines  = [
+        lines[i].strip()
+        for i in range(len(lines))
+        if i not in all_excl and lines[i].strip()
+    ]
+    return "\n".join(q_lines).strip(), options, correct_index, explanation
+
+
+# ── مولّد رسائل بصيغ القنوات الشائعة ─────────────────────────────────────────
+STEMS = [
+    "ما عاصمة المملكة العربية السعودية؟", "أي مما يلي يعد من الغازات النبيلة؟",
+    "إذا كان س + 3 = 7 فما قيمة س؟", "Choose the correct synonym for 'rapid':",
+    "مرادف كلمة (الجلي) هو:", "أكمل: العلم نور و ...", "كم عدد أضلاع المسدس؟",
+]
+BODIES = ["الرياض", "جدة", "الهيليوم", "الأكسجين", "4", "10", "fast", "slow", "الواضح", "الغامض", "الجهل", "6"]
+SEPS   = [")", "-", ".", " -", "–", "—", " )"]
+EXPLS  = ["شرح: لأن الناتج يساوي أربعة", "💡 ملاحظة: راجع الدرس الثالث", "وبالتالي فالإجابة واضحة",
+          "السبب أن العنصر خامل كيميائياً", "حيث أن المسدس له ستة أضلاع"]
+NOISE  = ["⏳ 10 ثانية", "00:15", "الوقت المتبقي 5", "time left 3 sec", "تابعونا للمزيد 🌟", "#قدرات"]
+
+
+def make_message(rng: random.Random) -> str:
+    n      = rng.randint(2, 5)
+    latin  = rng.random() < 0.15
+    labels = ["a", "b", "c", "d", "e"] if latin else (["1", "2", "3", "4", "5"] if rng.random() < 0.1 else LABELS)
+    sep    = rng.choice(SEPS)
+    ans    = rng.randrange(n)
+    style  = rng.choice(["inline", "line", "check", "none", "nosep"])
+    lines  = [rng.choice(NOISE)] if rng.random() < 0.3 else []
+    lines += [rng.choice(STEMS)] + ([rng.choice(STEMS)] if rng.random() < 0.2 else [])
+    if rng.random() < 0.2:
+        lines.append("")
+    for i in range(n):
+        body = rng.choice(BODIES)
+        opt  = f"{labels[i]} {body}" if style == "nosep" else f"{labels[i]}{sep} {body}"
+        lines.append(opt + (" ✅" if style == "inline" and i == ans else ""))
+    if style == "line":
+        lines.append(rng.choice(["الإجابة الصحيحة: ", "✅ الإجابة: ", "الجواب الصحيح ", "✅ "]) + labels[ans])
+    elif style == "check":
+        lines.append(f"✅ {rng.choice(BODIES)}")
+    if rng.random() < 0.5:
+        lines += [""] * rng.randint(0, 1) + [rng.choice(EXPLS) for _ in range(rng.randint(1, 2))]
+        if rng.random() < 0.3:
+            lines += ["", rng.choice(STEMS)]
+    if rng.random() < 0.2:
+        lines.append(rng.choice(NOISE))
+    return "\n".join(lines)
+
+
+def make_corpus(n: int, rng: random.Random) -> List[str]:
+    return [make_message(rng) for _ in range(n)]
+
+
+def _rate(fn, msgs: List[str]) -> float:
+    t0 = time.perf_counter()
+    for m in msgs:
+        fn(m)
+    return len(msgs) / (time.perf_counter() - t0)
+
+
+def run(n: int):
+    msgs = make_corpus(n, random.Random(n))
+    for m in msgs:
+        assert parse_message(m) == legacy_extract_options(legacy_clean_text(m)), m
+    # الاستيراد الجماعي: clean_text + extract_options لكل سجل
+    legacy = _rate(lambda m: legacy_extract_options(legacy_clean_text(m)), msgs)
+    fast   = _rate(parse_message, msgs)
+    # سحب الأرشيف: ثلثا رسائل القناة دردشة بلا خيارات (نفس الأسطر بعد حذف أسطر الخيارات)
+    chatter = [m if i % 3 == 0 else "\n".join(ln for ln in m.splitlines() if ln[:1] not in "أبجدهabcde12345")
+               for i, m in enumerate(msgs)]
+    legacy_bf = _rate(lambda m: legacy_extract_options(legacy_clean_text(m)), chatter)
+    fast_bf   = _rate(parse_message, chatter)
+    print(f"n={n:>7,}  import: legacy={legacy:>9,.0f} msg/s  single-pass={fast:>9,.0f} msg/s  ×{fast/legacy:.2f}   "
+          f"backfill: legacy={legacy_bf:>9,.0f} msg/s  single-pass={fast_bf:>9,.0f} msg/s  ×{fast_bf/legacy_bf:.2f}")
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [10_000, 50_000]:
+        run(n)
@@ -0,0 +1,124 @@
+"""
+قياس اختيار السؤال التالي: الفرز الكامل (الطريقة القديمة في main.py) مقابل core.scheduler.Scheduler.
+تشغيل: python -m benchmarks.bench_scheduler [عدد_الأسئلة ...]
+"""
+import random, sys, time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from core.scheduler import Scheduler
+
+WEAK_RATIO = 0.3
+TAGS = ["قدرات", "إنجليزي", "رياضيات", "فيزياء", "كيمياء"]
+
+
+@dataclass
+class Card:
+    id: int
+    next_review: Optional[datetime]
+    total_reviews: int
+    wrong_count: int
+    tags: List[str] = field(default_factory=list)
+
+
+def _ratio(q: Card) -> float:
+    return (q.wrong_count or 0) / (q.total_reviews or 1)
+
+
+def legacy_next(questions, mode="all", tag=None, exclude_id=None, now=None):
+    """نسخة مطابقة لـ get_next_question القديمة (فلترة + فرز القائمة كاملة)."""
+    if   mode == "due":  pool = [q for q in questions if q.next_review and q.next_review <= now]
+    elif mode == "weak": pool = [q for q in questions if (q.total_reviews or 0) > 0 and _ratio(q) > WEAK_RATIO]
+    elif mode == "tag" and tag: pool = [q for q in questions if tag in (q.tags or [])]
+    else: pool = list(questions)
+    if exclude_id:
+        pool = [q for q in pool if q.id != exclude_id]
+    if not pool:
+        return None
+    pool.sort(key=lambda q: (
+        0 if q.next_review and q.next_review <= now else 1, -_ratio(q), -(q.id or 0),
+    ))
+    return pool[0]
+
+
+def make_scheduler() -> Scheduler:
+    return Scheduler(
+        key=lambda q: (-_ratio(q), -q.id),
+        due_at=lambda q: q.next_review,
+        weak=lambda q: (q.total_reviews or 0) > 0 and _ratio(q) > WEAK_RATIO,
+        tags=lambda q: q.tags,
+    )
+
+
+def make_bank(n: int, now: datetime, rng: random.Random) -> List[Card]:
+    return [
+        Card(
+            id=i + 1,
+            next_review=None if rng.random() < 0.05 else now + timedelta(hours=rng.randint(-240, 240)),
+            total_reviews=(tr := rng.randint(0, 20)),
+            wrong_count=rng.randint(0, tr),
+            tags=rng.sample(TAGS, rng.randint(0, 2)),
+        )
+        for i in range(n)
+    ]
+
+
+def review(q: Card, now: datetime, rng: random.Random):
+    q.total_reviews += 1
+    if rng.random() < 0.4:
+        q.wrong_count += 1
+        q.next_review = now + timedelta(days=1)
+    else:
+        q.next_review = now + timedelta(days=rng.randint(1, 30))
+
+
+def run(n: int, steps: int = 200, legacy_steps: int = 20):
+    rng = random.Random(n)
+    now = datetime(2026, 1, 1)
+    modes = [("all", None), ("due", None), ("weak", None), ("tag", TAGS[0])]
+
+    bank  = make_bank(n, now, rng)
+    by_id = {q.id: q for q in bank}
+    sched = make_scheduler()
+    t0 = time.perf_counter()
+    for q in bank:
+        sched.update(q)
+    build = time.perf_counter() - t0
+
+    # تحقق من التطابق أثناء جلسة مراجعة فعلية
+    cur = None
+    for step in range(legacy_steps):
+        mode, tag = modes[step % len(modes)]
+        ref = legacy_next(bank, mode, tag, exclude_id=cur, now=now)
+        got = sched.next(mode, now, tag=tag, exclude=(cur,) if cur else ())
+        assert (ref.id if ref else None) == got, (mode, ref and ref.id, got)
+        if got is not None:
+            review(by_id[got], now, rng)
+            sched.update(by_id[got])
+            cur = got
+
+    t0 = time.perf_counter()
+    for step in range(legacy_steps):
+        mode, tag = modes[step % len(modes)]
+        legacy_next(bank, mode, tag, exclude_id=cur, now=now)
+    legacy = (time.perf_counter() - t0) / legacy_steps
+
+    t0 = time.perf_counter()
+    for step in range(steps):
+        mode, tag = modes[step % len(modes)]
+        got = sched.next(mode, now, tag=tag, exclude=(cur,) if cur else ())
+        if got is not None:
+            review(by_id[got], now, rng)
+            sched.update(by_id[got])
+            cur = got
+    fast = (time.perf_counter() - t0) / steps
+
+    print(f"n={n:>7,}  build={build*1e3:8.1f} ms  "
+          f"legacy={legacy*1e6:10.1f} µs/op  scheduler={fast*1e6:7.1f} µs/op  "
+          f"speedup×{legacy/fast:,.0f}")
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [10_000, 100_000]:
+        run(n)
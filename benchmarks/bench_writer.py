@@ -0,0 +1,43 @@
+"""
+قياس الكتابات المتزامنة: تثبيت لكل كتابة (max_batch=1) مقابل التثبيت الجماعي (core.writer).
+تشغيل: python -m benchmarks.bench_writer [عدد_الكتابات ...]
+"""
+import asyncio, os, sys, tempfile, time
+
+import aiosqlite
+
+from core.database import PRAGMA_SQL
+from core.writer import GROUP_COMMIT_MAX, GroupCommitWriter
+
+
+async def _run(n: int, max_batch: int, concurrency: int = 64):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = await aiosqlite.connect(os.path.join(tmp, "w.db"))
+        await conn.executescript(PRAGMA_SQL)
+        await conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        await conn.commit()
+        w = GroupCommitWriter(conn, max_batch=max_batch)
+        sem = asyncio.Semaphore(concurrency)
+
+        async def put(i):
+            async with sem, w.intent() as d:
+                await d.execute("INSERT INTO t (v) VALUES (?)", (f"row {i}",))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(put(i) for i in range(n)))
+        elapsed = time.perf_counter() - t0
+        await w.close()
+        await conn.close()
+        return elapsed, w.metrics()
+
+
+def run(n: int):
+    single, m1 = asyncio.run(_run(n, 1))
+    group,  mg = asyncio.run(_run(n, GROUP_COMMIT_MAX))
+    print(f"n={n:>6,}  per-write={n/single:9,.0f} w/s ({m1['commits']} commits)  "
+          f"group={n/group:9,.0f} w/s ({mg['commits']} commits, avg batch {mg['avg_batch']}, "
+          f"commit {mg['commit_ms_avg']} ms)  speedup×{single/group:,.1f}")
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [2_000, 10_000]:
+        run(n)
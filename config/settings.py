@@ -10,7 +10,7 @@ class Settings:
     API_ID: int = int(os.environ.get("API_ID", "0"))
     API_HASH: str = os.environ.get("API_HASH", "")
     PHONE_NUMBER: str = os.environ.get("PHONE_NUMBER", "")
-    SESSION_NAME: str = "userbot_session"
+    SESSION_NAME: str = os.environ.get("SESSION_NAME", "userbot_session")
 
     WATCHED_CHANNELS: list = None
 
@@ -1,78 +1,128 @@
-import math
-from typing import List
+import heapq, math
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from core.columns import EASE_BINS, BankSnapshot
 from core.models import Question
-from core.quiz_engine import calculate_streak, get_level_info
+from core.quiz_engine import get_level_info
 
 class AnalyticsEngine:
+    """
+    report(state) يبني التقرير من حالة التحليلات الجارية (Database.get_analytics_state) في O(عدد الوسوم).
+    predict_score / get_full_report يعيدان الحساب من البنك كاملاً — مسار تحقق فقط.
+    snapshot_report / snapshot_cards: نفس المرور الكامل لكن اختزالات متجهة على BankSnapshot (core.columns)؛
+    card_stats نظيرها البايثوني حين لا يتوفر NumPy.
+    """
 
     @staticmethod
-    def predict_score(questions: List[Question]) -> dict:
-        if not questions:
-            return {"overall": 0.0, "by_tag": {}, "confidence": "منخفضة", "total_reviewed": 0}
-        tag_data = {}
-        untagged = {"correct": 0, "total": 0}
-        for q in questions:
-            if q.total_reviews == 0:
-                continue
-            if not q.tags:
-                untagged["correct"] += q.correct_count
-                untagged["total"]   += q.total_reviews
-                continue
-            for tag in q.tags:
-                if tag not in tag_data:
-                    tag_data[tag] = {"correct": 0, "total": 0}
-                tag_data[tag]["correct"] += q.correct_count
-                tag_data[tag]["total"]   += q.total_reviews
-
+    def _score(tag_data: Dict[str, Tuple[int, int]], untagged: Tuple[int, int], total_q: int) -> dict:
         by_tag = {}
         weighted_sum = total_weight = 0.0
-        for tag, data in tag_data.items():
-            if data["total"] > 0:
-                rate   = data["correct"] / data["total"]
-                weight = math.log1p(data["total"])
+        for tag in sorted(tag_data):
+            correct, total = tag_data[tag]
+            if total > 0:
+                rate   = correct / total
+                weight = math.log1p(total)
                 by_tag[tag] = {"score": round(rate*100,1),
-                               "correct": data["correct"],
-                               "total": data["total"]}
+                               "correct": correct,
+                               "total": total}
                 weighted_sum += rate * weight
                 total_weight += weight
 
-        if untagged["total"] > 0:
-            rate   = untagged["correct"] / untagged["total"]
-            weight = math.log1p(untagged["total"])
+        if untagged[1] > 0:
+            rate   = untagged[0] / untagged[1]
+            weight = math.log1p(untagged[1])
             weighted_sum += rate * weight
             total_weight += weight
 
         overall = round((weighted_sum/total_weight*100) if total_weight else 0, 1)
-        total_q = sum(q.total_reviews for q in questions)
         confidence = "عالية" if total_q >= 200 else "متوسطة" if total_q >= 50 else "منخفضة"
         return {"overall": overall, "by_tag": by_tag,
                 "confidence": confidence, "total_reviewed": total_q}
 
     @staticmethod
-    def get_full_report(questions: List[Question]) -> dict:
+    def predict_score(questions: List[Question]) -> dict:
         if not questions:
+            return {"overall": 0.0, "by_tag": {}, "confidence": "منخفضة", "total_reviewed": 0}
+        tag_data = {}
+        untagged = [0, 0]
+        for q in questions:
+            if q.total_reviews == 0:
+                continue
+            if not q.tags:
+                untagged[0] += q.correct_count
+                untagged[1] += q.total_reviews
+                continue
+            for tag in q.tags:
+                c, t = tag_data.get(tag, (0, 0))
+                tag_data[tag] = (c + q.correct_count, t + q.total_reviews)
+        return AnalyticsEngine._score(tag_data, tuple(untagged), sum(q.total_reviews for q in questions))
+
+    @staticmethod
+    def predict_from_state(state: dict) -> dict:
+        if not state["questions"]:
+            return {"overall": 0.0, "by_tag": {}, "confidence": "منخفضة", "total_reviewed": 0}
+        return AnalyticsEngine._score(state["tags"], state["untagged"], state["total_reviews"])
+
+    @staticmethod
+    def _report(n: int, total_reviews: int, streak_days: int, strong: int, prediction: dict, auto: int) -> dict:
+        if not n:
             return {"total_questions":0,"total_reviews":0,"streak_days":0,
                     "level":1,"badge":"🌱","xp":0,"strong_count":0,
                     "weak_count":0,"prediction":{},"auto_captured":0}
-        total_reviews = sum(q.total_reviews for q in questions)
         lvl = get_level_info(total_reviews)
-        all_dates = []
-        for q in questions:
-            all_dates.extend(q.review_dates)
-        streak = calculate_streak(all_dates)
-        strong = [q for q in questions if q.ease_factor >= 2.5 and q.correct_count >= 3]
-        weak   = sorted(questions, key=lambda q: q.ease_factor)[:5]
         return {
-            "total_questions": len(questions),
+            "total_questions": n,
             "total_reviews":   total_reviews,
-            "streak_days":     streak,
+            "streak_days":     streak_days,
             "level":  lvl["level"],
             "badge":  lvl["badge"],
             "xp":     lvl["xp"],
-            "strong_count": len(strong),
-            "weak_count":   len(weak),
-            "prediction":   AnalyticsEngine.predict_score(questions),
-            "auto_captured": sum(1 for q in questions if q.auto_captured),
+            "strong_count": strong,
+            "weak_count":   min(n, 5),
+            "prediction":   prediction,
+            "auto_captured": auto,
         }
 
+    @staticmethod
+    def report(state: dict, streak_days: int = 0) -> dict:
+        return AnalyticsEngine._report(state["questions"], state["total_reviews"], streak_days, state["strong"],
+                                       AnalyticsEngine.predict_from_state(state), state["auto_captured"])
+
+    @staticmethod
+    def get_full_report(questions: List[Question], streak_days: int = 0) -> dict:
+        strong = sum(1 for q in questions if q.ease_factor >= 2.5 and q.correct_count >= 3)
+        return AnalyticsEngine._report(len(questions), sum(q.total_reviews for q in questions), streak_days, strong,
+                                       AnalyticsEngine.predict_score(questions),
+                                       sum(1 for q in questions if q.auto_captured))
+
+    @staticmethod
+    def snapshot_report(snap: BankSnapshot, streak_days: int = 0) -> dict:
+        """يطابق get_full_report حرفياً، من الأعمدة."""
+        n, reviews = len(snap), int(snap.total.sum())
+        prediction = (AnalyticsEngine._score(snap.tag_scores(), snap.untagged(), reviews) if n else
+                      {"overall": 0.0, "by_tag": {}, "confidence": "منخفضة", "total_reviewed": 0})
+        return AnalyticsEngine._report(n, reviews, streak_days, snap.strong_count(), prediction, int(snap.auto.sum()))
+
+    @staticmethod
+    def snapshot_cards(snap: BankSnapshot, k: int = 5, now: Optional[float] = None) -> dict:
+        """الأضعف k (argpartition) + توزيع السهولة + عدد المستحق."""
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        return {"weakest": snap.weakest(k), "ease": snap.ease_distribution(), "due": snap.due_count(now)}
+
+    @staticmethod
+    def card_stats(questions: List[Question], k: int = 5, now: Optional[float] = None) -> dict:
+        """مسار بايثون لـ snapshot_cards: nsmallest بدل فرز القائمة كاملة."""
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        weakest = heapq.nsmallest(k, questions, key=lambda q: (q.ease_factor, -q.wrong_count, q.id))
+        labels  = [f"<{EASE_BINS[0]}"] + [f"{a}-{b}" for a, b in zip(EASE_BINS, EASE_BINS[1:])] + [f"≥{EASE_BINS[-1]}"]
+        ease    = dict.fromkeys(labels, 0)
+        due     = 0
+        for q in questions:
+            ease[labels[bisect_right(EASE_BINS, q.ease_factor)]] += 1
+            if q.next_review:
+                d = datetime.fromisoformat(q.next_review)
+                due += (d if d.tzinfo else d.replace(tzinfo=timezone.utc)).timestamp() <= now
+        return {"weakest": [q.id for q in weakest], "ease": ease, "due": due}
+
 analytics = AnalyticsEngine()
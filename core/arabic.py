@@ -0,0 +1,25 @@
+import hashlib, re
+
+_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+# سلسلة str.replace أسرع بكثير من str.translate على النص العربي (translate يمر حرفاً حرفاً عبر القاموس)
+_FOLD = (
+    ("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ٱ", "ا"),
+    ("ؤ", "و"), ("ئ", "ي"), ("ى", "ي"), ("ة", "ه"),
+    ("\u0640", ""),
+)
+
+
+def normalize_arabic(text) -> str:
+    """توحيد الهمزات والتاء المربوطة وحذف التشكيل والتطويل — يُطبّق على النص المفهرس وعلى عبارة البحث معاً."""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", str(text))
+    for a, b in _FOLD:
+        text = text.replace(a, b)
+    return text.lower()
+
+
+def text_key(text) -> str:
+    """بصمة ثابتة للنص بعد التوحيد وضغط المسافات — للكشف عن التكرار الحرفي."""
+    return hashlib.blake2b(" ".join(normalize_arabic(text).split()).encode("utf-8"),
+                           digest_size=16).hexdigest()
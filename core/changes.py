@@ -0,0 +1,134 @@
+"""
+قناة إبطال محلية بين العمليات (البوت، الـ Mini App، الصائد) التي تكتب في ملف SQLite واحد.
+كل عملية تراقب PRAGMA data_version على اتصال مخصص — يتغير فقط حين تُثبّت اتصالات أخرى كتابة —
+ثم تقرأ من change_log (مشغلات على questions) معرّفات ما تغيّر بعد آخر تسلسل رأته.
+هكذا تبقى الفهارس في الذاكرة طويلة العمر وتُحدَّث بدقة بدل إعادة التحميل الدوري.
+"""
+import asyncio, logging, os
+from typing import Awaitable, Callable, List, Optional
+
+import aiosqlite
+
+from core.writer import PRAGMA_SQL
+
+CHANGE_POLL = float(os.environ.get("CHANGE_POLL", "1.0"))      # ثوانٍ بين فحوص data_version
+
+# صف واحد لكل سؤال يحمل تسلسل آخر تغيير له؛ REPLACE يأخذ تسلسلاً جديداً (AUTOINCREMENT لا يعيد الأرقام) فيبقى مضغوطاً.
+# مصدر واحد: الترحيل 10 في core.database و init_db في البوت (قاعدة لا تمر بترحيلات النواة)؛ جملة لكل عنصر
+CHANGE_LOG_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS change_log (
+        seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+        question_id INTEGER NOT NULL UNIQUE,
+        deleted     INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS change_log_ai AFTER INSERT ON questions BEGIN
+        INSERT OR REPLACE INTO change_log (question_id) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS change_log_au AFTER UPDATE ON questions BEGIN
+        INSERT OR REPLACE INTO change_log (question_id) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS change_log_ad AFTER DELETE ON questions BEGIN
+        INSERT OR REPLACE INTO change_log (question_id, deleted) VALUES (old.id, 1);
+    END""",
+]
+CHANGE_LOG_BACKFILL = "INSERT OR IGNORE INTO change_log (question_id) SELECT id FROM questions ORDER BY id"
+
+logger = logging.getLogger(__name__)
+
+
+class Changes:
+    __slots__ = ("upserts", "deletes", "reset")
+
+    def __init__(self, upserts: List[int], deletes: List[int], reset: bool = False):
+        self.upserts, self.deletes, self.reset = upserts, deletes, reset
+
+    def __repr__(self):
+        return f"Changes(upserts={len(self.upserts)}, deletes={len(self.deletes)}, reset={self.reset})"
+
+
+class ChangeFeed:
+    """
+    poll() يعيد Changes أو None إن لم يتغير شيء. reset=True: التسلسل رجع للخلف (القاعدة أعيد إنشاؤها) — أعد التحميل كاملاً.
+    كتابات العملية نفسها تعود أيضاً (data_version يرى كل اتصال آخر)، وتطبيقها مرة ثانية آمن.
+    """
+
+    def __init__(self, path: str, interval: float = CHANGE_POLL):
+        self.path, self.interval = path, interval
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._version: Optional[int] = None
+        self.seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"polls": 0, "batches": 0, "upserts": 0, "deletes": 0, "resets": 0, "errors": 0}
+
+    async def open(self):
+        """يبدأ من آخر تسلسل حالي: ما قبله يحمله التحميل الكامل الأول للفهرس."""
+        if self._conn is None:
+            self._conn = await aiosqlite.connect(self.path)
+            await self._conn.executescript(PRAGMA_SQL)       # busy_timeout: لا "database is locked" أثناء كتابة الآخرين
+            self._version = await self._data_version()
+            self.seq = await self._last_seq()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _data_version(self) -> int:
+        async with self._conn.execute("PRAGMA data_version") as c:
+            return (await c.fetchone())[0]
+
+    async def _last_seq(self) -> int:
+        async with self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log") as c:
+            return (await c.fetchone())[0]
+
+    async def poll(self) -> Optional[Changes]:
+        await self.open()
+        self.stats["polls"] += 1
+        version = await self._data_version()
+        if version == self._version:
+            return None
+        self._version = version
+        async with self._conn.execute(
+            "SELECT seq, question_id, deleted FROM change_log WHERE seq > ? ORDER BY seq", (self.seq,)
+        ) as c:
+            rows = await c.fetchall()
+        if not rows:
+            last = await self._last_seq()
+            if last >= self.seq:
+                return None                             # كتابة لا تمس questions
+            self.seq = last
+            self.stats["resets"] += 1
+            return Changes([], [], reset=True)
+        self.seq = rows[-1][0]
+        ch = Changes([r[1] for r in rows if not r[2]], [r[1] for r in rows if r[2]])
+        self.stats["batches"] += 1
+        self.stats["upserts"] += len(ch.upserts)
+        self.stats["deletes"] += len(ch.deletes)
+        return ch
+
+    # ── حلقة المراقبة ─────────────────────────────────
+    def start(self, apply: Callable[[Changes], Awaitable[None]]):
+        self._task = asyncio.create_task(self._run(apply))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.close()
+
+    async def _run(self, apply: Callable[[Changes], Awaitable[None]]):
+        while True:
+            try:
+                ch = await self.poll()
+                if ch is not None:
+                    await apply(ch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"change feed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,112 @@
+"""
+لقطة عمودية للبنك (NumPy) للتحليلات التي تحتاج مروراً كاملاً: ترتيب الأضعف، توزيع السهولة، جدول الوسوم.
+تُبنى مرة لكل مجموعة تغييرات (Database.snapshot يعيد استخدامها حتى الكتابة التالية)،
+والوسوم مصفوفة CSR: وسوم السؤال i هي indices[indptr[i]:indptr[i+1]].
+NumPy اختياري: بدونه تبقى التقارير على مسار بايثون الكامل.
+"""
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EASE_BINS = (1.3, 1.5, 1.7, 1.9, 2.1, 2.3, 2.5, 2.7)
+
+
+class BankSnapshot:
+    def __init__(self, ids, ease, correct, total, wrong, interval, due,
+                 auto, tag_names: List[str], indptr, indices):
+        self.ids, self.ease, self.correct, self.total, self.wrong = ids, ease, correct, total, wrong
+        self.interval, self.due, self.auto = interval, due, auto
+        self.tag_names, self.indptr, self.indices = tag_names, indptr, indices
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple], tag_rows: Iterable[Tuple[int, str]]) -> "BankSnapshot":
+        """
+        rows: (id, ease_factor, correct_count, total_reviews, wrong_count, interval, next_review_epoch, auto_captured)
+        مرتبة تصاعدياً بالمعرّف؛ tag_rows: (question_id, tag) بأي ترتيب.
+        """
+        cols = list(zip(*rows)) or [()] * 8
+        ids  = np.array(cols[0], dtype=np.int64)
+        f64  = lambda c: np.array(c, dtype=np.float64)              # None → NaN
+        i64  = lambda c: np.array([v or 0 for v in c], dtype=np.int64)
+        names: Dict[str, int] = {}
+        pairs = [(qid, names.setdefault(t, len(names))) for qid, t in tag_rows]
+        if pairs and len(ids):
+            qids, tcol = np.array(pairs, dtype=np.int64).T
+            rows_of = np.minimum(np.searchsorted(ids, qids), len(ids) - 1)
+            known   = ids[rows_of] == qids                      # وسوم سؤال حُذف بين الاستعلامين
+            rows_of, tcol = rows_of[known], tcol[known]
+            order   = np.lexsort((tcol, rows_of))
+            indices = tcol[order]
+            indptr  = np.concatenate(([0], np.cumsum(np.bincount(rows_of, minlength=len(ids)))))
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            indptr  = np.zeros(len(ids) + 1, dtype=np.int64)
+        return cls(ids, np.nan_to_num(f64(cols[1]), nan=2.5), i64(cols[2]), i64(cols[3]), i64(cols[4]),
+                   np.nan_to_num(f64(cols[5])), f64(cols[6]), np.array(cols[7], dtype=bool),
+                   list(names), indptr, indices)
+
+    @classmethod
+    def from_questions(cls, questions: Sequence) -> "BankSnapshot":
+        """من كائنات Question (النواة) — للقياس والتحقق؛ المسار العادي من SQL مباشرة."""
+        from datetime import datetime, timezone
+        def epoch(s):                                           # نفس julianday في SQLite: بلا منطقة = UTC
+            try:
+                d = datetime.fromisoformat(s) if s else None
+            except ValueError:
+                return None
+            return d and (d if d.tzinfo else d.replace(tzinfo=timezone.utc)).timestamp()
+        qs = sorted(questions, key=lambda q: q.id)
+        rows = [(q.id, q.ease_factor, q.correct_count, q.total_reviews, q.wrong_count, q.interval,
+                 epoch(q.next_review), bool(q.auto_captured)) for q in qs]
+        return cls.from_rows(rows, [(q.id, t) for q in qs for t in dict.fromkeys(q.tags or []) if t])
+
+    # ── اختزالات ───────────────────────────────────────
+    def _tag_rows(self):
+        return np.repeat(np.arange(len(self.ids)), np.diff(self.indptr))
+
+    def strong_count(self) -> int:
+        return int(np.count_nonzero((self.ease >= 2.5) & (self.correct >= 3)))
+
+    def due_count(self, now: float) -> int:
+        return int(np.count_nonzero(self.due <= now))          # NaN (بلا موعد) لا يُحسب
+
+    def weakest(self, k: int = 5) -> List[int]:
+        """الأضعف: سهولة أدنى ثم أخطاء أكثر ثم المعرّف — argpartition ثم فرز المرشحين فقط."""
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+        if k < n:
+            kth  = self.ease[np.argpartition(self.ease, k - 1)[k - 1]]
+            cand = np.flatnonzero(self.ease <= kth)                # كل المتعادلين على الحد
+        else:
+            cand = np.arange(n)
+        order = np.lexsort((self.ids[cand], -self.wrong[cand], self.ease[cand]))
+        return self.ids[cand[order[:k]]].tolist()
+
+    def ease_distribution(self, bins: Sequence[float] = EASE_BINS) -> Dict[str, int]:
+        edges  = np.array([-np.inf, *bins, np.inf])
+        counts = np.histogram(self.ease, edges)[0]
+        labels = [f"<{bins[0]}"] + [f"{a}-{b}" for a, b in zip(bins, bins[1:])] + [f"≥{bins[-1]}"]
+        return dict(zip(labels, counts.tolist()))
+
+    def tag_scores(self) -> Dict[str, Tuple[int, int]]:
+        """(correct, total) لكل وسم فيه مراجعات — مجموع موزون على عمود CSR."""
+        rows = self._tag_rows()
+        m    = len(self.tag_names)
+        corr = np.bincount(self.indices, weights=self.correct[rows], minlength=m)
+        tot  = np.bincount(self.indices, weights=self.total[rows], minlength=m)
+        return {self.tag_names[i]: (int(corr[i]), int(tot[i])) for i in np.flatnonzero(tot > 0)}
+
+    def untagged(self) -> Tuple[int, int]:
+        mask = np.diff(self.indptr) == 0
+        return int(self.correct[mask].sum()), int(self.total[mask].sum())
+
+
+def available() -> bool:
+    return np is not None
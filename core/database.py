@@ -1,9 +1,18 @@
-import json, os, aiosqlite
-from typing import List, Optional
-from datetime import datetime, timezone
-from core.models import Question
+import asyncio, json, os, aiosqlite
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from core.models import Question, ReviewEvent
+from core.arabic import normalize_arabic
+from core import columns
+from core.writer import GroupCommitWriter, PRAGMA_SQL
+from core.dedupe import DedupeIndex, merge_card
+from core.fts import FTS_STATEMENTS, FTS_BACKFILL, FTS_RANK, fts_query, highlight
+from core.changes import CHANGE_LOG_STATEMENTS, CHANGE_LOG_BACKFILL
 
-DB_PATH = os.environ.get("DB_PATH", "data/quiz.db")
+DB_PATH      = os.environ.get("DB_PATH", "data/quiz.db")
+DB_READERS   = int(os.environ.get("DB_READERS", "4"))
 
 CREATE_SQL = """
 CREATE TABLE IF NOT EXISTS questions (
@@ -39,6 +48,316 @@ CREATE TABLE IF NOT EXISTS sync_queue (
 );
 """
 
+# كل عنصر يرفع PRAGMA user_version بمقدار واحد؛ لا تعدّل عنصراً بعد نشره
+MIGRATIONS = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_questions_due      ON questions(next_review);
+    CREATE INDEX IF NOT EXISTS ix_questions_weak     ON questions(ease_factor, wrong_count DESC);
+    CREATE INDEX IF NOT EXISTS ix_questions_priority ON questions(priority, next_review);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS question_tags (
+        question_id INTEGER NOT NULL,
+        tag         TEXT    NOT NULL,
+        PRIMARY KEY (question_id, tag)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ix_question_tags_tag ON question_tags(tag, question_id);
+    INSERT OR IGNORE INTO question_tags (question_id, tag)
+        SELECT q.id, j.value FROM questions q, json_each(q.tags) j
+        WHERE j.type = 'text' AND j.value != '';
+    """,
+    ";\n".join(FTS_STATEMENTS) + ";\n" + FTS_BACKFILL + ";",
+    """
+    CREATE TABLE IF NOT EXISTS question_stats (
+        priority      TEXT    PRIMARY KEY,
+        n             INTEGER NOT NULL DEFAULT 0,
+        total_reviews INTEGER NOT NULL DEFAULT 0,
+        auto_captured INTEGER NOT NULL DEFAULT 0,
+        ease_sum      REAL    NOT NULL DEFAULT 0
+    );
+    CREATE TRIGGER IF NOT EXISTS question_stats_ai AFTER INSERT ON questions BEGIN
+        INSERT OR IGNORE INTO question_stats (priority) VALUES (COALESCE(new.priority, 'normal'));
+        UPDATE question_stats SET n = n + 1,
+               total_reviews = total_reviews + COALESCE(new.total_reviews, 0),
+               auto_captured = auto_captured + COALESCE(new.auto_captured, 0),
+               ease_sum      = ease_sum + COALESCE(new.ease_factor, 0)
+         WHERE priority = COALESCE(new.priority, 'normal');
+    END;
+    CREATE TRIGGER IF NOT EXISTS question_stats_ad AFTER DELETE ON questions BEGIN
+        UPDATE question_stats SET n = n - 1,
+               total_reviews = total_reviews - COALESCE(old.total_reviews, 0),
+               auto_captured = auto_captured - COALESCE(old.auto_captured, 0),
+               ease_sum      = ease_sum - COALESCE(old.ease_factor, 0)
+         WHERE priority = COALESCE(old.priority, 'normal');
+    END;
+    CREATE TRIGGER IF NOT EXISTS question_stats_au
+    AFTER UPDATE OF priority, total_reviews, auto_captured, ease_factor ON questions BEGIN
+        UPDATE question_stats SET n = n - 1,
+               total_reviews = total_reviews - COALESCE(old.total_reviews, 0),
+               auto_captured = auto_captured - COALESCE(old.auto_captured, 0),
+               ease_sum      = ease_sum - COALESCE(old.ease_factor, 0)
+         WHERE priority = COALESCE(old.priority, 'normal');
+        INSERT OR IGNORE INTO question_stats (priority) VALUES (COALESCE(new.priority, 'normal'));
+        UPDATE question_stats SET n = n + 1,
+               total_reviews = total_reviews + COALESCE(new.total_reviews, 0),
+               auto_captured = auto_captured + COALESCE(new.auto_captured, 0),
+               ease_sum      = ease_sum + COALESCE(new.ease_factor, 0)
+         WHERE priority = COALESCE(new.priority, 'normal');
+    END;
+    INSERT INTO question_stats (priority, n, total_reviews, auto_captured, ease_sum)
+        SELECT COALESCE(priority, 'normal'), COUNT(*), COALESCE(SUM(total_reviews), 0),
+               COALESCE(SUM(auto_captured), 0), COALESCE(SUM(ease_factor), 0)
+        FROM questions GROUP BY 1;
+    """,
+    """
+    ALTER TABLE sync_queue ADD COLUMN client_key TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_sync_queue_client_key
+        ON sync_queue(client_key) WHERE client_key IS NOT NULL;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS review_events (
+        id              INTEGER PRIMARY KEY,
+        question_id     INTEGER NOT NULL,
+        ts              INTEGER NOT NULL,
+        quality         INTEGER,
+        interval_before REAL,
+        interval_after  REAL
+    );
+    CREATE INDEX IF NOT EXISTS ix_review_events_ts       ON review_events(ts);
+    CREATE INDEX IF NOT EXISTS ix_review_events_question ON review_events(question_id, ts);
+    INSERT INTO review_events (question_id, ts)
+        SELECT q.id, CAST(strftime('%s', j.value) AS INTEGER)
+        FROM questions q, json_each(q.review_dates) j
+        WHERE j.type = 'text' AND strftime('%s', j.value) IS NOT NULL
+        ORDER BY 2;
+    ALTER TABLE questions DROP COLUMN review_dates;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS backfill_state (
+        channel    TEXT    PRIMARY KEY,
+        high_water INTEGER NOT NULL DEFAULT 0,
+        pass_top   INTEGER,
+        cursor     INTEGER
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pending_polls (
+        chat_id INTEGER NOT NULL,
+        msg_id  INTEGER NOT NULL,
+        data    TEXT    NOT NULL,
+        created INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, msg_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ix_pending_polls_created ON pending_polls(created);
+    """,
+    # عدادات التحليلات الجارية: كل مراجعة تلمس صفوف وسوم سؤالها فقط (O(tags))
+    """
+    ALTER TABLE question_stats ADD COLUMN correct_sum INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE question_stats ADD COLUMN strong      INTEGER NOT NULL DEFAULT 0;
+    DROP TRIGGER IF EXISTS question_stats_ai;
+    DROP TRIGGER IF EXISTS question_stats_ad;
+    DROP TRIGGER IF EXISTS question_stats_au;
+    CREATE TRIGGER question_stats_ai AFTER INSERT ON questions BEGIN
+        INSERT OR IGNORE INTO question_stats (priority) VALUES (COALESCE(new.priority, 'normal'));
+        UPDATE question_stats SET n = n + 1,
+               total_reviews = total_reviews + COALESCE(new.total_reviews, 0),
+               auto_captured = auto_captured + COALESCE(new.auto_captured, 0),
+               ease_sum      = ease_sum + COALESCE(new.ease_factor, 0),
+               correct_sum   = correct_sum + COALESCE(new.correct_count, 0),
+               strong        = strong + (new.ease_factor >= 2.5 AND new.correct_count >= 3)
+         WHERE priority = COALESCE(new.priority, 'normal');
+    END;
+    CREATE TRIGGER question_stats_ad AFTER DELETE ON questions BEGIN
+        UPDATE question_stats SET n = n - 1,
+               total_reviews = total_reviews - COALESCE(old.total_reviews, 0),
+               auto_captured = auto_captured - COALESCE(old.auto_captured, 0),
+               ease_sum      = ease_sum - COALESCE(old.ease_factor, 0),
+               correct_sum   = correct_sum - COALESCE(old.correct_count, 0),
+               strong        = strong - (old.ease_factor >= 2.5 AND old.correct_count >= 3)
+         WHERE priority = COALESCE(old.priority, 'normal');
+    END;
+    CREATE TRIGGER question_stats_au
+    AFTER UPDATE OF priority, total_reviews, auto_captured, ease_factor, correct_count ON questions BEGIN
+        UPDATE question_stats SET n = n - 1,
+               total_reviews = total_reviews - COALESCE(old.total_reviews, 0),
+               auto_captured = auto_captured - COALESCE(old.auto_captured, 0),
+               ease_sum      = ease_sum - COALESCE(old.ease_factor, 0),
+               correct_sum   = correct_sum - COALESCE(old.correct_count, 0),
+               strong        = strong - (old.ease_factor >= 2.5 AND old.correct_count >= 3)
+         WHERE priority = COALESCE(old.priority, 'normal');
+        INSERT OR IGNORE INTO question_stats (priority) VALUES (COALESCE(new.priority, 'normal'));
+        UPDATE question_stats SET n = n + 1,
+               total_reviews = total_reviews + COALESCE(new.total_reviews, 0),
+               auto_captured = auto_captured + COALESCE(new.auto_captured, 0),
+               ease_sum      = ease_sum + COALESCE(new.ease_factor, 0),
+               correct_sum   = correct_sum + COALESCE(new.correct_count, 0),
+               strong        = strong + (new.ease_factor >= 2.5 AND new.correct_count >= 3)
+         WHERE priority = COALESCE(new.priority, 'normal');
+    END;
+    UPDATE question_stats SET
+        correct_sum = (SELECT COALESCE(SUM(correct_count), 0) FROM questions
+                        WHERE COALESCE(priority, 'normal') = question_stats.priority),
+        strong      = (SELECT COUNT(*) FROM questions WHERE COALESCE(priority, 'normal') = question_stats.priority
+                          AND ease_factor >= 2.5 AND correct_count >= 3);
+
+    -- (correct, total) لكل وسم؛ الوسم '' يجمع الأسئلة بلا وسوم
+    CREATE TABLE IF NOT EXISTS tag_stats (
+        tag     TEXT    PRIMARY KEY,
+        correct INTEGER NOT NULL DEFAULT 0,
+        total   INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE TRIGGER tag_stats_q_ai AFTER INSERT ON questions BEGIN
+        INSERT OR IGNORE INTO tag_stats (tag) VALUES ('');
+        UPDATE tag_stats SET correct = correct + COALESCE(new.correct_count, 0),
+                             total   = total + COALESCE(new.total_reviews, 0)
+         WHERE tag = '';
+    END;
+    CREATE TRIGGER tag_stats_q_ad AFTER DELETE ON questions BEGIN
+        UPDATE tag_stats SET correct = correct - COALESCE(old.correct_count, 0),
+                             total   = total - COALESCE(old.total_reviews, 0)
+         WHERE tag IN (SELECT tag FROM question_tags WHERE question_id = old.id)
+            OR (tag = '' AND NOT EXISTS (SELECT 1 FROM question_tags WHERE question_id = old.id));
+    END;
+    CREATE TRIGGER tag_stats_q_au AFTER UPDATE OF correct_count, total_reviews ON questions BEGIN
+        UPDATE tag_stats SET correct = correct + COALESCE(new.correct_count, 0) - COALESCE(old.correct_count, 0),
+                             total   = total + COALESCE(new.total_reviews, 0) - COALESCE(old.total_reviews, 0)
+         WHERE tag IN (SELECT tag FROM question_tags WHERE question_id = new.id)
+            OR (tag = '' AND NOT EXISTS (SELECT 1 FROM question_tags WHERE question_id = new.id));
+    END;
+    CREATE TRIGGER tag_stats_t_ai AFTER INSERT ON question_tags BEGIN
+        INSERT OR IGNORE INTO tag_stats (tag) VALUES (new.tag);
+        UPDATE tag_stats SET
+            correct = correct + COALESCE((SELECT correct_count FROM questions WHERE id = new.question_id), 0)
+                    * (CASE WHEN tag = '' THEN -1 ELSE 1 END),
+            total   = total + COALESCE((SELECT total_reviews FROM questions WHERE id = new.question_id), 0)
+                    * (CASE WHEN tag = '' THEN -1 ELSE 1 END)
+         WHERE tag = new.tag
+            OR (tag = '' AND (SELECT COUNT(*) FROM question_tags WHERE question_id = new.question_id) = 1);
+    END;
+    CREATE TRIGGER tag_stats_t_ad AFTER DELETE ON question_tags BEGIN
+        UPDATE tag_stats SET
+            correct = correct - COALESCE((SELECT correct_count FROM questions WHERE id = old.question_id), 0)
+                    * (CASE WHEN tag = '' THEN -1 ELSE 1 END),
+            total   = total - COALESCE((SELECT total_reviews FROM questions WHERE id = old.question_id), 0)
+                    * (CASE WHEN tag = '' THEN -1 ELSE 1 END)
+         WHERE tag = old.tag
+            OR (tag = '' AND NOT EXISTS (SELECT 1 FROM question_tags WHERE question_id = old.question_id));
+    END;
+    INSERT INTO tag_stats (tag, correct, total)
+        SELECT t.tag, COALESCE(SUM(q.correct_count), 0), COALESCE(SUM(q.total_reviews), 0)
+        FROM question_tags t JOIN questions q ON q.id = t.question_id GROUP BY t.tag;
+    INSERT OR REPLACE INTO tag_stats (tag, correct, total)
+        SELECT '', COALESCE(SUM(correct_count), 0), COALESCE(SUM(total_reviews), 0) FROM questions
+        WHERE id NOT IN (SELECT question_id FROM question_tags);
+
+    -- أيام النشاط: مراجعات كل يوم (UTC) — السلسلة والخريطة الحرارية بلا مسح review_events
+    CREATE TABLE IF NOT EXISTS active_days (
+        day INTEGER PRIMARY KEY,
+        n   INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TRIGGER active_days_ai AFTER INSERT ON review_events BEGIN
+        INSERT OR IGNORE INTO active_days (day) VALUES (new.ts - new.ts % 86400);
+        UPDATE active_days SET n = n + 1 WHERE day = new.ts - new.ts % 86400;
+    END;
+    CREATE TRIGGER active_days_ad AFTER DELETE ON review_events BEGIN
+        UPDATE active_days SET n = n - 1 WHERE day = old.ts - old.ts % 86400;
+        DELETE FROM active_days WHERE day = old.ts - old.ts % 86400 AND n <= 0;
+    END;
+    INSERT INTO active_days (day, n) SELECT ts - ts % 86400, COUNT(*) FROM review_events GROUP BY 1;
+    """,
+    # سجل التغييرات لنسخ العملاء (IndexedDB) ولقناة الإبطال بين العمليات — المخطط في core.changes
+    ";\n".join(CHANGE_LOG_STATEMENTS) + ";\n" + CHANGE_LOG_BACKFILL + ";",
+]
+
+# أقصى عدد معاملات في IN (...) لكل استعلام
+_IN_CHUNK = 900
+
+_REVIEW_UPDATE_SQL = """UPDATE questions SET
+    ease_factor=?,interval=?,repetitions=?,next_review=?,last_review=?,
+    total_reviews=?,correct_count=?,wrong_count=?,streak=?,
+    priority=? WHERE id=?"""
+
+
+def _review_params(q: Question) -> tuple:
+    return (q.ease_factor, q.interval, q.repetitions, q.next_review, q.last_review,
+            q.total_reviews, q.correct_count, q.wrong_count, q.streak,
+            q.priority, q.id)
+
+
+_INSERT_SQL = """INSERT INTO questions
+    (text,options,correct_index,explanation,tags,priority,
+     source_channel,auto_captured,media_type,media_id,
+     ease_factor,interval,repetitions,next_review,last_review,
+     total_reviews,correct_count,wrong_count,streak,created_at)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+
+
+def _insert_params(q: Question, now: str) -> tuple:
+    return (q.text, json.dumps(q.options, ensure_ascii=False),
+            q.correct_index, q.explanation,
+            json.dumps(q.tags, ensure_ascii=False),
+            q.priority, q.source_channel, int(q.auto_captured),
+            q.media_type, q.media_id,
+            q.ease_factor, q.interval, q.repetitions,
+            q.next_review or now, q.last_review,
+            q.total_reviews, q.correct_count, q.wrong_count,
+            q.streak, now)
+
+
+_EVENT_INSERT_SQL = """INSERT INTO review_events
+    (question_id,ts,quality,interval_before,interval_after) VALUES (?,?,?,?,?)"""
+
+
+_MERGE_UPDATE_SQL = """UPDATE questions SET
+    priority=?,tags=?,options=?,correct_index=?,explanation=?,
+    total_reviews=?,correct_count=?,wrong_count=? WHERE id=?"""
+
+
+def _merge_params(q: Question) -> tuple:
+    return (q.priority, json.dumps(q.tags, ensure_ascii=False), json.dumps(q.options, ensure_ascii=False),
+            q.correct_index, q.explanation, q.total_reviews, q.correct_count, q.wrong_count, q.id)
+
+
+_BACKFILL_SAVE_SQL = "INSERT OR REPLACE INTO backfill_state (channel,high_water,pass_top,cursor) VALUES (?,?,?,?)"
+
+
+def _event_params(e: ReviewEvent) -> tuple:
+    return (e.question_id, int(e.ts.timestamp()), e.quality, e.interval_before, e.interval_after)
+
+
+def _day_start(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _chunks(items: list, size: int = _IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+_TAG_FILTER = "id IN (SELECT question_id FROM question_tags WHERE tag=?)"
+_MODE_ORDER = {
+    "due":    "next_review",
+    "weak":   "ease_factor ASC, wrong_count DESC",
+    "urgent": "next_review",
+}
+# مفتاح keyset لكل وضع (العمود، تصاعدي؟) — نفس ترتيب _MODE_ORDER مع id لكسر التعادل
+_SESSION_KEYS = {
+    "due":    (("next_review", True), ("id", True)),
+    "weak":   (("ease_factor", True), ("wrong_count", False), ("id", True)),
+    "urgent": (("next_review", True), ("id", True)),
+}
+
+
+def _keyset_after(keys, values) -> Tuple[str, list]:
+    """شرط «بعد المؤشر» لترتيب متعدد الأعمدة؛ NULL أولاً تصاعدياً وأخيراً تنازلياً كما يرتب SQLite."""
+    ors, params = [], []
+    for i, (col, asc) in enumerate(keys):
+        eq = [f"{c} IS ?" for c, _ in keys[:i]]
+        gt = (f"({col} > ? OR (? IS NULL AND {col} IS NOT NULL))" if asc else
+              f"({col} < ? OR ({col} IS NULL AND ? IS NOT NULL))")
+        ors.append("(" + " AND ".join(eq + [gt]) + ")")
+        params += [*values[:i], values[i], values[i]]
+    return "(" + " OR ".join(ors) + ")", params
+
 def _row(r) -> Question:
     return Question(
         id=r[0], text=r[1],
@@ -54,147 +373,681 @@ def _row(r) -> Question:
         last_review=r[15], total_reviews=r[16],
         correct_count=r[17], wrong_count=r[18],
         streak=r[19], created_at=r[20] or "",
-        review_dates=json.loads(r[21] or "[]"),
     )
 
+class ConnectionPool:
+    def __init__(self, path: str, readers: int = DB_READERS):
+        self.path = path
+        self.size = max(1, readers)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._group: Optional[GroupCommitWriter] = None
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._all: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+        self.version = 0                # يزيد مع كل معاملة كتابة ناجحة (من هذه العملية أو غيرها — data_version)
+        self._external: Optional[int] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        await conn.executescript(PRAGMA_SQL)
+        await conn.create_function("arabic_norm", 1, normalize_arabic, deterministic=True)
+        self._all.append(conn)
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self.is_open:
+                return
+            self._writer = await self._connect()
+            self._group  = GroupCommitWriter(self._writer, self._committed)
+            for _ in range(self.size):
+                self._readers.put_nowait(await self._connect())
+
+    async def close(self):
+        if self._group is not None:
+            await self._group.close()
+        conns, self._all = self._all, []
+        self._writer, self._group = None, None
+        self._readers = asyncio.Queue()
+        for conn in conns:
+            await conn.close()
+
+    async def data_version(self) -> int:
+        """
+        رقم نسخة البيانات: كتاباتنا ترفعه مباشرة، وكتابات العمليات الأخرى (الصائد/البوت) تُكتشف
+        بـ PRAGMA data_version على اتصال الكتابة — لا يتغير بكتاباته هو، فلا عدّ مزدوج.
+        """
+        if not self.is_open:
+            await self.open()
+        async with self._writer.execute("PRAGMA data_version") as c:
+            external = (await c.fetchone())[0]
+        if external != self._external:
+            if self._external is not None:
+                self.version += 1
+            self._external = external
+        return self.version
+
+    @asynccontextmanager
+    async def reader(self):
+        if not self.is_open:
+            await self.open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    def _committed(self):
+        self.version += 1
+
+    def write_metrics(self) -> dict:
+        """عمق طابور الكتابة، حجم الدفعات، وزمن التثبيت (core.writer)."""
+        return self._group.metrics() if self._group is not None else {}
+
+    @asynccontextmanager
+    async def writer(self, raw: bool = False):
+        """
+        نيّة كتابة عبر الكاتب الوحيد: الكتلة تُنفَّذ ضمن دفعة تُثبَّت جماعياً، والخروج بعد التثبيت.
+        استثناء داخل الكتلة يتراجع عنها وحدها. raw=True للترحيلات (executescript يدير معاملته).
+        """
+        if not self.is_open:
+            await self.open()
+        async with self._group.intent(raw) as d:
+            yield d
+
+
 class Database:
     def __init__(self, path: str = DB_PATH):
         self.path = path
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.pool = ConnectionPool(path)
+        self._dedupe: Optional[DedupeIndex] = None
+        self._dedupe_lock = asyncio.Lock()
+        self._snapshot: Optional[Tuple[int, "columns.BankSnapshot"]] = None
 
     async def init(self):
-        async with aiosqlite.connect(self.path) as d:
+        await self.pool.open()
+        async with self.pool.writer(raw=True) as d:
             await d.executescript(CREATE_SQL)
-            await d.commit()
+            await self._migrate(d)
+
+    @staticmethod
+    async def _migrate(d):
+        async with d.execute("PRAGMA user_version") as c:
+            version = (await c.fetchone())[0]
+        for i, sql in enumerate(MIGRATIONS[version:], start=version + 1):
+            await d.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version={i};\nCOMMIT;")
+
+    @staticmethod
+    async def _set_tags(d, qid: int, tags: List[str]):
+        await d.execute("DELETE FROM question_tags WHERE question_id=?", (qid,))
+        await d.executemany(
+            "INSERT OR IGNORE INTO question_tags (question_id,tag) VALUES (?,?)",
+            [(qid, t) for t in tags if t]
+        )
+
+    async def _fetch(self, sql: str, params: tuple = ()) -> List[Question]:
+        async with self.pool.reader() as d:
+            async with d.execute(sql, params) as c:
+                return [_row(r) for r in await c.fetchall()]
+
+    async def close(self):
+        await self.pool.close()
 
     async def add_question(self, q: Question) -> int:
         now = datetime.now(timezone.utc).isoformat()
-        async with aiosqlite.connect(self.path) as d:
-            cur = await d.execute(
-                """INSERT INTO questions
-                   (text,options,correct_index,explanation,tags,priority,
-                    source_channel,auto_captured,media_type,media_id,
-                    ease_factor,interval,repetitions,next_review,last_review,
-                    total_reviews,correct_count,wrong_count,streak,created_at,review_dates)
-                   VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-                (q.text, json.dumps(q.options, ensure_ascii=False),
-                 q.correct_index, q.explanation,
-                 json.dumps(q.tags, ensure_ascii=False),
-                 q.priority, q.source_channel, int(q.auto_captured),
-                 q.media_type, q.media_id,
-                 q.ease_factor, q.interval, q.repetitions,
-                 q.next_review or now, q.last_review,
-                 q.total_reviews, q.correct_count, q.wrong_count,
-                 q.streak, now, json.dumps(q.review_dates, ensure_ascii=False))
+        async with self.pool.writer() as d:
+            cur = await d.execute(_INSERT_SQL, _insert_params(q, now))
+            await self._set_tags(d, cur.lastrowid, q.tags)
+        if self._dedupe is not None:
+            self._dedupe.add(cur.lastrowid, q.text, q.options)
+        return cur.lastrowid
+
+    async def bulk_add(self, questions: List[Question]) -> List[int]:
+        """
+        إدراج دفعة كاملة بـ executemany في معاملة واحدة.
+        دفعات الكاتب تبدأ بـ BEGIN IMMEDIATE (core.writer)، فقفل الكتابة محجوز قبل قراءة MAX(id)
+        ولا تُدرج عملية أخرى (البوت الصامت مثلاً) بين القراءة والإدراج وتختلط معرّفاتها بمعرّفات الدفعة.
+        """
+        if not questions:
+            return []
+        now = datetime.now(timezone.utc).isoformat()
+        async with self.pool.writer() as d:
+            async with d.execute("SELECT COALESCE(MAX(id),0) FROM questions") as c:
+                base = (await c.fetchone())[0]
+            await d.executemany(_INSERT_SQL, [_insert_params(q, now) for q in questions])
+            async with d.execute("SELECT id FROM questions WHERE id>? ORDER BY id", (base,)) as c:
+                ids = [r[0] for r in await c.fetchall()]
+            await d.executemany(
+                "INSERT OR IGNORE INTO question_tags (question_id,tag) VALUES (?,?)",
+                [(qid, t) for qid, q in zip(ids, questions) for t in set(q.tags or []) if t]
             )
-            await d.commit()
-            return cur.lastrowid
+        if self._dedupe is not None:
+            for qid, q in zip(ids, questions):
+                self._dedupe.add(qid, q.text, q.options)
+        return ids
+
+    async def all_texts(self) -> List[str]:
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT text FROM questions") as c:
+                return [r[0] for r in await c.fetchall()]
+
+    # ── كشف التكرار ───────────────────────────────────────
+    async def dedupe_index(self) -> DedupeIndex:
+        """يُبنى من البنك عند أول استخدام (أو عند الإقلاع) ثم يُصان مع كل إضافة وحذف."""
+        if self._dedupe is None:
+            index, last = DedupeIndex(), -1
+            while last is not None:             # جولة لاحقة تلتقط ما أُدرج أثناء البناء
+                start, last = last, None
+                async with self.pool.reader() as d:
+                    async with d.execute("SELECT id,text,options FROM questions WHERE id>? ORDER BY id",
+                                         (start,)) as c:
+                        async for r in c:
+                            index.add(r[0], r[1], json.loads(r[2] or "[]"))
+                            last = r[0]
+            if self._dedupe is None:
+                self._dedupe = index
+        return self._dedupe
+
+    async def apply_changes(self, ch) -> None:
+        """
+        كتابات العمليات الأخرى (core.changes.ChangeFeed) على فهرس التكرار: حذف المحذوف وإعادة بصمة المتغير فقط.
+        اللقطة العمودية ونسخة البيانات تتبعان PRAGMA data_version وحدهما.
+        """
+        if self._dedupe is None:
+            return
+        async with self._dedupe_lock:
+            if ch.reset:
+                self._dedupe = None
+                return
+            for qid in ch.deletes:
+                self._dedupe.remove(qid)
+            async with self.pool.reader() as d:
+                for part in _chunks(ch.upserts):
+                    async with d.execute(
+                        f"SELECT id,text,options FROM questions WHERE id IN ({','.join('?' * len(part))})", part
+                    ) as c:
+                        found = set()
+                        async for r in c:
+                            self._dedupe.add(r[0], r[1], json.loads(r[2] or "[]"))
+                            found.add(r[0])
+                    for qid in set(part) - found:       # حُذف بعد تسجيل التغيير
+                        self._dedupe.remove(qid)
+
+    async def add_or_merge(self, q: Question) -> Tuple[int, Optional[str]]:
+        """
+        إدراج سؤال مُلتقط، أو دمجه في نسخته المخزنة إن كان مكرراً.
+        يعيد (id, None) عند الإدراج أو (id الأصل, 'exact'|'near') عند الدمج.
+        """
+        async with self._dedupe_lock:           # الفحص والإدراج معاً: التقاطان متزامنان لا يمرّان كلاهما
+            hit = (await self.dedupe_index()).find(q.text, q.options)
+            if hit:
+                dst = await self.get_question(hit[0])
+                if dst is not None:
+                    merge_card(dst, q)
+                    async with self.pool.writer() as d:
+                        await d.execute(_MERGE_UPDATE_SQL, _merge_params(dst))
+                        await self._set_tags(d, dst.id, dst.tags)
+                    return dst.id, hit[1]
+                self._dedupe.remove(hit[0])     # حُذف من عملية أخرى
+            return await self.add_question(q), None
+
+    async def add_or_merge_many(self, questions: List[Question],
+                                checkpoint: Optional[tuple] = None) -> List[Tuple[int, Optional[str]]]:
+        """
+        add_or_merge لدفعة كاملة في معاملة واحدة، والتكرار داخل الدفعة نفسها يُدمج أيضاً.
+        checkpoint = (channel, high_water, pass_top, cursor) يُحفظ في المعاملة نفسها:
+        إما أن تُكتب الصفحة وتتقدم علامة التعبئة معاً أو لا شيء منهما.
+        """
+        async with self._dedupe_lock:
+            index, out, added = await self.dedupe_index(), [], []
+            try:
+                async with self.pool.writer() as d:
+                    for q in questions:
+                        hit, dst = index.find(q.text, q.options), None
+                        if hit:
+                            async with d.execute("SELECT * FROM questions WHERE id=?", (hit[0],)) as c:
+                                r = await c.fetchone()
+                            dst = _row(r) if r else None
+                        if dst is not None:
+                            merge_card(dst, q)
+                            await d.execute(_MERGE_UPDATE_SQL, _merge_params(dst))
+                            await self._set_tags(d, dst.id, dst.tags)
+                            out.append((dst.id, hit[1]))
+                            continue
+                        cur = await d.execute(_INSERT_SQL, _insert_params(q, datetime.now(timezone.utc).isoformat()))
+                        await self._set_tags(d, cur.lastrowid, q.tags)
+                        index.add(cur.lastrowid, q.text, q.options)
+                        added.append(cur.lastrowid)
+                        out.append((cur.lastrowid, None))
+                    if checkpoint is not None:
+                        await d.execute(_BACKFILL_SAVE_SQL, checkpoint)
+            except BaseException:
+                for qid in added:                  # المعاملة أُلغيت: لا تبقى مدخلات وهمية في الفهرس
+                    index.remove(qid)
+                raise
+            return out
+
+    async def get_backfill_state(self, channel: str) -> Tuple[int, Optional[int], Optional[int]]:
+        """(high_water, pass_top, cursor) — cursor غير فارغ يعني جولة تعبئة لم تكتمل."""
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT high_water,pass_top,cursor FROM backfill_state WHERE channel=?",
+                                 (channel,)) as c:
+                r = await c.fetchone()
+        return tuple(r) if r else (0, None, None)
+
+    async def save_backfill_state(self, channel: str, high_water: int,
+                                  pass_top: Optional[int] = None, cursor: Optional[int] = None):
+        async with self.pool.writer() as d:
+            await d.execute(_BACKFILL_SAVE_SQL, (channel, high_water, pass_top, cursor))
+
+    # ── استطلاعات الصائد المنتظرة ─────────────────────────
+    async def save_pending_polls(self, rows: List[tuple], deletes: Iterable[tuple] = ()):
+        """rows = [(chat_id, msg_id, data: dict, created: int), ...]؛ deletes = [(chat_id, msg_id), ...] — معاملة واحدة."""
+        deletes = list(deletes)
+        if rows or deletes:
+            async with self.pool.writer() as d:
+                await d.executemany(
+                    "INSERT OR REPLACE INTO pending_polls (chat_id,msg_id,data,created) VALUES (?,?,?,?)",
+                    [(c, m, json.dumps(data, ensure_ascii=False), t) for c, m, data, t in rows]
+                )
+                await d.executemany("DELETE FROM pending_polls WHERE chat_id=? AND msg_id=?", deletes)
+
+    async def get_pending_poll(self, chat_id: int, msg_id: int, since: int = 0) -> Optional[tuple]:
+        """(data, created) أو None — since يستبعد المنتهي الذي لم يُحذف بعد."""
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT data,created FROM pending_polls WHERE chat_id=? AND msg_id=? AND created>=?",
+                                 (chat_id, msg_id, since)) as c:
+                r = await c.fetchone()
+        return (json.loads(r[0]), r[1]) if r else None
+
+    async def load_pending_polls(self, since: int, limit: int) -> List[tuple]:
+        """الأحدث أولاً: [(chat_id, msg_id, data, created), ...] لتعبئة الذاكرة عند الإقلاع."""
+        async with self.pool.reader() as d:
+            async with d.execute("""SELECT chat_id,msg_id,data,created FROM pending_polls
+                                    WHERE created>=? ORDER BY created DESC LIMIT ?""", (since, limit)) as c:
+                return [(r[0], r[1], json.loads(r[2]), r[3]) for r in await c.fetchall()]
+
+    async def prune_pending_polls(self, before: int) -> int:
+        async with self.pool.writer() as d:
+            c = await d.execute("DELETE FROM pending_polls WHERE created<?", (before,))
+        return c.rowcount
+
+    async def merge_duplicates(self) -> dict:
+        """
+        دمج التكرار المخزّن سابقاً دفعة واحدة: كل مجموعة تُدمج في أقدم بطاقة فيها،
+        وتُنقل أحداث مراجعاتها إليها، ثم تُحذف البقية — في معاملة واحدة.
+        """
+        async with self._dedupe_lock:
+            index  = await self.dedupe_index()
+            groups = index.clusters()
+            if not groups:
+                return {"clusters": 0, "merged": 0}
+            ids   = [i for g in groups for i in g]
+            cards = {}
+            for part in _chunks(ids):
+                cards.update((q.id, q) for q in await self._fetch(
+                    f"SELECT * FROM questions WHERE id IN ({','.join('?' * len(part))})", tuple(part)))
+            keepers, dropped = [], []
+            for g in groups:
+                keep = cards.get(g[0])
+                if keep is None:
+                    continue
+                for qid in g[1:]:
+                    if qid in cards:
+                        merge_card(keep, cards[qid])
+                        dropped.append((keep.id, qid))
+                keepers.append(keep)
+            async with self.pool.writer() as d:
+                await d.executemany(_MERGE_UPDATE_SQL, [_merge_params(q) for q in keepers])
+                for q in keepers:
+                    await self._set_tags(d, q.id, q.tags)
+                await d.executemany("UPDATE review_events SET question_id=? WHERE question_id=?", dropped)
+                await d.executemany("DELETE FROM question_tags WHERE question_id=?", [(i,) for _, i in dropped])
+                await d.executemany("DELETE FROM questions WHERE id=?", [(i,) for _, i in dropped])
+            for _, qid in dropped:
+                index.remove(qid)
+            return {"clusters": len(keepers), "merged": len(dropped)}
 
     async def get_question(self, qid: int) -> Optional[Question]:
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.reader() as d:
             async with d.execute("SELECT * FROM questions WHERE id=?", (qid,)) as c:
                 r = await c.fetchone()
                 return _row(r) if r else None
 
     async def update_question(self, q: Question):
-        async with aiosqlite.connect(self.path) as d:
-            await d.execute(
-                """UPDATE questions SET
-                   ease_factor=?,interval=?,repetitions=?,next_review=?,last_review=?,
-                   total_reviews=?,correct_count=?,wrong_count=?,streak=?,
-                   priority=?,tags=?,review_dates=? WHERE id=?""",
-                (q.ease_factor, q.interval, q.repetitions, q.next_review, q.last_review,
-                 q.total_reviews, q.correct_count, q.wrong_count, q.streak,
-                 q.priority, json.dumps(q.tags, ensure_ascii=False),
-                 json.dumps(q.review_dates, ensure_ascii=False), q.id)
-            )
-            await d.commit()
+        async with self.pool.writer() as d:
+            await d.execute(_REVIEW_UPDATE_SQL, _review_params(q))
+            await d.execute("UPDATE questions SET tags=? WHERE id=?",
+                            (json.dumps(q.tags, ensure_ascii=False), q.id))
+            await self._set_tags(d, q.id, q.tags)
 
     async def delete_question(self, qid: int) -> bool:
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.writer() as d:
             c = await d.execute("DELETE FROM questions WHERE id=?", (qid,))
-            await d.commit()
-            return c.rowcount > 0
+            await d.execute("DELETE FROM question_tags WHERE question_id=?", (qid,))
+            await d.execute("DELETE FROM review_events WHERE question_id=?", (qid,))
+        if self._dedupe is not None:
+            self._dedupe.remove(qid)
+        return c.rowcount > 0
 
     async def all_questions(self) -> List[Question]:
-        async with aiosqlite.connect(self.path) as d:
-            async with d.execute("SELECT * FROM questions ORDER BY id") as c:
-                return [_row(r) for r in await c.fetchall()]
+        return await self._fetch("SELECT * FROM questions ORDER BY id")
+
+    async def iter_pages(self, chunk: int = 500) -> AsyncIterator[List[dict]]:
+        """صفحات keyset (id > آخر id) — قارئ لكل صفحة، فلا يُحجز اتصال طوال التصدير."""
+        last = 0
+        while True:
+            page = await self._fetch("SELECT * FROM questions WHERE id>? ORDER BY id LIMIT ?", (last, chunk))
+            if not page:
+                return
+            last = page[-1].id
+            yield [asdict(q) for q in page]
+
+    @staticmethod
+    def _mode_filter(mode: str, tag: Optional[str]) -> Tuple[list, list]:
+        where, params = [], []
+        if mode == "due":
+            where.append("next_review<=?")
+            params.append(datetime.now(timezone.utc).isoformat())
+        elif mode == "urgent":
+            where.append("priority=?")          # ix_questions_priority (priority, next_review)
+            params.append("urgent")
+        if tag:
+            where.append(_TAG_FILTER)
+            params.append(tag)
+        return where, params
+
+    async def get_questions(self, mode: str = "all", tag: Optional[str] = None,
+                            limit: int = 20) -> List[Question]:
+        where, params = self._mode_filter(mode, tag)
+        sql = "SELECT * FROM questions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {_MODE_ORDER.get(mode, 'id')} LIMIT ?"
+        return await self._fetch(sql, (*params, limit))
+
+    async def get_session(self, mode: str = "all", tag: Optional[str] = None, limit: int = 20,
+                          after: Optional[list] = None) -> Tuple[List[Question], Optional[list]]:
+        """
+        دفعة الجلسة التالية بترتيب get_questions مع مؤشر keyset (قيم مفتاح آخر بطاقة).
+        المؤشر التالي None عند نهاية الوضع؛ ما رُوجع أثناء الجلسة لا يعود قبل تمريرة جديدة.
+        """
+        keys = _SESSION_KEYS.get(mode, (("id", True),))
+        where, params = self._mode_filter(mode, tag)
+        if after is not None:
+            if len(after) != len(keys):
+                raise ValueError("cursor")
+            cond, extra = _keyset_after(keys, after)
+            where.append(cond)
+            params += extra
+        sql = "SELECT " + ", ".join(c for c, _ in keys) + ", * FROM questions"      # المفتاح خاماً (NULL يبقى NULL)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ", ".join(c if asc else f"{c} DESC" for c, asc in keys) + " LIMIT ?"
+        async with self.pool.reader() as d:
+            async with d.execute(sql, (*params, limit)) as c:
+                rows = await c.fetchall()
+        cards = [_row(r[len(keys):]) for r in rows]
+        if len(rows) < limit:
+            return cards, None
+        return cards, list(rows[-1][:len(keys)])
 
     async def get_due_questions(self, limit: int = 50) -> List[Question]:
-        now = datetime.now(timezone.utc).isoformat()
-        async with aiosqlite.connect(self.path) as d:
-            async with d.execute(
-                "SELECT * FROM questions WHERE next_review<=? ORDER BY next_review LIMIT ?",
-                (now, limit)
-            ) as c:
-                return [_row(r) for r in await c.fetchall()]
+        return await self.get_questions("due", limit=limit)
 
     async def get_weakest(self, limit: int = 5) -> List[Question]:
-        async with aiosqlite.connect(self.path) as d:
-            async with d.execute(
-                "SELECT * FROM questions ORDER BY ease_factor ASC, wrong_count DESC LIMIT ?",
-                (limit,)
-            ) as c:
-                return [_row(r) for r in await c.fetchall()]
+        return await self.get_questions("weak", limit=limit)
 
-    async def search(self, term: str) -> List[Question]:
-        async with aiosqlite.connect(self.path) as d:
+    async def search(self, term: str, limit: int = 20, offset: int = 0) -> List[Question]:
+        return [q for q, _ in await self.search_snippets(term, limit, offset)]
+
+    async def search_snippets(self, term: str, limit: int = 20,
+                              offset: int = 0) -> List[Tuple[Question, str]]:
+        match = fts_query(term)
+        if not match:
+            return []
+        async with self.pool.reader() as d:
             async with d.execute(
-                "SELECT * FROM questions WHERE text LIKE ? LIMIT 20",
-                (f"%{term}%",)
+                f"""SELECT q.* FROM questions_fts
+                    JOIN questions q ON q.id = questions_fts.rowid
+                    WHERE questions_fts MATCH ? ORDER BY {FTS_RANK} LIMIT ? OFFSET ?""",
+                (match, limit, offset)
             ) as c:
-                return [_row(r) for r in await c.fetchall()]
+                rows = [_row(r) for r in await c.fetchall()]
+        return [(q, highlight(q.text, term)) for q in rows]
 
     async def get_by_tag(self, tag: str) -> List[Question]:
-        return [q for q in await self.all_questions() if tag in q.tags]
+        return await self._fetch(
+            """SELECT q.* FROM question_tags t JOIN questions q ON q.id=t.question_id
+               WHERE t.tag=? ORDER BY q.id""", (tag,)
+        )
 
     async def get_all_tags(self) -> List[str]:
-        tags = set()
-        for q in await self.all_questions():
-            tags.update(q.tags)
-        return sorted(tags)
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT DISTINCT tag FROM question_tags ORDER BY tag") as c:
+                return [r[0] for r in await c.fetchall()]
+
+    async def get_tag_counts(self) -> dict:
+        async with self.pool.reader() as d:
+            async with d.execute(
+                "SELECT tag, COUNT(*) FROM question_tags GROUP BY tag ORDER BY tag"
+            ) as c:
+                return {r[0]: r[1] for r in await c.fetchall()}
 
     async def clear_all(self):
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.writer() as d:
             await d.execute("DELETE FROM questions")
+            await d.execute("DELETE FROM question_tags")
+            await d.execute("DELETE FROM review_events")
             await d.execute("DELETE FROM sync_queue")
-            await d.commit()
+        if self._dedupe is not None:
+            self._dedupe.clear()
 
-    async def get_stats(self) -> dict:
-        all_q = await self.all_questions()
+    async def get_stats(self, materialized: bool = True) -> dict:
         now = datetime.now(timezone.utc).isoformat()
-        total = len(all_q)
-        due = sum(1 for q in all_q if q.next_review and q.next_review <= now)
-        by_priority = {}
-        total_reviews = sum(q.total_reviews for q in all_q)
-        auto_count = sum(1 for q in all_q if q.auto_captured)
-        avg_ease = sum(q.ease_factor for q in all_q)/total if total else 2.5
-        for q in all_q:
-            by_priority[q.priority] = by_priority.get(q.priority, 0) + 1
+        async with self.pool.reader() as d:
+            if materialized:
+                async with d.execute(
+                    """SELECT priority, n, total_reviews, auto_captured, ease_sum,
+                              (SELECT COUNT(*) FROM questions WHERE next_review<=?)
+                       FROM question_stats WHERE n > 0""", (now,)
+                ) as c:
+                    rows = await c.fetchall()
+            else:
+                async with d.execute(
+                    """SELECT COALESCE(priority,'normal'), COUNT(*), SUM(total_reviews),
+                              SUM(auto_captured), SUM(ease_factor), SUM(next_review<=?)
+                       FROM questions GROUP BY 1""", (now,)
+                ) as c:
+                    rows = await c.fetchall()
+        by_priority = {r[0]: r[1] for r in rows}
+        total = sum(by_priority.values())
+        ease_sum = sum(r[4] or 0 for r in rows)
+        due = rows[0][5] if materialized and rows else sum(r[5] or 0 for r in rows)
         return {"total": total, "due": due, "by_priority": by_priority,
-                "total_reviews": total_reviews, "auto_captured": auto_count,
-                "avg_ease": round(avg_ease, 2)}
+                "total_reviews": sum(r[2] or 0 for r in rows),
+                "auto_captured": sum(r[3] or 0 for r in rows),
+                "avg_ease": round(ease_sum/total if total else 2.5, 2)}
 
     async def add_sync_item(self, question_id: int, quality: int, timestamp: str):
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.writer() as d:
             await d.execute(
                 "INSERT INTO sync_queue (question_id,quality,timestamp) VALUES (?,?,?)",
                 (question_id, quality, timestamp)
             )
-            await d.commit()
 
     async def get_pending_sync(self) -> list:
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.reader() as d:
             async with d.execute(
                 "SELECT id,question_id,quality,timestamp FROM sync_queue WHERE synced=0"
             ) as c:
                 return [{"sync_id":r[0],"question_id":r[1],"quality":r[2],"timestamp":r[3]}
                         for r in await c.fetchall()]
 
+    async def apply_reviews(self, items: List[dict],
+                            replay: Callable[[Question, list], List[Tuple[ReviewEvent, dict]]]
+                            ) -> List[dict]:
+        """
+        يعيد تشغيل مراجعات الطابور دون اتصال في معاملة واحدة.
+        items: {question_id, quality, timestamp?, client_key?}
+        replay(q, [(timestamp, quality), ...]) يطبّق مراجعات كل بطاقة بترتيبها الزمني
+        ويعيد لكل مراجعة حدثها (يُلحق بـ review_events) وحالة البطاقة بعدها (نتيجة ذلك العنصر).
+        client_key يُسجَّل في sync_queue فلا تُطبَّق المراجعة مرتين عند إعادة الإرسال.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        results: List[dict] = [
+            {"client_key": it.get("client_key"), "question_id": it.get("question_id"), "status": "pending"}
+            for it in items
+        ]
+        async with self.pool.writer() as d:
+            keys = [it["client_key"] for it in items if it.get("client_key")]
+            seen = set()
+            for part in _chunks(keys):
+                async with d.execute(
+                    f"SELECT client_key FROM sync_queue WHERE client_key IN ({','.join('?'*len(part))})",
+                    part
+                ) as c:
+                    seen.update(r[0] for r in await c.fetchall())
+            qids = list({it["question_id"] for it in items})
+            cards: dict = {}
+            for part in _chunks(qids):
+                async with d.execute(
+                    f"SELECT * FROM questions WHERE id IN ({','.join('?'*len(part))})", part
+                ) as c:
+                    cards.update((r[0], _row(r)) for r in await c.fetchall())
+
+            events: dict = {}
+            log = []
+            for it, res in zip(items, results):
+                key = it.get("client_key")
+                if key and key in seen:
+                    res["status"] = "duplicate"
+                    continue
+                if it["question_id"] not in cards:
+                    res["status"] = "missing"
+                    continue
+                if key:
+                    seen.add(key)
+                ts = it.get("timestamp") or now
+                events.setdefault(it["question_id"], []).append((ts, it["quality"], res))
+                log.append((it["question_id"], it["quality"], ts, key))
+                res["status"] = "applied"
+
+            history: List[ReviewEvent] = []
+            for qid, evs in events.items():
+                for (_, _, res), (ev, state) in zip(evs, replay(cards[qid], [e[:2] for e in evs])):
+                    history.append(ev)
+                    if state is None:
+                        res["status"] = "stale"     # أقدم من آخر مراجعة مطبّقة: سُجّلت في التاريخ فقط
+                    else:
+                        res.update(state)
+            touched = [cards[qid] for qid in events]
+
+            await d.executemany(_REVIEW_UPDATE_SQL, [_review_params(q) for q in touched])
+            await d.executemany(_EVENT_INSERT_SQL, [_event_params(e) for e in history])
+            await d.executemany(
+                "INSERT INTO sync_queue (question_id,quality,timestamp,synced,client_key) VALUES (?,?,?,1,?)",
+                log
+            )
+        return results
+
+    async def get_streak(self) -> int:
+        """أيام متتالية تنتهي اليوم — من active_days بالترتيب التنازلي حتى أول فجوة (O(السلسلة))."""
+        expect, streak = _day_start(datetime.now(timezone.utc).date()), 0
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT day FROM active_days WHERE day<=? ORDER BY day DESC", (expect,)) as c:
+                async for (day,) in c:
+                    if day != expect:
+                        break
+                    streak += 1
+                    expect -= 86400
+        return streak
+
+    async def get_heatmap(self, days: int = 90) -> dict:
+        since = _day_start(datetime.now(timezone.utc).date() - timedelta(days=days - 1))
+        async with self.pool.reader() as d:
+            async with d.execute(
+                "SELECT date(day,'unixepoch'), n FROM active_days WHERE day>=? ORDER BY day", (since,)
+            ) as c:
+                return {r[0]: r[1] for r in await c.fetchall()}
+
+    async def get_analytics_state(self) -> dict:
+        """
+        حالة التحليلات الجارية (تصونها المشغلات مع كل كتابة): عدادات الوسوم والمجاميع العامة.
+        حجمها O(عدد الوسوم) — بديل المرور على البنك كاملاً في كل تقرير.
+        """
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT tag, correct, total FROM tag_stats WHERE total > 0") as c:
+                tags = {r[0]: (r[1], r[2]) for r in await c.fetchall()}
+            async with d.execute(
+                """SELECT COALESCE(SUM(n),0), COALESCE(SUM(total_reviews),0), COALESCE(SUM(correct_sum),0),
+                          COALESCE(SUM(strong),0), COALESCE(SUM(auto_captured),0) FROM question_stats"""
+            ) as c:
+                n, reviews, correct, strong, auto = await c.fetchone()
+        untagged = tags.pop("", (0, 0))
+        return {"tags": tags, "untagged": untagged, "questions": n, "total_reviews": reviews,
+                "correct": correct, "strong": strong, "auto_captured": auto}
+
+    async def data_version(self) -> int:
+        return await self.pool.data_version()
+
+    async def snapshot(self) -> Optional["columns.BankSnapshot"]:
+        """لقطة عمودية للبنك تُعاد كما هي حتى الكتابة التالية؛ None إن لم يتوفر NumPy."""
+        if not columns.available():
+            return None
+        version = await self.data_version()
+        if self._snapshot is not None and self._snapshot[0] == version:
+            return self._snapshot[1]
+        async with self.pool.reader() as d:
+            async with d.execute(
+                """SELECT id, ease_factor, correct_count, total_reviews, wrong_count, interval,
+                          (julianday(next_review) - 2440587.5) * 86400.0, auto_captured
+                   FROM questions ORDER BY id"""
+            ) as c:
+                rows = await c.fetchall()
+            async with d.execute("SELECT question_id, tag FROM question_tags") as c:
+                tags = await c.fetchall()
+        snap = columns.BankSnapshot.from_rows(rows, tags)
+        self._snapshot = (version, snap)
+        return snap
+
+    async def get_changes(self, since: int = 0, limit: int = 500) -> dict:
+        """
+        دلتا نسخة العميل منذ التسلسل since: الأسئلة المتغيرة كاملة + معرّفات المحذوف.
+        reset=True إن كان since أكبر من آخر تسلسل (قاعدة أعيد إنشاؤها) — يبدأ العميل من الصفر.
+        """
+        async with self.pool.reader() as d:
+            async with d.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log") as c:
+                last = (await c.fetchone())[0]
+            if since > last:
+                return {"upserts": [], "deletes": [], "cursor": 0, "more": False, "reset": True}
+            async with d.execute(
+                """SELECT c.seq, c.question_id, c.deleted, q.* FROM change_log c
+                   LEFT JOIN questions q ON q.id = c.question_id
+                   WHERE c.seq > ? ORDER BY c.seq LIMIT ?""", (since, limit)
+            ) as c:
+                rows = await c.fetchall()
+        upserts = [_row(r[3:]) for r in rows if not r[2] and r[3] is not None]
+        deletes = [r[1] for r in rows if r[2]]
+        return {"upserts": upserts, "deletes": deletes, "cursor": rows[-1][0] if rows else since,
+                "more": len(rows) == limit, "reset": False}
+
+    async def get_history(self, qid: int, limit: int = 100) -> List[ReviewEvent]:
+        async with self.pool.reader() as d:
+            async with d.execute(
+                """SELECT question_id,ts,quality,interval_before,interval_after FROM review_events
+                   WHERE question_id=? ORDER BY ts DESC LIMIT ?""", (qid, limit)
+            ) as c:
+                return [ReviewEvent(r[0], datetime.fromtimestamp(r[1], timezone.utc), *r[2:])
+                        for r in await c.fetchall()]
+
     async def mark_synced(self, sync_id: int):
-        async with aiosqlite.connect(self.path) as d:
+        async with self.pool.writer() as d:
             await d.execute("UPDATE sync_queue SET synced=1 WHERE id=?", (sync_id,))
-            await d.commit()
 
 db = Database()
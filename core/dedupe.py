@@ -0,0 +1,201 @@
+"""
+كشف التكرار عند الالتقاط: بصمة محتوى حرفية (core.arabic.text_key) + SimHash مع فهرس LSH للتكرار التقريبي.
+النص يُوحَّد أولاً (تشكيل، همزات، تطويل، أحرف الخيارات، ✅ والترقيم) ثم يُقارن.
+"""
+import hashlib, re
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from core.arabic import normalize_arabic, text_key
+
+SIMHASH_BITS = 64
+BANDS        = 6                      # 6 حزم (11/11/11/11/10/10 بت): مسافة هامينغ ≤ 5 تضمن تطابق حزمة على الأقل
+MAX_DISTANCE = BANDS - 1
+MIN_TOKENS   = 6                      # النصوص الأقصر لا تُقارن تقريبياً (SimHash غير موثوق عليها)
+
+_LABEL_RE = re.compile(r"^\s*(?:[أ-يa-zA-Z]|\d{1,2})\s*[\)\-\.–—:]\s*", re.UNICODE)
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_DIGIT_RE = re.compile(r"\d")
+_PRIORITY_RANK = {"low": 0, "normal": 1, "urgent": 2}
+
+
+def tokens(text: str, options: Iterable[str] = ()) -> List[str]:
+    """كلمات النص الموحَّد: السطور + الخيارات غير المكررة بعد حذف أحرف الترقيم (أ) ب) …)."""
+    lines, seen = [], set()
+    for line in [*(text or "").splitlines(), *(options or ())]:
+        line = _LABEL_RE.sub("", line).replace("✅", "").strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return _TOKEN_RE.findall(normalize_arabic("\n".join(lines)))
+
+
+# جمع البتات بالتوازي: كل بت من البصمة يُنشر في خانة عرضها 16 بت داخل عدد كبير واحد، فيصبح
+# عدّ الواحدات في كل عمود جمعاً عادياً لأعداد صحيحة (8 جداول بحث لكل بصمة بدل 64 عملية بت)
+_LANE   = 16
+_SPREAD = [[sum(1 << (_LANE * (63 - 8 * i - (7 - k))) for k in range(8) if b >> k & 1) for b in range(256)]
+           for i in range(8)]
+
+
+def simhash(toks: List[str]) -> int:
+    """SimHash على الكلمات والأزواج المتجاورة (blake2b بطول 64 بت لكل سمة)."""
+    feats = set(toks) | {f"{a} {b}" for a, b in zip(toks, toks[1:])}
+    acc = 0
+    for f in feats:
+        d = hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest()
+        acc += (_SPREAD[0][d[0]] | _SPREAD[1][d[1]] | _SPREAD[2][d[2]] | _SPREAD[3][d[3]]
+                | _SPREAD[4][d[4]] | _SPREAD[5][d[5]] | _SPREAD[6][d[6]] | _SPREAD[7][d[7]])
+    half, mask, out = len(feats) / 2, (1 << _LANE) - 1, 0
+    for i in range(SIMHASH_BITS - 1, -1, -1):
+        out = (out << 1) | (((acc >> (_LANE * i)) & mask) > half)
+    return out
+
+
+def _numbers(toks: List[str]) -> str:
+    """
+    الأرقام بترتيبها: أسئلة القوالب ("ما ناتج 3 + 4؟" / "ما ناتج 5 + 6؟") تختلف في بت أو اثنين فقط،
+    فيجب أن تتطابق أرقامها أيضاً كي تُعدّ تكراراً، وتدخل في مفتاح الحزمة فلا تتكدس في دلو واحد.
+    """
+    return " ".join(t for t in toks if _DIGIT_RE.search(t))
+
+
+_BAND_SPANS = [(sum(SIMHASH_BITS // BANDS + (j < SIMHASH_BITS % BANDS) for j in range(i)),
+                (1 << (SIMHASH_BITS // BANDS + (i < SIMHASH_BITS % BANDS))) - 1) for i in range(BANDS)]
+
+
+def _bands(h: int, nums: str) -> List[Tuple[int, int, str]]:
+    return [(i, (h >> shift) & mask, nums) for i, (shift, mask) in enumerate(_BAND_SPANS)]
+
+
+class _Entry(NamedTuple):
+    source:  Tuple[str, Tuple[str, ...]]  # (النص, الخيارات) كما أُضيفت — لتجاوز إعادة الحساب إن لم تتغير
+    key:     str
+    simhash: Optional[int]
+    nums:    str
+
+
+class DedupeIndex:
+    """فهرس في الذاكرة: text_key → ids، وحزم SimHash → ids للمرشحين التقريبيين."""
+
+    def __init__(self):
+        self._exact: Dict[str, Set[Hashable]] = {}
+        self._lsh:   Dict[Tuple[int, int, str], Set[Hashable]] = {}
+        self._items: Dict[Hashable, _Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._items
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _fingerprint(text: str, options: Iterable[str]):
+        toks = tokens(text, options)
+        sh   = simhash(toks) if len(toks) >= MIN_TOKENS else None
+        return text_key(" ".join(toks)), sh, _numbers(toks)
+
+    def add(self, item_id: Hashable, text: str, options: Iterable[str] = ()):
+        source = (text or "", tuple(options or ()))
+        old = self._items.get(item_id)
+        if old is not None and old.source == source:
+            return                          # تحديث مراجعة أو وسم لا يغيّر النص
+        self.remove(item_id)
+        entry = _Entry(source, *self._fingerprint(*source))
+        self._items[item_id] = entry
+        self._exact.setdefault(entry.key, set()).add(item_id)
+        if entry.simhash is not None:
+            for b in _bands(entry.simhash, entry.nums):
+                self._lsh.setdefault(b, set()).add(item_id)
+
+    def remove(self, item_id: Hashable):
+        entry = self._items.pop(item_id, None)
+        if entry is None:
+            return
+        ids = self._exact.get(entry.key)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del self._exact[entry.key]
+        if entry.simhash is not None:
+            for b in _bands(entry.simhash, entry.nums):
+                ids = self._lsh.get(b)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del self._lsh[b]
+
+    def _near(self, sh: int, nums: str, skip: Hashable = None) -> List[Tuple[int, Hashable]]:
+        out = {}
+        for b in _bands(sh, nums):
+            for cand in self._lsh.get(b, ()):
+                if cand != skip and cand not in out:
+                    d = (sh ^ self._items[cand].simhash).bit_count()
+                    if d <= MAX_DISTANCE:
+                        out[cand] = d
+        return sorted((d, c) for c, d in out.items())
+
+    def find(self, text: str, options: Iterable[str] = ()) -> Optional[Tuple[Hashable, str]]:
+        """(id, 'exact'|'near') لأقرب سؤال مخزّن، أو None."""
+        key, sh, nums = self._fingerprint(text, options)
+        ids = self._exact.get(key)
+        if ids:
+            return min(ids), "exact"
+        if sh is not None:
+            near = self._near(sh, nums)
+            if near:
+                return near[0][1], "near"
+        return None
+
+    def clusters(self) -> List[List[Hashable]]:
+        """مجموعات التكرار الموجودة (union-find على التطابق الحرفي والتقريبي)، كل مجموعة مرتبة تصاعدياً."""
+        parent = {i: i for i in self._items}
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(a, b):
+            ra, rb = root(a), root(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        for ids in self._exact.values():
+            first = min(ids)
+            for i in ids:
+                union(i, first)
+        for i, e in self._items.items():
+            if e.simhash is not None:
+                for _, cand in self._near(e.simhash, e.nums, skip=i):
+                    union(i, cand)
+        groups: Dict[Hashable, List[Hashable]] = {}
+        for i in self._items:
+            groups.setdefault(root(i), []).append(i)
+        return [sorted(g) for g in groups.values() if len(g) > 1]
+
+
+def merge_card(dst, src) -> None:
+    """
+    يدمج بطاقة مكررة في الأصل: أعلى أولوية، اتحاد الوسوم، سدّ الحقول الناقصة وجمع عدّادات المراجعة.
+    حالة SM-2 للأصل (الفاصل والاستحقاق) تبقى كما هي.
+    يعمل على أي كائن بهذه الخصائص (dataclass النواة أو نموذج ORM في البوت).
+    """
+    if _PRIORITY_RANK.get(src.priority, 1) > _PRIORITY_RANK.get(dst.priority, 1):
+        dst.priority = src.priority
+    dst.tags = list(dict.fromkeys([*(dst.tags or []), *(src.tags or [])]))
+    if not dst.options and src.options:
+        dst.options, dst.correct_index = list(src.options), src.correct_index
+    elif (dst.correct_index is None or dst.correct_index < 0) and (src.correct_index is not None
+                                                                   and src.correct_index >= 0):
+        dst.correct_index = src.correct_index
+    if not dst.explanation and src.explanation:
+        dst.explanation = src.explanation
+    for f in ("total_reviews", "correct_count", "wrong_count"):
+        if hasattr(dst, f) and hasattr(src, f):
+            setattr(dst, f, (getattr(dst, f) or 0) + (getattr(src, f) or 0))
@@ -0,0 +1,135 @@
+import io, json, zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_CHUNK = 500
+
+# الصيغة → (نوع المحتوى, امتداد الملف)
+FORMATS: Dict[str, tuple] = {
+    "ndjson":  ("application/x-ndjson",           ".ndjson"),
+    "gzip":    ("application/gzip",               ".ndjson.gz"),
+    "zstd":    ("application/zstd",               ".ndjson.zst"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# أنواع أعمدة Parquet المعروفة؛ غير المذكور يُكتب نصاً
+_ARROW_TYPES = {
+    "id": "int64", "correct_index": "int64", "repetitions": "int64",
+    "total_reviews": "int64", "correct_count": "int64", "wrong_count": "int64", "streak": "int64",
+    "ease_factor": "float64", "interval": "float64",
+    "auto_captured": "bool", "options": "list", "tags": "list",
+}
+
+
+def available_formats() -> List[str]:
+    return [f for f in FORMATS
+            if not (f == "zstd" and zstandard is None) and not (f == "parquet" and pa is None)]
+
+
+def _plain(row: dict) -> dict:
+    return {k: v.isoformat() if isinstance(v, (datetime, date)) else v for k, v in row.items()}
+
+
+async def stream(pages: AsyncIterator[List[dict]], fmt: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    يحوّل صفحات الصفوف إلى بايتات بالصيغة المطلوبة صفحةً بصفحة.
+    الذاكرة ثابتة: لا يُحتفظ إلا بالصفحة الحالية وما ينتجه الضاغط منها.
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"صيغة غير مدعومة: {fmt}")
+    if fmt == "parquet":
+        async for chunk in _parquet(pages):
+            yield chunk
+        return
+
+    if fmt == "gzip":
+        comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif fmt == "zstd":
+        comp = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        comp = None
+    async for page in pages:
+        data = "".join(json.dumps(_plain(r), ensure_ascii=False) + "\n" for r in page).encode("utf-8")
+        out  = comp.compress(data) if comp else data
+        if out:
+            yield out
+    if comp:
+        tail = comp.flush()
+        if tail:
+            yield tail
+
+
+class _Drain(io.RawIOBase):
+    """ملف وهمي يجمع ما يكتبه ParquetWriter ليُفرَّغ بعد كل row group."""
+
+    def __init__(self):
+        self._buf, self._pos = bytearray(), 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        out, self._buf = bytes(self._buf), bytearray()
+        return out
+
+
+def _arrow_schema(columns: Iterable[str]):
+    def typ(name):
+        t = _ARROW_TYPES.get(name, "string")
+        return pa.list_(pa.string()) if t == "list" else pa.type_for_alias(t)
+    return pa.schema([(c, typ(c)) for c in columns])
+
+
+def _arrow_row(row: dict, schema) -> dict:
+    out = {}
+    for f in schema:
+        v = row.get(f.name)
+        if v is not None and pa.types.is_string(f.type) and not isinstance(v, str):
+            v = json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else str(v)
+        elif v is not None and pa.types.is_list(f.type):
+            v = [str(x) for x in v]
+        out[f.name] = v
+    return out
+
+
+async def _parquet(pages: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    sink, writer, schema = _Drain(), None, None
+    async for page in pages:
+        if not page:
+            continue
+        page = [_plain(r) for r in page]
+        if writer is None:
+            schema = _arrow_schema(page[0].keys())
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pylist([_arrow_row(r, schema) for r in page], schema=schema))
+        out = sink.take()
+        if out:
+            yield out
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([("id", pa.int64())]))
+    writer.close()
+    yield sink.take()
+
+
+def filename(fmt: str, stem: Optional[str] = None) -> str:
+    stem = stem or f"quiz_{datetime.now().strftime('%Y%m%d_%H%M')}"
+    return stem + FORMATS[fmt][1]
@@ -0,0 +1,111 @@
+import re
+from core.arabic import normalize_arabic
+
+# الجدول يخزّن نسخة مُطبَّعة من النص؛ rowid = questions.id
+_NORM_OPTIONS = (
+    "arabic_norm(CASE WHEN json_valid({o}) "
+    "THEN (SELECT group_concat(value, ' ') FROM json_each({o})) ELSE {o} END)"
+)
+_FTS_ROW = (
+    "({p}.id, arabic_norm({p}.text), " + _NORM_OPTIONS + ", arabic_norm({p}.explanation))"
+)
+
+FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts
+       USING fts5(text, options, explanation, tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN
+         INSERT INTO questions_fts (rowid, text, options, explanation)
+         VALUES """ + _FTS_ROW.format(p="new", o="new.options") + """;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN
+         DELETE FROM questions_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_au
+       AFTER UPDATE OF text, options, explanation ON questions BEGIN
+         DELETE FROM questions_fts WHERE rowid = old.id;
+         INSERT INTO questions_fts (rowid, text, options, explanation)
+         VALUES """ + _FTS_ROW.format(p="new", o="new.options") + """;
+       END""",
+]
+
+FTS_BACKFILL = (
+    "INSERT INTO questions_fts (rowid, text, options, explanation) "
+    "SELECT q.id, arabic_norm(q.text), " + _NORM_OPTIONS.format(o="q.options") +
+    ", arabic_norm(q.explanation) FROM questions q"
+)
+
+# أوزان bm25 لكل عمود: نص السؤال أهم من الخيارات ثم الشرح
+FTS_RANK    = "bm25(questions_fts, 10.0, 4.0, 1.0)"
+SNIPPET_CHARS = 90
+
+_TOKEN_RE   = re.compile(r"\w+", re.UNICODE)
+_ARTICLE_RE = re.compile(r"^(?:وال|بال|فال|كال|لل|ال)(?=\w{2,})")
+_ARTICLES   = ("ال", "وال", "بال", "فال", "كال", "لل")
+
+
+def register_functions(conn):
+    """يسجّل arabic_norm على اتصال sqlite3 (تحتاجه المُشغِّلات عند كل كتابة)."""
+    conn.create_function("arabic_norm", 1, normalize_arabic, deterministic=True)
+
+
+def _token_query(token: str) -> str:
+    base = _ARTICLE_RE.sub("", token)
+    if not re.match(r"[\u0600-\u06FF]", base):
+        return f'"{base}"*'
+    forms = [base] + [a + base for a in _ARTICLES]
+    return "(" + " OR ".join(f'"{f}"*' for f in forms) + ")"
+
+
+def _terms(term: str):
+    return [_ARTICLE_RE.sub("", t) for t in _TOKEN_RE.findall(normalize_arabic(term))]
+
+
+def fts_query(term: str) -> str:
+    """يحوّل عبارة المستخدم إلى استعلام MATCH: كل كلمة مُطبَّعة كبادئة مع/بدون أداة التعريف، والكلمات مجتمعة (AND)."""
+    return " AND ".join(_token_query(t) for t in _TOKEN_RE.findall(normalize_arabic(term)))
+
+
+def _normalized_with_offsets(text: str):
+    """النص المُطبَّع + موضع كل حرف منه في الأصل (التطبيع يحذف التشكيل والتطويل فتتغير المواضع)."""
+    out, offsets = [], []
+    for i, ch in enumerate(text):
+        for n in normalize_arabic(ch):
+            out.append(n)
+            offsets.append(i)
+    return "".join(out), offsets
+
+
+def highlight(text: str, term: str, width: int = SNIPPET_CHARS) -> str:
+    """
+    مقتطف من النص الأصلي (لا المُطبَّع المخزّن في questions_fts) مع «تمييز» الكلمات المطابقة.
+    المطابقة تتم على النسخة المُطبَّعة ثم تُعاد المواضع إلى الأصل.
+    """
+    text = text or ""
+    norm, offsets = _normalized_with_offsets(text)
+    spans = []
+    for t in _terms(term):
+        arts = "(?:" + "|".join(_ARTICLES) + ")?" if re.match(r"[\u0600-\u06FF]", t) else ""
+        for m in re.finditer(rf"(?<!\w){arts}{re.escape(t)}\w*", norm):
+            end = offsets[m.end()] if m.end() < len(offsets) else len(text)   # يشمل التشكيل اللاحق
+            spans.append((offsets[m.start()], end))
+    if not spans:
+        return text[:width] + ("…" if len(text) > width else "")
+    spans.sort()
+    merged = [spans[0]]
+    for a, b in spans[1:]:
+        if a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    start = max(0, merged[0][0] - width // 3)
+    if start:
+        start = text.rfind(" ", 0, start) + 1
+    end = min(len(text), start + width)
+    parts, pos = [], start
+    for a, b in merged:
+        if a >= end:
+            break
+        parts += [text[pos:a], "«", text[a:b], "»"]
+        pos = b
+    parts.append(text[pos:max(end, pos)])
+    return ("…" if start else "") + "".join(parts) + ("…" if max(end, pos) < len(text) else "")
@@ -0,0 +1,293 @@
+import asyncio, codecs, csv, io, json, multiprocessing, os, zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from core.arabic import text_key
+from core.parser import parse_message
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# أخطاء ملف تالف أو مقطوع: توقف القراءة، وما أُدرج قبلها يبقى ويُعاد في الإحصاءات
+STREAM_ERRORS = (ValueError, UnicodeError, EOFError, zlib.error, csv.Error) + \
+                ((zstandard.ZstdError,) if zstandard is not None else ())
+
+IMPORT_BATCH   = 5000
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+POOL_THRESHOLD = 1000           # أقل من هذا يُحلَّل في نفس العملية (تكلفة التوزيع أكبر من الفائدة)
+PRIORITIES     = {"urgent", "normal", "low"}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# ── فك الضغط وفك الترميز تدريجياً ─────────────────────────
+async def _decoded(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decomp, decoder = None, codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if decomp is None:
+            if chunk.startswith(_GZIP_MAGIC):
+                decomp = zlib.decompressobj(47)
+            elif chunk.startswith(_ZSTD_MAGIC):
+                if zstandard is None:
+                    raise ValueError("ملف zstd يتطلب الحزمة zstandard")
+                decomp = zstandard.ZstdDecompressor().decompressobj()
+            else:
+                decomp = False
+        text = decoder.decode(decomp.decompress(chunk) if decomp else chunk)
+        if text:
+            yield text
+    if decomp and not decomp.eof:
+        raise ValueError("الملف المضغوط مقطوع")
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _lines(texts: AsyncIterator[str]) -> AsyncIterator[str]:
+    buf = ""
+    async for t in texts:
+        buf += t
+        *done, buf = buf.split("\n")
+        for line in done:
+            yield line
+    if buf:
+        yield buf
+
+
+# ── المحللات المتدفقة ─────────────────────────────────────
+async def _json_array(texts: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """مصفوفة JSON كبيرة تُقرأ عنصراً عنصراً عبر raw_decode دون تحميل الملف كاملاً."""
+    dec, buf, pos, opened = json.JSONDecoder(), "", 0, False
+    async for t in texts:
+        buf = buf[pos:] + t
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not opened:
+                if buf[pos] != "[":
+                    raise ValueError("ملف JSON يجب أن يكون مصفوفة")
+                opened, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break                       # العنصر لم يكتمل بعد — ننتظر الجزء التالي
+            pos = end
+            yield obj
+    if buf[pos:].strip(" \t\r\n,]"):
+        raise ValueError("ملف JSON غير مكتمل")
+
+
+async def _ndjson(texts: AsyncIterator[str]) -> AsyncIterator[Optional[dict]]:
+    """السطر التالف يُعاد None (يُعدّ غير صالح) ولا يوقف بقية الملف."""
+    async for line in _lines(texts):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+async def _csv(texts: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """CSV بعناوين أعمدة؛ السجل متعدد الأسطر يكتمل حين يصبح عدد علامات الاقتباس زوجياً."""
+    header, pending = None, ""
+    async for line in _lines(texts):
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        try:
+            row = next(csv.reader(io.StringIO(pending)), [])
+        except csv.Error:
+            row = None
+        pending = ""
+        if row is None:
+            yield None
+            continue
+        if not row:
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in row]
+            continue
+        yield dict(zip(header, row))
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: Optional[str] = None) -> AsyncIterator[Optional[dict]]:
+    """
+    يحلل ملفاً مرفوعاً (JSON / NDJSON / CSV، مضغوطاً أو لا) سجلاً سجلاً.
+    fmt=None: تُستنتج الصيغة من أول حرف غير فارغ ('[' ← JSON، '{' ← NDJSON، غير ذلك ← CSV).
+    السجل الذي لا يُقرأ قاموساً يُعاد None ليُعدّ غير صالح.
+    """
+    texts = _decoded(chunks)
+    head  = ""
+    async for t in texts:
+        head += t
+        if head.strip():
+            break
+
+    async def replay():
+        yield head
+        async for t in texts:
+            yield t
+
+    fmt = fmt or {"[": "json", "{": "ndjson"}.get(head.lstrip()[:1], "csv")
+    parser = {"json": _json_array, "ndjson": _ndjson, "csv": _csv}.get(fmt)
+    if parser is None:
+        raise ValueError(f"صيغة غير مدعومة: {fmt}")
+    async for rec in parser(replay()):
+        yield rec if isinstance(rec, dict) else None
+
+
+# ── توحيد السجلات ─────────────────────────────────────────
+def _as_list(v, sep: str) -> List[str]:
+    if v is None or v == "":
+        return []
+    if isinstance(v, str):
+        v = v.strip()
+        if v.startswith("["):
+            try:
+                v = json.loads(v)
+            except ValueError:
+                pass
+        if isinstance(v, str):
+            v = v.split(sep)
+    return [str(x).strip() for x in v if str(x).strip()]
+
+
+def _as_int(v, default: int) -> int:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_bool(v) -> bool:
+    return v.strip().lower() in {"1", "true", "yes"} if isinstance(v, str) else bool(v)
+
+
+def normalize_record(rec: Optional[dict]) -> Optional[dict]:
+    """سجل خام ← حقول السؤال، أو None إن كان غير صالح. بلا خيارات: يُعلَّم للتحليل بـ parse_message."""
+    if not isinstance(rec, dict):
+        return None
+    text = str(rec.get("text") or rec.get("question") or "").strip()
+    if not text:
+        return None
+    try:
+        options = _as_list(rec.get("options"), "|")
+        tags    = _as_list(rec.get("tags"), ",")
+    except TypeError:
+        return None
+    prio    = str(rec.get("priority") or "normal").strip()
+    return {
+        "text": text, "options": options,
+        "correct_index": _as_int(rec.get("correct_index"), -1),
+        "explanation": (str(rec.get("explanation")).strip() or None) if rec.get("explanation") else None,
+        "tags": tags,
+        "priority": prio if prio in PRIORITIES else "normal",
+        "source_channel": str(rec.get("source_channel") or ""),
+        "auto_captured": _as_bool(rec.get("auto_captured")),
+        "_parse": not options,
+    }
+
+
+def parse_texts(texts: List[str]) -> List[tuple]:
+    """تعمل داخل عمليات العمال — دالة على مستوى الوحدة لتكون قابلة للـ pickle."""
+    return [parse_message(t) for t in texts]
+
+
+async def _parse_batch(rows: List[dict], pool: Optional[ProcessPoolExecutor]):
+    todo = [r for r in rows if r.pop("_parse")]
+    if not todo:
+        return
+    texts = [r["text"] for r in todo]
+    if pool is None or len(texts) < POOL_THRESHOLD:
+        parsed = parse_texts(texts)
+    else:
+        loop  = asyncio.get_running_loop()
+        step  = -(-len(texts) // IMPORT_WORKERS)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, parse_texts, texts[i:i + step]) for i in range(0, len(texts), step)
+        ))
+        parsed = [p for part in parts for p in part]
+    for r, (q_text, opts, cidx, expl) in zip(todo, parsed):
+        r["text"], r["options"] = q_text or r["text"], opts
+        if r["correct_index"] < 0:
+            r["correct_index"] = cidx
+        r["explanation"] = r["explanation"] or expl
+
+
+def _pool() -> Optional[ProcessPoolExecutor]:
+    # forkserver/spawn: fork من عملية فيها خيوط (aiosqlite، خيوط البوت) قد يرث أقفالاً محجوزة فيتجمد العامل
+    if IMPORT_WORKERS <= 1:
+        return None
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(IMPORT_WORKERS, mp_context=multiprocessing.get_context(method))
+
+
+async def run_import(records: AsyncIterator[Optional[dict]], existing: Iterable[str],
+                     insert: Callable[[List[dict]], Awaitable[object]],
+                     batch: int = IMPORT_BATCH) -> Dict[str, object]:
+    """
+    يجمع السجلات في دفعات ← تحليل متوازٍ ← إسقاط المكرر (مقابل البنك وداخل الملف) ← insert(دفعة).
+    insert يستقبل قائمة قواميس ويكتبها في معاملة واحدة.
+    السجل التالف يُعدّ invalid ويُتابع الاستيراد؛ الملف التالف (ضغط مقطوع، JSON ناقص) يوقف القراءة
+    فتُكتب السجلات السليمة المقروءة قبله ويُعاد سبب التوقف في stats["error"] مع الأعداد الجزئية.
+    """
+    seen  = {text_key(t) for t in existing}
+    stats = {"read": 0, "added": 0, "duplicates": 0, "invalid": 0, "error": None}
+    pool  = _pool()
+
+    async def flush(rows: List[dict]):
+        await _parse_batch(rows, pool)
+        fresh = []
+        for r in rows:
+            k = text_key(r["text"])
+            if k in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(k)
+            fresh.append(r)
+        if fresh:
+            await insert(fresh)
+            stats["added"] += len(fresh)
+
+    try:
+        rows: List[dict] = []
+        try:
+            async for rec in records:
+                stats["read"] += 1
+                row = normalize_record(rec)
+                if row is None:
+                    stats["invalid"] += 1
+                    continue
+                rows.append(row)
+                if len(rows) >= batch:
+                    await flush(rows)
+                    rows = []
+        except STREAM_ERRORS as e:
+            stats["error"] = str(e) or type(e).__name__
+        if rows:
+            await flush(rows)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return stats
+
+
+async def file_chunks(path: str, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
@@ -28,4 +28,11 @@ class Question:
     wrong_count: int = 0
     streak: int = 0
     created_at: str = field(default_factory=_now)
-    review_dates: List[str] = field(default_factory=list)
+
+@dataclass
+class ReviewEvent:
+    question_id: int
+    ts: datetime
+    quality: Optional[int] = None
+    interval_before: Optional[float] = None
+    interval_after: Optional[float] = None
@@ -0,0 +1,155 @@
+"""
+محلل نصوص الأسئلة: تنظيف المؤقتات واستخراج (السؤال, الخيارات, الإجابة, الشرح).
+مشترك بين البوت والاستيراد الجماعي (يُستدعى داخل عمليات منفصلة، فيجب أن يبقى بلا حالة).
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_ARABIC_LABELS = {
+    "أ": 0, "ا": 0, "ب": 1, "ج": 2, "د": 3,
+    "ه": 4, "هـ": 4, "و": 5, "ز": 6, "ح": 7,
+}
+_OPTION_RE   = re.compile(r"^(?P<label>[أ-يa-zA-Z\d])\s*[\)\-\.–—]\s*(?P<body>.+)", re.UNICODE)
+_CORRECT_RE  = re.compile(
+    r"(?:الإجابة\s*الصحيحة|الجواب\s*الصحيح|✅)"
+    r"[^\u0600-\u06FFa-zA-Z\d]*(?P<label>[أ-يa-zA-Z]|\d+)",
+    re.UNICODE,
+)
+_EXPL_START  = re.compile(r"^(?:شرح|توضيح|ملاحظة|تنبيه|📝|💡|🔍|لأن|السبب|وبالتالي|إذن)", re.UNICODE)
+_EXPL_INLINE = re.compile(r"(?:لأن|حيث|بمعنى|يعني|أي أن|وهو|نلاحظ|وبالتالي|لذلك)", re.UNICODE)
+_TIMER_KW    = re.compile(r"ثانية|ثوان|الوقت المتبقي|time left|sec")   # يُطابق على النص بأحرف صغيرة
+_TIMER_MARK  = re.compile(r"[⏳⌛⏱⏰]|^[0-9]{1,2}[:\.][0-9]{1,2}$")     # رمز مؤقت أو سطر عدّاد (00:15)
+_NO_SEP_RE   = re.compile(r"^(?P<label>[أ-دa-dA-D])\s+(?P<body>\S.+)", re.UNICODE)
+_CHECK_TAIL  = re.compile(r"\s*✅.*$")
+_LABEL_SCAN  = (re.compile(r"[أ-ي]"), re.compile(r"[a-zA-Z]"), re.compile(r"\d+"))
+_LABEL_HEAD  = re.compile(r"^[أ-يa-zA-Z\d]\s*[\)\-\.–—]\s*")
+LABELS       = ["أ", "ب", "ج", "د", "هـ", "و"]
+MAX_OPTIONS  = 6                     # أزرار الخيارات في لوحة السؤال
+
+# أصناف السطر في المرور الواحد
+_BLANK, _TEXT, _OPT, _NO_SEP = range(4)
+
+
+def _label_to_index(label: str, labels: List[str]) -> int:
+    """تحويل حرف/رقم → index — يبحث في أحرف الخيارات المرصودة أولاً ثم الخريطة."""
+    if label in labels:
+        return labels.index(label)
+    if label in _ARABIC_LABELS:
+        return _ARABIC_LABELS[label]
+    if label.isdigit():
+        return int(label) - 1
+    if label.isascii() and label.isalpha():
+        return ord(label.lower()) - ord("a")
+    return -1
+
+
+def _is_timer(s: str) -> bool:
+    return bool(_TIMER_MARK.search(s) or (len(s) <= 30 and _TIMER_KW.search(s.lower())))
+
+
+def clean_text(raw: str) -> str:
+    """إزالة المؤقتات والضجيج من النص."""
+    return "\n".join(line for line in raw.splitlines() if not (line.strip() and _is_timer(line.strip())))
+
+
+def _parse(lines: List[str], clean: bool) -> Tuple[str, List[str], int, Optional[str]]:
+    # ── المرور الوحيد على النص: تصنيف كل سطر بالأنماط المترجمة مسبقاً ─────────
+    rows: List[tuple]  = []          # (صنف, النص المقصوص, تسمية الإجابة الصحيحة أو None, فيه ✅)
+    options: List[str] = []
+    labels:  List[str] = []
+    no_sep:  List[str] = []          # fallback "أ النص" — لا يُستخدم إلا إن لم يوجد أي خيار بفاصل
+    correct_row = correct_index = -1 # آخر خيار يحمل ✅ إن وُجد
+    for line in lines:
+        s = line.strip()
+        if not s:
+            rows.append((_BLANK, s, None, False))
+            continue
+        if clean and (_TIMER_MARK.search(s) or (len(s) <= 30 and _TIMER_KW.search(s.lower()))):
+            continue                 # _is_timer مضمّنة: الاستدعاء نفسه أغلى من الفحص
+        check = "✅" in s
+        m = _OPTION_RE.match(s)
+        if m:
+            labels.append(m.group("label"))
+            if check:
+                correct_row, correct_index = len(rows), len(options)
+                options.append(_CHECK_TAIL.sub("", s).strip())
+            else:
+                options.append(s)
+            rows.append((_OPT, s, None, check))
+            continue
+        cm = _CORRECT_RE.search(s) if check or "الصحيح" in s else None
+        if _NO_SEP_RE.match(s):
+            no_sep.append(s)
+            rows.append((_NO_SEP, s, cm and cm.group("label"), check))
+        else:
+            rows.append((_TEXT, s, cm and cm.group("label"), check))
+
+    # ── حسم الخيارات والإجابة من السجلات (بلا إعادة مطابقة للنص) ─────────────
+    if options:
+        opt_kind = _OPT
+    else:
+        opt_kind, options = _NO_SEP, no_sep
+    if correct_row < 0:
+        by_label = next((i for i, r in enumerate(rows) if r[0] != opt_kind and r[2] is not None), -1)
+        if by_label >= 0:
+            correct_row, correct_index = by_label, _label_to_index(rows[by_label][2], labels)
+        else:
+            correct_row = next((i for i, r in enumerate(rows) if r[0] != opt_kind and r[3]), -1)
+            if correct_row >= 0:
+                for pat in _LABEL_SCAN:
+                    lm = pat.search(rows[correct_row][1])
+                    if lm:
+                        correct_index = _label_to_index(lm.group(), labels)
+                        break
+
+    # ── آلة حالات الشرح: سؤال ← شرح (حتى أول سطر فارغ) ← سؤال ─────────────────
+    q_lines, expl_parts, state = [], [], 0      # 0 قبل الشرح، 1 داخله، 2 بعده
+    for i, (kind, s, _, _) in enumerate(rows):
+        if kind == opt_kind or i == correct_row:
+            continue
+        if kind == _BLANK:
+            if state == 1:
+                state = 2
+            continue
+        if state == 1 or (state == 0 and (_EXPL_START.match(s) or _EXPL_INLINE.search(s))):
+            state = 1
+            expl_parts.append(s)
+        else:
+            q_lines.append(s)
+    explanation = "\n".join(expl_parts).strip() or None
+    return "\n".join(q_lines).strip(), options, correct_index, explanation
+
+
+def extract_options(text: str) -> Tuple[str, List[str], int, Optional[str]]:
+    """
+    يستخرج: (نص_السؤال, خيارات, index_الإجابة, شرح)
+
+    يدعم:
+    • أحرف عربية/لاتينية/أرقام مع ) - . – —
+    • ✅ داخل سطر الخيار أو في سطر منفصل
+    • شرح متعدد الأسطر
+    • fallback للخيارات بدون فاصل (أ النص)
+
+    مرور واحد يصنّف الأسطر بأنماط مترجمة مسبقاً، ثم حسم الإجابة والشرح من سجلات التصنيف.
+    """
+    return _parse(text.splitlines(), clean=False)
+
+
+def parse_message(raw: str) -> Tuple[str, List[str], int, Optional[str]]:
+    """clean_text + extract_options في المرور نفسه: أسطر المؤقتات تُسقط أثناء التصنيف."""
+    return _parse(raw.splitlines(), clean=True)
+
+
+def question_layout(text: str, options: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    بنية العرض المحللة مرة واحدة عند الإدخال: {"stem", "labels", "bodies"}.
+    الخيارات المضمّنة في النص تتقدم على عمود الخيارات، والتسميات موحّدة (أ، ب، …) بغض النظر عن المصدر.
+    الإجابة الصحيحة والشرح لهما أعمدتهما (correct_index / explanation) فلا يُكرران هنا.
+    """
+    stem, opts, _, _ = extract_options(text or "")
+    bodies = [_LABEL_HEAD.sub("", o).strip() or o for o in (opts or list(options or ()))[:MAX_OPTIONS]]
+    return {
+        "stem":   stem or text or "",
+        "labels": [LABELS[i] if i < len(LABELS) else str(i + 1) for i in range(len(bodies))],
+        "bodies": bodies,
+    }
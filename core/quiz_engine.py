@@ -1,16 +1,31 @@
 import random
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
-from core.models import Question
+from typing import Iterable, Optional, List, Tuple, Union
+from core.models import Question, ReviewEvent
 
 def _now() -> datetime:
     return datetime.now(timezone.utc)
 
+
+def parse_timestamp(ts: Union[str, datetime, None], default: Optional[datetime] = None) -> datetime:
+    """ISO (مع Z أو بدونها) → datetime بتوقيت UTC؛ القيم الفاسدة أو المستقبلية تُستبدل بالآن."""
+    now = default or _now()
+    if ts is None:
+        return now
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return now
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return min(ts.astimezone(timezone.utc), now)
+
 class SM2Engine:
     MIN_EASE = 1.3
 
     @staticmethod
-    def review(q: Question, quality: int) -> Question:
+    def review(q: Question, quality: int, at: Optional[datetime] = None) -> Question:
         if quality < 3:
             q.repetitions = 0
             q.interval = 1
@@ -34,11 +49,10 @@ class SM2Engine:
             q.ease_factor + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
         )
 
-        now = _now()
+        now = at or _now()
         q.next_review = (now + timedelta(days=max(1, q.interval))).isoformat()
         q.last_review = now.isoformat()
         q.total_reviews += 1
-        q.review_dates.append(now.date().isoformat())
 
         if q.wrong_count >= 3:
             q.priority = "urgent"
@@ -48,6 +62,31 @@ class SM2Engine:
             q.priority = "low"
         return q
 
+    @staticmethod
+    def replay(q: Question, events: Iterable[Tuple[Union[str, datetime], int]]
+               ) -> List[Tuple[ReviewEvent, Optional[dict]]]:
+        """
+        يطبّق سلسلة مراجعات تاريخية لبطاقة واحدة بترتيبها الزمني، كلٌّ بوقتها الفعلي.
+        يعيد لكل مدخل (بترتيب الإدخال) حدثه وحالة البطاقة بعده مباشرة.
+        المراجعة الأقدم من last_review لا تُطبَّق (لا يعود الجدول إلى الوراء): تُسجَّل حدثاً
+        بلا فواصل وحالتها None.
+        """
+        now    = _now()
+        last   = parse_timestamp(q.last_review, now) if q.last_review else None
+        parsed = [(parse_timestamp(ts, now), quality) for ts, quality in events]
+        out: list = [None] * len(parsed)
+        for i in sorted(range(len(parsed)), key=lambda i: parsed[i][0]):
+            at, quality = parsed[i]
+            if last is not None and at <= last:
+                out[i] = (ReviewEvent(q.id, at, quality), None)
+                continue
+            last, before = at, q.interval
+            SM2Engine.review(q, quality, at)
+            out[i] = (ReviewEvent(q.id, at, quality, before, q.interval),
+                      {"next_review": q.next_review, "streak": q.streak,
+                       "ease_factor": round(q.ease_factor, 2)})
+        return out
+
     @staticmethod
     def get_quality(answer: str) -> int:
         return {"again": 0, "hard": 3, "good": 4, "easy": 5}.get(answer, 3)
@@ -65,7 +104,7 @@ def get_next_question(questions: List[Question], mode: str = "all",
         items = [q for q in items if q.next_review and q.next_review <= now]
         return items[0] if items else None
     elif mode == "weak":
-        return sorted(items, key=lambda q: (q.ease_factor, -q.wrong_count))[0]
+        return min(items, key=lambda q: (q.ease_factor, -q.wrong_count))
     min_r = min(q.total_reviews for q in items)
     candidates = [q for q in items if q.total_reviews == min_r]
     return random.choice(candidates)
@@ -83,17 +122,4 @@ def get_level_info(total_reviews: int) -> dict:
     return {"level": level, "xp": xp, "badge": badge}
 
 
-def calculate_streak(review_dates: List[str]) -> int:
-    if not review_dates:
-        return 0
-    dates = sorted(set(d[:10] for d in review_dates), reverse=True)
-    today = _now().date()
-    streak = 0
-    for i, d in enumerate(dates):
-        if d == (today - timedelta(days=i)).isoformat():
-            streak += 1
-        else:
-            break
-    return streak
-
 engine = SM2Engine()
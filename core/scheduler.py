@@ -0,0 +1,147 @@
+import heapq, itertools
+from typing import Any, Callable, Collection, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class ModeQueue:
+    """
+    طابور أولوية لوضع مراجعة واحد مع حذف كسول (lazy deletion).
+
+    • _ready : المستحق الآن مرتباً بالمفتاح
+    • _later : غير المستحق بعد مرتباً بالمفتاح (يُستخدم عند نفاد المستحق)
+    • _wake  : غير المستحق مرتباً بموعد الاستحقاق، يُرقّى إلى _ready مع مرور الوقت
+    كل إدخال يحمل رقم نسخة؛ الإدخالات القديمة تُهمل عند ظهورها في القمة.
+    """
+
+    def __init__(self):
+        self._state: Dict[Hashable, List] = {}    # id → [version, promoted, key, due_at]
+        self._ready: List[Tuple] = []
+        self._later: List[Tuple] = []
+        self._wake:  List[Tuple] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._state
+
+    def push(self, item_id: Hashable, key: Any, due_at: Any = None):
+        ver = next(self._seq)
+        self._state[item_id] = [ver, False, key, due_at]
+        heapq.heappush(self._later, (key, ver, item_id))
+        if due_at is not None:
+            heapq.heappush(self._wake, (due_at, ver, item_id))
+        self._maybe_compact()
+
+    def discard(self, item_id: Hashable):
+        self._state.pop(item_id, None)
+
+    def refresh(self, now: Any):
+        while self._wake and self._wake[0][0] <= now:
+            _, ver, item_id = heapq.heappop(self._wake)
+            st = self._state.get(item_id)
+            if st is None or st[0] != ver or st[1]:
+                continue
+            st[1] = True
+            heapq.heappush(self._ready, (st[2], ver, item_id))
+
+    def peek(self, now: Any, exclude: Collection = (), due_only: bool = False) -> Optional[Hashable]:
+        self.refresh(now)
+        top = self._top(self._ready, True, exclude)
+        if top is None and not due_only:
+            top = self._top(self._later, False, exclude)
+        return top
+
+    def _top(self, heap: List[Tuple], promoted: bool, exclude: Collection) -> Optional[Hashable]:
+        held, found = [], None
+        while heap:
+            _, ver, item_id = heap[0]
+            st = self._state.get(item_id)
+            if st is None or st[0] != ver or st[1] != promoted:
+                heapq.heappop(heap)
+                continue
+            if item_id in exclude:
+                held.append(heapq.heappop(heap))
+                continue
+            found = item_id
+            break
+        for entry in held:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _maybe_compact(self):
+        live = len(self._state)
+        if len(self._later) + len(self._ready) + len(self._wake) <= 4 * live + 64:
+            return
+        self._ready, self._later, self._wake = [], [], []
+        for item_id, (ver, promoted, key, due_at) in self._state.items():
+            (self._ready if promoted else self._later).append((key, ver, item_id))
+            if due_at is not None and not promoted:
+                self._wake.append((due_at, ver, item_id))
+        for h in (self._ready, self._later, self._wake):
+            heapq.heapify(h)
+
+
+class Scheduler:
+    """
+    طوابير أولوية لكل وضع (all/due/weak/tag) تُحدَّث تدريجياً عند تغيّر بطاقة.
+    الاختيار O(log n) بدل فرز البنك كاملاً في كل ضغطة.
+
+    key     : مفتاح الترتيب (الأصغر أولاً)
+    due_at  : موعد الاستحقاق أو None
+    weak    : شرط دخول طابور الضعف
+    tags    : وسوم البطاقة
+    """
+
+    def __init__(self, key: Callable, due_at: Callable, weak: Callable,
+                 tags: Callable[[Any], Iterable[str]], id_of: Callable = lambda q: q.id):
+        self._key, self._due_at, self._weak, self._tags, self._id = key, due_at, weak, tags, id_of
+        self._all  = ModeQueue()
+        self._weakq = ModeQueue()
+        self._by_tag: Dict[str, ModeQueue] = {}
+        self._member_tags: Dict[Hashable, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def clear(self):
+        self.__init__(self._key, self._due_at, self._weak, self._tags, self._id)
+
+    def update(self, item):
+        item_id = self._id(item)
+        self.remove(item_id)
+        key, due_at = self._key(item), self._due_at(item)
+        self._all.push(item_id, key, due_at)
+        if self._weak(item):
+            self._weakq.push(item_id, key, due_at)
+        tags = tuple(dict.fromkeys(t for t in (self._tags(item) or ()) if t))
+        for t in tags:
+            self._by_tag.setdefault(t, ModeQueue()).push(item_id, key, due_at)
+        self._member_tags[item_id] = tags
+
+    def remove(self, item_id: Hashable):
+        tags = self._member_tags.pop(item_id, None)
+        if tags is None:
+            return
+        self._all.discard(item_id)
+        self._weakq.discard(item_id)
+        for t in tags:
+            q = self._by_tag.get(t)
+            if q is not None:
+                q.discard(item_id)
+                if not len(q):
+                    del self._by_tag[t]
+
+    def next(self, mode: str, now: Any, tag: Optional[str] = None,
+             exclude: Collection = ()) -> Optional[Hashable]:
+        if mode == "due":
+            return self._all.peek(now, exclude, due_only=True)
+        if mode == "weak":
+            return self._weakq.peek(now, exclude)
+        if mode == "tag" and tag:
+            q = self._by_tag.get(tag)
+            return q.peek(now, exclude) if q else None
+        return self._all.peek(now, exclude)
+
+    def tag_counts(self) -> Dict[str, int]:
+        return {t: len(q) for t, q in self._by_tag.items()}
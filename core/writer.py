@@ -0,0 +1,215 @@
+"""
+كاتب واحد لكل عملية بتثبيت جماعي (group commit).
+كل `async with pool.writer()` نيّة كتابة تُصفّ وتنتظر دورها؛ مهمة الكاتب تخدم النوايا المصفوفة واحدة تلو الأخرى
+داخل معاملة واحدة (SAVEPOINT لكل نيّة: فشل نيّة يتراجع عنها وحدها) ثم تُثبّت الدفعة بـ COMMIT واحد.
+الدفعة تُغلق عند فراغ الطابور بعد GROUP_COMMIT_MS من أولها أو عند GROUP_COMMIT_MAX نيّة — فعدد التثبيتات
+(fsync) في الثانية محدود مهما كثر الكتّاب، ولا يتنافس اتصالان من العملية نفسها على قفل الكتابة.
+الخروج من الكتلة لا يعود قبل تثبيت دفعتها، فدلالة writer() القديمة (مُثبَّت عند الخروج) باقية.
+"""
+import asyncio, logging, os, time
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+
+import aiosqlite
+
+GROUP_COMMIT_MS  = float(os.environ.get("GROUP_COMMIT_MS", "2"))
+GROUP_COMMIT_MAX = int(os.environ.get("GROUP_COMMIT_MAX", "64"))
+DB_MMAP_SIZE     = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_KB      = int(os.environ.get("DB_CACHE_KB", "65536"))
+
+# لكل اتصال بملف القاعدة (المجمّع ومراقب core.changes)؛ busy_timeout أولاً فتبديل WAL ينتظر القفل بدل الفشل
+PRAGMA_SQL = f"""
+PRAGMA busy_timeout=5000;
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size={DB_MMAP_SIZE};
+PRAGMA cache_size=-{DB_CACHE_KB};
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class _Intent:
+    __slots__ = ("raw", "turn", "done", "committed")
+
+    def __init__(self, loop, raw: bool):
+        self.raw       = raw
+        self.turn      = loop.create_future()     # الكاتب يسلّم الاتصال
+        self.done      = loop.create_future()     # النيّة أنهت كتلتها: None أو الاستثناء
+        self.committed = loop.create_future()     # نتيجة تثبيت الدفعة
+
+
+def _finish(it: "_Intent", error: Optional[BaseException] = None):
+    """نهاية كتلة المتصل: الاستثناء قيمةٌ للكاتب لا يُرفع فيه."""
+    if not it.done.done():
+        it.done.set_result(error)
+
+
+def _settle(fut: asyncio.Future, error: Optional[BaseException] = None):
+    if not fut.done():
+        if error is None:
+            fut.set_result(None)
+        else:
+            fut.set_exception(error)
+
+
+class GroupCommitWriter:
+    def __init__(self, conn: aiosqlite.Connection, on_commit: Callable[[], None] = lambda: None,
+                 window_ms: float = GROUP_COMMIT_MS, max_batch: int = GROUP_COMMIT_MAX):
+        self.conn, self.on_commit = conn, on_commit
+        self.window, self.max_batch = window_ms / 1000, max(1, max_batch)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"intents": 0, "failed": 0, "commits": 0, "commit_errors": 0, "batched": 0,
+                      "max_batch": 0, "commit_ms_total": 0.0, "commit_ms_max": 0.0, "commit_ms_last": 0.0}
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        s, n = self.stats, self.stats["commits"] or 1
+        return {"queue_depth": self.depth, "intents": s["intents"], "failed": s["failed"],
+                "commits": s["commits"], "commit_errors": s["commit_errors"],
+                "avg_batch": round(s["batched"] / n, 2), "max_batch": s["max_batch"],
+                "commit_ms_avg": round(s["commit_ms_total"] / n, 3), "commit_ms_max": round(s["commit_ms_max"], 3),
+                "commit_ms_last": round(s["commit_ms_last"], 3)}
+
+    # ── واجهة المتصلين ────────────────────────────────
+    @asynccontextmanager
+    async def intent(self, raw: bool = False):
+        """raw=True: الاتصال خاماً خارج أي دفعة (executescript بمعاملاته الخاصة — الترحيلات)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        it = _Intent(asyncio.get_running_loop(), raw)
+        self._queue.put_nowait(it)
+        try:
+            await it.turn
+        except asyncio.CancelledError:
+            if it.turn.done() and not it.turn.cancelled():
+                _finish(it, asyncio.CancelledError())       # استلم الدور ثم أُلغي: حرّر الكاتب
+            raise
+        try:
+            yield self.conn
+        except BaseException as e:
+            _finish(it, e)
+            raise
+        _finish(it)
+        await it.committed
+
+    async def close(self):
+        """يثبّت ما في الطابور ثم يوقف الكاتب."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    # ── الكاتب ────────────────────────────────────────
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            it = await self._queue.get()
+            if it is None:
+                return
+            batch: List[_Intent] = []
+            deadline = loop.time() + self.window
+            stop = False
+            while True:
+                try:
+                    if it.raw:
+                        await self._commit(batch)
+                        batch = []
+                        await self._serve_raw(it)
+                    elif await self._serve(it):
+                        batch.append(it)
+                except Exception as e:                  # الاتصال في حالة مجهولة: أسقط الدفعة كلها
+                    logger.error(f"writer: intent failed outside its block: {e}")
+                    await self._abort(batch + [it], e)
+                    batch = []
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    it = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    left = deadline - loop.time()
+                    if left <= 0:
+                        break
+                    try:
+                        it = await asyncio.wait_for(self._queue.get(), left)
+                    except asyncio.TimeoutError:
+                        break
+                if it is None:
+                    stop = True
+                    break
+            await self._commit(batch)
+            if stop:
+                return
+
+    async def _serve(self, it: _Intent) -> bool:
+        """نيّة داخل الدفعة: True إن بقيت كتابتها بانتظار التثبيت، False إن تراجعت عنها وحدها."""
+        if it.turn.cancelled():
+            return False
+        if not self.conn.in_transaction:
+            await self.conn.execute("BEGIN IMMEDIATE")
+        await self.conn.execute("SAVEPOINT intent")
+        it.turn.set_result(None)
+        self.stats["intents"] += 1
+        error = await it.done
+        if error is None:
+            await self.conn.execute("RELEASE intent")
+            return True
+        self.stats["failed"] += 1
+        await self.conn.execute("ROLLBACK TO intent")
+        await self.conn.execute("RELEASE intent")
+        return False
+
+    async def _abort(self, intents: List[_Intent], error: BaseException):
+        try:
+            await self.conn.rollback()
+        finally:
+            for it in intents:
+                _settle(it.turn, error)
+                _settle(it.committed, error)
+
+    async def _serve_raw(self, it: _Intent):
+        if it.turn.cancelled():
+            return
+        it.turn.set_result(None)
+        self.stats["intents"] += 1
+        error = await it.done
+        try:
+            if error is None:
+                await self.conn.commit()
+                self.on_commit()
+            else:
+                self.stats["failed"] += 1
+                await self.conn.rollback()
+            _settle(it.committed)
+        except Exception as e:
+            _settle(it.committed, e)
+
+    async def _commit(self, batch: List[_Intent]):
+        if not batch:
+            if self.conn.in_transaction:               # نوايا تراجعت كلها
+                await self.conn.rollback()
+            return
+        t0 = time.perf_counter()
+        try:
+            await self.conn.commit()
+        except Exception as e:
+            self.stats["commit_errors"] += 1
+            logger.error(f"writer: group commit of {len(batch)} failed: {e}")
+            await self._abort(batch, e)
+            return
+        ms = (time.perf_counter() - t0) * 1000
+        s = self.stats
+        s["commits"] += 1
+        s["batched"] += len(batch)
+        s["max_batch"] = max(s["max_batch"], len(batch))
+        s["commit_ms_total"] += ms
+        s["commit_ms_last"] = ms
+        s["commit_ms_max"] = max(s["commit_ms_max"], ms)
+        self.on_commit()
+        for it in batch:
+            _settle(it.committed)
@@ -12,7 +12,9 @@ Quiz Master Pro 2026 — النسخة النهائية المعدلة للإنت
 """
 
 import asyncio
+import bisect
 import logging
+from collections import OrderedDict
 import warnings
 from telegram.warnings import PTBUserWarning
 
@@ -21,13 +23,10 @@ warnings.filterwarnings("ignore", category=PTBUserWarning)
 
 # تجاهل تحذيرات coroutines غير المنتظرة (خاصة ببيئة Railway)
 warnings.filterwarnings("ignore", message="coroutine 'Application.*' was never awaited")
-import re
-import json
 import tempfile
 import os
-import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Collection, Set
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import (
@@ -40,10 +39,20 @@ from telegram.error import TelegramError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy import (
     Column, Integer, String, Float, DateTime, Boolean,
-    JSON, Text, select, func, or_, Index
+    JSON, Text, select, func, or_, case, delete, event, text as sql_text, Index, bindparam
 )
 from sqlalchemy.orm import declarative_base
 
+from core.changes import CHANGE_LOG_BACKFILL, CHANGE_LOG_STATEMENTS, ChangeFeed, Changes
+from core.scheduler import Scheduler
+from core.dedupe import DedupeIndex, merge_card
+from core import exporter, importer
+from core.parser import parse_message, question_layout
+from core.fts import (
+    FTS_STATEMENTS, FTS_BACKFILL, FTS_RANK,
+    fts_query, highlight, register_functions,
+)
+
 # ═══════════════════════════════════════════════════
 #  إعدادات البيئة (عدّل القيم عبر Railway Variables)
 # ═══════════════════════════════════════════════════
@@ -79,6 +88,7 @@ class Question(Base):
     options       = Column(JSON,    default=list)
     correct_index = Column(Integer, default=-1)
     explanation   = Column(Text,    nullable=True)
+    layout        = Column(JSON(none_as_null=True), nullable=True)   # بنية العرض المحللة عند الإدخال (core.parser.question_layout)
     tags          = Column(JSON,    default=list)
     priority      = Column(String(10), default="normal")
     ease_factor   = Column(Float,   default=2.5)
@@ -89,54 +99,364 @@ class Question(Base):
     streak        = Column(Integer, default=0)
     auto_captured = Column(Boolean, default=False)
     created_at    = Column(DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
-    review_dates  = Column(JSON,    default=list)
 
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
+    def parse_layout(self) -> Dict[str, Any]:
+        """يعيد حساب بنية العرض — يُستدعى عند كل كتابة تغيّر النص أو الخيارات."""
+        self.layout = question_layout(self.text, self.options)
+        return self.layout
+
+
+class QuestionTag(Base):
+    """جدول الوسوم المفهرس — يُحدَّث مع كل إضافة/تعديل/حذف للسؤال."""
+    __tablename__ = "question_tags"
+    __table_args__ = (
+        Index("ix_question_tags_tag", "tag", "question_id"),
+    )
+    question_id = Column(Integer, primary_key=True)
+    tag         = Column(String(100), primary_key=True)
+
+
+class ReviewEvent(Base):
+    """سجل المراجعات (append-only) — بديل عمود review_dates الذي كان يُعاد كتابته كاملاً."""
+    __tablename__ = "review_events"
+    __table_args__ = (
+        Index("ix_review_events_ts",       "ts"),
+        Index("ix_review_events_question", "question_id", "ts"),
+    )
+    id              = Column(Integer, primary_key=True, autoincrement=True)
+    question_id     = Column(Integer, nullable=False)
+    ts              = Column(DateTime, nullable=False)
+    quality         = Column(Integer, nullable=True)
+    interval_before = Column(Float,   nullable=True)
+    interval_after  = Column(Float,   nullable=True)
+
 engine        = create_async_engine(DATABASE_URL, echo=False)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
+IS_SQLITE     = engine.dialect.name == "sqlite"
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_sqlite_connect(dbapi_conn, _record):
+        register_functions(dbapi_conn)
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # فهرس FTS5 للبحث (SQLite فقط) — يُملأ مرة واحدة عند إنشائه
+        if IS_SQLITE:
+            fresh = not await conn.scalar(sql_text(
+                "SELECT count(*) FROM sqlite_master WHERE name='questions_fts'"
+            ))
+            for stmt in FTS_STATEMENTS:
+                await conn.exec_driver_sql(stmt)
+            if fresh:
+                await conn.exec_driver_sql(FTS_BACKFILL)
+            # سجل التغييرات لقناة الإبطال بين العمليات (core.changes)
+            logged = await conn.scalar(sql_text("SELECT count(*) FROM sqlite_master WHERE name='change_log'"))
+            for stmt in CHANGE_LOG_STATEMENTS:
+                await conn.exec_driver_sql(stmt)
+            if not logged:
+                await conn.exec_driver_sql(CHANGE_LOG_BACKFILL)
+            # ترحيل لمرة واحدة: تفريغ عمود review_dates إلى review_events ثم حذفه
+            cols = {r[1] for r in (await conn.exec_driver_sql("PRAGMA table_info(questions)")).fetchall()}
+            if "review_dates" in cols:
+                await conn.exec_driver_sql(
+                    """INSERT INTO review_events (question_id, ts)
+                       SELECT q.id, datetime(j.value) FROM questions q, json_each(q.review_dates) j
+                       WHERE j.type = 'text' AND datetime(j.value) IS NOT NULL ORDER BY 2"""
+                )
+                await conn.exec_driver_sql("ALTER TABLE questions DROP COLUMN review_dates")
+                logger.info("🗓️ ترحيل review_dates إلى review_events")
+            if "layout" not in cols:
+                await conn.exec_driver_sql("ALTER TABLE questions ADD COLUMN layout JSON")
+    # ترحيل لمرة واحدة: تحليل الصفوف القديمة التي لا تحمل بنية عرض (على دفعات)
+    tbl  = Question.__table__
+    stmt = tbl.update().where(tbl.c.id == bindparam("qid")).values(layout=bindparam("lay"))
+    done = 0
+    while True:
+        async with async_session() as s:
+            res  = await s.execute(select(tbl.c.id, tbl.c.text, tbl.c.options)
+                                   .where(tbl.c.layout.is_(None)).order_by(tbl.c.id).limit(1000))
+            rows = [{"qid": qid, "lay": question_layout(t, o)} for qid, t, o in res]
+            if not rows:
+                break
+            await s.execute(stmt, rows)
+            await s.commit()
+        done += len(rows)
+    if done:
+        logger.info(f"🧩 تحليل بنية العرض: {done} سؤال")
+    # ترحيل لمرة واحدة: نسخ وسوم عمود JSON القديم إلى question_tags
+    async with async_session() as s:
+        if await s.scalar(select(func.count()).select_from(QuestionTag)):
+            return
+        res  = await s.execute(select(Question.id, Question.tags))
+        rows = [{"question_id": qid, "tag": t} for qid, tags in res for t in set(tags or []) if t]
+        if rows:
+            await s.execute(QuestionTag.__table__.insert(), rows)
+            await s.commit()
+            logger.info(f"🏷️ ترحيل الوسوم: {len(rows)} صف")
 
 # ═══════════════════════════════════════════════════
-#  Cache ذكي مع قفل (للوقاية من سباق الحالة)
+#  فهرس الأسئلة في الذاكرة (write-through)
 # ═══════════════════════════════════════════════════
-class _QuestionCache:
+def _zero_totals() -> Dict[str, float]:
+    return {"n": 0, "reviews": 0, "wrong": 0, "ease": 0.0}
+
+
+def bank_totals(questions: List[Question]) -> Dict[str, float]:
+    """نفس مجاميع _QuestionIndex.totals بمرور كامل — مسار تحقق."""
+    t = _zero_totals()
+    for q in questions:
+        t["n"] += 1
+        t["reviews"] += q.total_reviews or 0
+        t["wrong"]   += q.wrong_count or 0
+        t["ease"]    += q.ease_factor if q.ease_factor is not None else 2.5
+    return t
+
+
+def _weak_ratio(q: Question) -> float:
+    return (q.wrong_count or 0) / (q.total_reviews or 1)
+
+
+class _QuestionIndex:
+    """
+    نسخة حيّة من البنك في الذاكرة تُحدَّث صفاً بصف عند كل كتابة.
+    لا يُعاد التحميل الكامل إلا عند الإقلاع أو resync() صريح.
+    اختيار السؤال التالي عبر Scheduler (طوابير أولوية لكل وضع: due/weak/tag/all).
+    dupes: فهرس التكرار (بصمة حرفية + SimHash) يُصان مع الصفوف نفسها.
+    totals / days: مجاميع البنك وأيام النشاط الجارية — التقارير والمستوى لا تمر على البنك.
+    """
+    WEAK_RATIO = 0.3
+
     def __init__(self):
-        self._data: List[Question] = []
-        self._ts: float = 0.0
+        self._by_id: Dict[int, Question] = {}
+        self._ids:  List[int] = []                # مرتبة تصاعدياً، موازية لـ _list
+        self._list: List[Question] = []
+        self._sched = Scheduler(
+            key=lambda q: (-_weak_ratio(q), -q.id),
+            due_at=lambda q: q.next_review,
+            weak=lambda q: (q.total_reviews or 0) > 0 and _weak_ratio(q) > self.WEAK_RATIO,
+            tags=lambda q: q.tags,
+        )
+        self.dupes  = DedupeIndex()
+        self.totals = _zero_totals()
+        self.days: Set[str] = set()
+        self._loaded = False
         self._lock = asyncio.Lock()
-        self.TTL = 30  # ثانية
-
-    def invalidate(self):
-        self._ts = 0.0
+        # كتابات وصلت أثناء إعادة التحميل: تُعاد بعد تركيب اللقطة (قد تكون اللقطة أقدم منها)
+        self._pending: Optional[Dict[int, Optional[Question]]] = None
 
-    async def get(self) -> List[Question]:
+    # ── تحميل ─────────────────────────────────────────
+    async def resync(self):
         async with self._lock:
-            if time.monotonic() - self._ts > self.TTL or not self._data:
-                self._data = await _Database.all_questions_raw()
-                self._ts = time.monotonic()
-            return self._data
+            self._pending = {}
+            try:
+                rows = await _Database.all_questions_raw()
+                days = await _Database.active_days()
+            except BaseException:
+                self._pending = None
+                raise
+            pending, self._pending = self._pending, None
+            self._reset()
+            for q in rows:
+                self._insert(q)
+            for qid, q in pending.items():
+                if q is None:
+                    self._delete(qid)
+                else:
+                    self._insert(q)
+            # فهرس التكرار يبقى عبر إعادة التحميل: add() يتجاوز النص غير المتغير، فيُحذف فقط ما اختفى
+            for qid in self.dupes:
+                if qid not in self._by_id:
+                    self.dupes.remove(qid)
+            self.days |= days                   # أيام أُضيفت أثناء التحميل تبقى
+            self._loaded = True
+            logger.info(f"🗂️ فهرس الأسئلة: {len(self._by_id)} سؤال")
+
+    async def _ensure(self):
+        if not self._loaded:
+            await self.resync()
 
-_cache = _QuestionCache()
+    async def get(self) -> List[Question]:
+        """البنك مرتباً بالمعرّف — القائمة تُصان تدريجياً فلا يُعاد فرزها بعد كل كتابة."""
+        await self._ensure()
+        return self._list
+
+    async def get_totals(self) -> Dict[str, float]:
+        """مجاميع البنك الجارية: n، reviews، wrong، ease (مجموع معاملات السهولة)."""
+        await self._ensure()
+        return self.totals
+
+    # ── تحديثات صف واحد ───────────────────────────────
+    def upsert(self, q: Question):
+        if self._pending is not None:
+            self._pending[q.id] = q
+        if self._loaded:
+            self._insert(q)
+
+    def remove(self, qid: int):
+        if self._pending is not None:
+            self._pending[qid] = None
+        if self._loaded:
+            self._delete(qid)
+
+    def clear(self):
+        if self._pending is not None:
+            self._pending.clear()
+        self._reset()
+        self.dupes.clear()
+        self.days.clear()
+
+    async def apply_changes(self, ch: Changes):
+        """
+        كتابات عمليات أخرى على نفس القاعدة (core.changes.ChangeFeed): تحديث دقيق بالمعرّفات بدل إعادة التحميل.
+        كتابات هذه العملية تعود أيضاً — upsert لنفس الصف لا يغيّر شيئاً.
+        """
+        if not self._loaded:
+            return                              # التحميل الأول سيقرأ الحالة كاملة
+        if ch.reset:
+            await self.resync()
+            return
+        for qid in ch.deletes:
+            self.remove(qid)
+        if ch.upserts:
+            rows = await _Database.questions_by_ids(ch.upserts)
+            for q in rows:
+                self.upsert(q)
+            for qid in set(ch.upserts) - {q.id for q in rows}:
+                self.remove(qid)
+            self.days |= await _Database.active_days(ch.upserts)
+        if ch.deletes:
+            self.days = await _Database.active_days()
+
+    # ── استعلامات ─────────────────────────────────────
+    async def next_question(self, mode: str = "all", tag: Optional[str] = None,
+                            exclude: Collection[int] = ()) -> Optional[Question]:
+        """الأولوية: المستحق أولاً، ثم الأعلى نسبة خطأ، ثم الأحدث — O(log n)."""
+        await self._ensure()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        qid = self._sched.next(mode, now, tag=tag, exclude=exclude)
+        return self._by_id.get(qid) if qid is not None else None
+
+    # ── داخلي ─────────────────────────────────────────
+    def _reset(self):
+        self._by_id.clear()
+        self._sched.clear()
+        self._ids, self._list = [], []
+        self.totals = _zero_totals()
+
+    def _count(self, q: Question, sign: int):
+        t = self.totals
+        t["n"]       += sign
+        t["reviews"] += sign * (q.total_reviews or 0)
+        t["wrong"]   += sign * (q.wrong_count or 0)
+        t["ease"]    += sign * (q.ease_factor if q.ease_factor is not None else 2.5)
+
+    def _insert(self, q: Question):
+        old = self._by_id.get(q.id)
+        if old is not None:
+            self._count(old, -1)
+        self._count(q, 1)
+        if old is not None:
+            self._list[bisect.bisect_left(self._ids, q.id)] = q
+        elif not self._ids or q.id > self._ids[-1]:
+            self._ids.append(q.id)
+            self._list.append(q)
+        else:
+            i = bisect.bisect_left(self._ids, q.id)
+            self._ids.insert(i, q.id)
+            self._list.insert(i, q)
+        self._by_id[q.id] = q
+        self._sched.update(q)
+        self.dupes.add(q.id, q.text, q.options)
+
+    def _delete(self, qid: int):
+        old = self._by_id.pop(qid, None)
+        if old is None:
+            return
+        self._count(old, -1)
+        i = bisect.bisect_left(self._ids, qid)
+        del self._ids[i], self._list[i]
+        self._sched.remove(qid)
+        self.dupes.remove(qid)
+
+_cache = _QuestionIndex()
 
 # ═══════════════════════════════════════════════════
 #  طبقة قاعدة البيانات
 # ═══════════════════════════════════════════════════
 class _Database:
 
+    @staticmethod
+    async def _sync_tags(s, qid: int, tags: List[str]):
+        want = {t for t in (tags or []) if t}
+        have = set((await s.scalars(select(QuestionTag.tag).where(QuestionTag.question_id == qid))).all())
+        if have - want:
+            await s.execute(delete(QuestionTag).where(
+                QuestionTag.question_id == qid, QuestionTag.tag.in_(have - want)
+            ))
+        s.add_all(QuestionTag(question_id=qid, tag=t) for t in want - have)
+
     @staticmethod
     async def add_question(q: Question) -> int:
+        q.parse_layout()
         async with async_session() as s:
             s.add(q)
+            await s.flush()
+            s.add_all(QuestionTag(question_id=q.id, tag=t) for t in {t for t in (q.tags or []) if t})
             await s.commit()
             await s.refresh(q)
-        _cache.invalidate()
+        _cache.upsert(q)
         return q.id
 
+    @staticmethod
+    async def add_or_merge(q: Question) -> Tuple[int, Optional[str]]:
+        """
+        للأسئلة المُلتقطة (المحوَّلة): إن كانت مكررة تُدمج في الأصل بدل صف جديد.
+        يعيد (id, None) عند الإدراج أو (id الأصل, 'exact'|'near') عند الدمج.
+        """
+        await _cache._ensure()
+        hit = _cache.dupes.find(q.text, q.options)
+        dst = await _Database.get_question(hit[0]) if hit else None
+        if dst is None:
+            return await _Database.add_question(q), None
+        merge_card(dst, q)
+        await _Database.update_question(dst)
+        return dst.id, hit[1]
+
+    @staticmethod
+    async def merge_duplicates() -> Dict[str, int]:
+        """دمج التكرار المخزّن سابقاً: كل مجموعة في أقدم بطاقة، مع نقل أحداث المراجعة وحذف البقية."""
+        await _cache._ensure()
+        groups, merged = _cache.dupes.clusters(), []
+        async with async_session() as s:
+            for g in groups:
+                keep = await s.get(Question, g[0])
+                for qid in g[1:]:
+                    dup = await s.get(Question, qid)
+                    if keep is None or dup is None:
+                        continue
+                    merge_card(keep, dup)
+                    await s.execute(ReviewEvent.__table__.update()
+                                    .where(ReviewEvent.question_id == qid).values(question_id=keep.id))
+                    await s.execute(delete(QuestionTag).where(QuestionTag.question_id == qid))
+                    await s.delete(dup)
+                    merged.append(qid)
+                if keep is not None:
+                    keep.parse_layout()
+                    await _Database._sync_tags(s, keep.id, keep.tags)
+            await s.commit()
+            keepers = [await s.get(Question, g[0]) for g in groups]
+        for qid in merged:
+            _cache.remove(qid)
+        for q in keepers:
+            if q is not None:
+                _cache.upsert(q)
+        return {"clusters": len(groups), "merged": len(merged)}
+
     @staticmethod
     async def get_question(qid: int) -> Optional[Question]:
         async with async_session() as s:
@@ -144,10 +464,12 @@ class _Database:
 
     @staticmethod
     async def update_question(q: Question):
+        q.parse_layout()
         async with async_session() as s:
             await s.merge(q)
+            await _Database._sync_tags(s, q.id, q.tags)
             await s.commit()
-        _cache.invalidate()
+        _cache.upsert(q)
 
     @staticmethod
     async def delete_question(qid: int) -> bool:
@@ -156,10 +478,78 @@ class _Database:
             if not obj:
                 return False
             await s.delete(obj)
+            await s.execute(delete(QuestionTag).where(QuestionTag.question_id == qid))
+            await s.execute(delete(ReviewEvent).where(ReviewEvent.question_id == qid))
             await s.commit()
-        _cache.invalidate()
+        _cache.remove(qid)
+        _cache.days = await _Database.active_days()     # قد تختفي أيام لم يكن فيها غير مراجعات هذا السؤال
         return True
 
+    @staticmethod
+    async def record_review(q: Question, quality: int, interval_before: Optional[int], ts: datetime):
+        """يحفظ نتيجة SM-2 ويُلحق حدث المراجعة في معاملة واحدة."""
+        if q.layout is None:
+            q.parse_layout()
+        async with async_session() as s:
+            await s.merge(q)
+            s.add(ReviewEvent(question_id=q.id, ts=ts, quality=quality,
+                              interval_before=interval_before, interval_after=q.interval))
+            await s.commit()
+        _cache.upsert(q)
+        _cache.days.add(ts.date().isoformat())
+
+    @staticmethod
+    async def active_days(ids: Optional[Collection[int]] = None) -> Set[str]:
+        """أيام النشاط؛ ids: أيام مراجعات هذه الأسئلة فقط (ix_review_events_question)."""
+        stmt = select(func.date(ReviewEvent.ts)).distinct()
+        if ids is not None:
+            stmt = stmt.where(ReviewEvent.question_id.in_(list(ids)))
+        async with async_session() as s:
+            return set((await s.scalars(stmt)).all())
+
+    @staticmethod
+    async def get_streak() -> int:
+        """من أيام النشاط المحفوظة في الفهرس — لا استعلام لكل طلب."""
+        await _cache._ensure()
+        return calculate_streak(_cache.days)
+
+    @staticmethod
+    async def bulk_add(rows: List[Dict[str, Any]]) -> List[int]:
+        """
+        إدراج دفعة في معاملة واحدة؛ الفهرس لا يُلمس — المستدعي يعيد بناءه مرة واحدة.
+        المعرّفات من RETURNING بترتيب الصفوف (insertmanyvalues)، لا من MAX(id) الذي قد تسبقه كتابة أخرى.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = [{**r, "created_at": now, "layout": question_layout(r["text"], r.get("options"))} for r in rows]
+        tbl  = Question.__table__
+        async with async_session() as s:
+            res  = await s.execute(tbl.insert().returning(tbl.c.id, sort_by_parameter_order=True), rows)
+            ids  = res.scalars().all()
+            tags = [{"question_id": qid, "tag": t} for qid, r in zip(ids, rows) for t in set(r["tags"]) if t]
+            if tags:
+                await s.execute(QuestionTag.__table__.insert(), tags)
+            await s.commit()
+        return ids
+
+    @staticmethod
+    async def iter_pages(chunk: int = exporter.EXPORT_CHUNK):
+        """صفحات keyset من الجدول مباشرة (بدون كائنات ORM) — ذاكرة ثابتة مهما كبر البنك."""
+        tbl, last = Question.__table__, 0
+        cols = [c for c in tbl.c if c.name != "layout"]     # بنية العرض مشتقة من النص: لا تُصدَّر
+        while True:
+            async with async_session() as s:
+                res  = await s.execute(select(*cols).where(tbl.c.id > last).order_by(tbl.c.id).limit(chunk))
+                page = [dict(r._mapping) for r in res]
+            if not page:
+                return
+            last = page[-1]["id"]
+            yield page
+
+    @staticmethod
+    async def questions_by_ids(ids: Collection[int]) -> List[Question]:
+        async with async_session() as s:
+            return list((await s.scalars(select(Question).where(Question.id.in_(list(ids))))).all())
+
     @staticmethod
     async def all_questions_raw() -> List[Question]:
         async with async_session() as s:
@@ -169,16 +559,19 @@ class _Database:
     @staticmethod
     async def get_stats() -> Dict[str, Any]:
         now = datetime.now(timezone.utc).replace(tzinfo=None)
+        def _count(cond):
+            return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
         async with async_session() as s:
-            total    = await s.scalar(select(func.count(Question.id))) or 0
-            due      = await s.scalar(
-                select(func.count(Question.id)).where(Question.next_review <= now)
-            ) or 0
-            urgent   = await s.scalar(select(func.count(Question.id)).where(Question.priority == "urgent"))  or 0
-            normal   = await s.scalar(select(func.count(Question.id)).where(Question.priority == "normal"))  or 0
-            low      = await s.scalar(select(func.count(Question.id)).where(Question.priority == "low"))     or 0
-            auto     = await s.scalar(select(func.count(Question.id)).where(Question.auto_captured == True)) or 0
-            avg_ease = await s.scalar(select(func.avg(Question.ease_factor))) or 0.0
+            total, due, urgent, normal, low, auto, avg_ease = (await s.execute(select(
+                func.count(Question.id),
+                _count(Question.next_review <= now),
+                _count(Question.priority == "urgent"),
+                _count(Question.priority == "normal"),
+                _count(Question.priority == "low"),
+                _count(Question.auto_captured == True),
+                func.coalesce(func.avg(Question.ease_factor), 0.0),
+            ))).one()
         return {
             "total": total, "due": due,
             "by_priority": {"urgent": urgent, "normal": normal, "low": low},
@@ -198,182 +591,55 @@ class _Database:
             return list(res.scalars().all())
 
     @staticmethod
-    async def search(term: str) -> List[Question]:
+    async def search(term: str, limit: int = 10, offset: int = 0) -> List[Tuple[Question, str]]:
+        """بحث FTS5 مرتب بـ bm25 مع مقتطف؛ fallback إلى ilike لغير SQLite."""
         async with async_session() as s:
-            p   = f"%{term}%"
-            res = await s.execute(
-                select(Question).where(
-                    or_(Question.text.ilike(p), Question.options.cast(Text).ilike(p))
-                ).limit(20)
-            )
-            return list(res.scalars().all())
+            if not IS_SQLITE:
+                p   = f"%{term}%"
+                res = await s.execute(
+                    select(Question).where(
+                        or_(Question.text.ilike(p), Question.options.cast(Text).ilike(p))
+                    ).order_by(Question.id).offset(offset).limit(limit)
+                )
+                return [(item, "") for item in res.scalars().all()]
+            match = fts_query(term)
+            if not match:
+                return []
+            hits = (await s.scalars(sql_text(
+                f"SELECT rowid FROM questions_fts "
+                f"WHERE questions_fts MATCH :m ORDER BY {FTS_RANK} LIMIT :n OFFSET :o"
+            ), {"m": match, "n": limit, "o": offset})).all()
+            if not hits:
+                return []
+            res  = await s.scalars(select(Question).where(Question.id.in_(hits)))
+            objs = {item.id: item for item in res.all()}
+            return [(objs[qid], highlight(objs[qid].text, term)) for qid in hits if qid in objs]
 
     @staticmethod
     async def get_all_tags() -> List[str]:
         async with async_session() as s:
-            res      = await s.execute(select(Question.tags))
-            tags_set: set = set()
-            for (row,) in res:
-                if row:
-                    tags_set.update(row)
-            return sorted(tags_set)
+            res = await s.scalars(select(QuestionTag.tag).distinct().order_by(QuestionTag.tag))
+            return list(res.all())
+
+    @staticmethod
+    async def get_tag_counts() -> Dict[str, int]:
+        async with async_session() as s:
+            res = await s.execute(
+                select(QuestionTag.tag, func.count()).group_by(QuestionTag.tag).order_by(QuestionTag.tag)
+            )
+            return {tag: n for tag, n in res}
 
     @staticmethod
     async def clear_all():
         async with async_session() as s:
             await s.execute(Question.__table__.delete())
+            await s.execute(QuestionTag.__table__.delete())
+            await s.execute(ReviewEvent.__table__.delete())
             await s.commit()
-        _cache.invalidate()
+        _cache.clear()
 
 db = _Database()
 
-# ═══════════════════════════════════════════════════
-#  extract_options المحسّن (يدعم شرح متعدد الأسطر)
-# ═══════════════════════════════════════════════════
-_ARABIC_LABELS = {
-    "أ": 0, "ا": 0, "ب": 1, "ج": 2, "د": 3,
-    "ه": 4, "هـ": 4, "و": 5, "ز": 6, "ح": 7,
-}
-_OPTION_RE   = re.compile(r"^(?P<label>[أ-يa-zA-Z\d])\s*[\)\-\.–—]\s*(?P<body>.+)", re.UNICODE)
-_CORRECT_RE  = re.compile(
-    r"(?:الإجابة\s*الصحيحة|الجواب\s*الصحيح|✅)"
-    r"[^\u0600-\u06FFa-zA-Z\d]*(?P<label>[أ-يa-zA-Z]|\d+)",
-    re.UNICODE,
-)
-_EXPL_START  = re.compile(r"^(?:شرح|توضيح|ملاحظة|تنبيه|📝|💡|🔍|لأن|السبب|وبالتالي|إذن)", re.UNICODE)
-_EXPL_INLINE = re.compile(r"(?:لأن|حيث|بمعنى|يعني|أي أن|وهو|نلاحظ|وبالتالي|لذلك)", re.UNICODE)
-_TIMER_RE    = re.compile(r"^[0-9]{1,2}[:\.][0-9]{1,2}$")
-_TIMER_KW    = {"ثانية", "ثوان", "الوقت المتبقي", "time left", "sec"}
-_LABELS      = ["أ", "ب", "ج", "د", "هـ", "و"]
-
-
-def _label_to_index(label: str, options: List[str]) -> int:
-    """تحويل حرف/رقم → index — يبحث في الخيارات أولاً ثم الخريطة."""
-    for i, opt in enumerate(options):
-        m = _OPTION_RE.match(opt)
-        if m and m.group("label") == label:
-            return i
-    if label in _ARABIC_LABELS:
-        return _ARABIC_LABELS[label]
-    if label.isdigit():
-        return int(label) - 1
-    if label.isascii() and label.isalpha():
-        return ord(label.lower()) - ord("a")
-    return -1
-
-
-def clean_text(raw: str) -> str:
-    """إزالة المؤقتات والضجيج من النص."""
-    result = []
-    for line in raw.splitlines():
-        s = line.strip()
-        if not s:
-            result.append(line); continue
-        if any(ch in s for ch in "⏳⌛⏱⏰"):
-            continue
-        if any(kw in s.lower() for kw in _TIMER_KW) and len(s) <= 30:
-            continue
-        if _TIMER_RE.fullmatch(s):
-            continue
-        result.append(line)
-    return "\n".join(result)
-
-
-def extract_options(text: str) -> Tuple[str, List[str], int, Optional[str]]:
-    """
-    يستخرج: (نص_السؤال, خيارات, index_الإجابة, شرح)
-    
-    يدعم:
-    • أحرف عربية/لاتينية/أرقام مع ) - . – —
-    • ✅ داخل سطر الخيار أو في سطر منفصل
-    • شرح متعدد الأسطر
-    • fallback للخيارات بدون فاصل (أ النص)
-    """
-    lines           = text.splitlines()
-    options         : List[str]  = []
-    correct_index   : int        = -1
-    option_set      : set[int]   = set()
-    correct_line    : int        = -1
-    expl_set        : set[int]   = set()
-
-    # ── 1. رصد الخيارات ──────────────────────────────────────────────
-    for i, line in enumerate(lines):
-        s = line.strip()
-        if not s:
-            continue
-        if _OPTION_RE.match(s):
-            if "✅" in s:
-                correct_line = i
-                clean = re.sub(r"\s*✅.*$", "", s).strip()
-                options.append(clean)
-                correct_index = len(options) - 1
-            else:
-                options.append(s)
-            option_set.add(i)
-
-    # fallback: "أ النص" بدون فاصل
-    if not options:
-        _NP = re.compile(r"^(?P<label>[أ-دa-dA-D])\s+(?P<body>\S.+)", re.UNICODE)
-        for i, line in enumerate(lines):
-            s = line.strip()
-            if _NP.match(s):
-                options.append(s)
-                option_set.add(i)
-
-    # ── 2. الإجابة الصحيحة (سطر منفصل) ──────────────────────────────
-    if correct_line == -1:
-        for i, line in enumerate(lines):
-            if i in option_set:
-                continue
-            m = _CORRECT_RE.search(line)
-            if m:
-                correct_line  = i
-                correct_index = _label_to_index(m.group("label"), options)
-                break
-        if correct_line == -1:
-            for i, line in enumerate(lines):
-                if i in option_set or "✅" not in line:
-                    continue
-                correct_line = i
-                for pat in (r"[أ-ي]", r"[a-zA-Z]", r"\d+"):
-                    lm = re.search(pat, line)
-                    if lm:
-                        correct_index = _label_to_index(lm.group(), options)
-                        break
-                break
-
-    # ── 3. الشرح (متعدد الأسطر) ──────────────────────────────────────
-    excluded   = option_set | ({correct_line} if correct_line != -1 else set())
-    expl_parts : List[str] = []
-    in_expl    = False
-
-    for i, line in enumerate(lines):
-        if i in excluded:
-            continue
-        s = line.strip()
-        if not s:
-            if in_expl:
-                break
-            continue
-        if _EXPL_START.match(s) or (not in_expl and _EXPL_INLINE.search(s)):
-            in_expl = True
-            expl_parts.append(s)
-            expl_set.add(i)
-        elif in_expl:
-            expl_parts.append(s)
-            expl_set.add(i)
-
-    explanation = "\n".join(expl_parts).strip() or None
-
-    # ── 4. نص السؤال ─────────────────────────────────────────────────
-    all_excl = excluded | expl_set
-    q_lines  = [
-        lines[i].strip()
-        for i in range(len(lines))
-        if i not in all_excl and lines[i].strip()
-    ]
-    return "\n".join(q_lines).strip(), options, correct_index, explanation
-
 # ═══════════════════════════════════════════════════
 #  دوال مساعدة
 # ═══════════════════════════════════════════════════
@@ -381,10 +647,10 @@ def priority_text(p: str) -> str:
     return {"urgent": "🔥 عاجل", "normal": "⚡ متوسط", "low": "📖 عادي"}.get(p, p)
 
 
-def calculate_streak(review_dates: List[str]) -> int:
-    if not review_dates:
+def calculate_streak(days: List[str]) -> int:
+    if not days:
         return 0
-    dates = sorted({datetime.fromisoformat(d).date() for d in review_dates if d})
+    dates = sorted({datetime.fromisoformat(d).date() for d in days if d})
     if not dates:
         return 0
     mx = cur = 1
@@ -415,12 +681,10 @@ def get_level_info(total: int) -> Dict[str, Any]:
     return {"level": name, "badge": badge, "xp": xp, "xp_needed": xp_need, "bar": bar, "total": total}
 
 
-def sm2_review(q: Question, quality: int) -> Question:
+def sm2_review(q: Question, quality: int, now: Optional[datetime] = None) -> Question:
     """خوارزمية SM-2 — تُستدعى مرة واحدة فقط بعد الإجابة."""
-    now             = datetime.now(timezone.utc).replace(tzinfo=None)
+    now             = now or datetime.now(timezone.utc).replace(tzinfo=None)
     q.total_reviews = (q.total_reviews or 0) + 1
-    q.review_dates  = list(q.review_dates or [])
-    q.review_dates.append(now.isoformat())
 
     if quality >= 3:
         q.streak     = (q.streak or 0) + 1
@@ -439,51 +703,57 @@ def sm2_review(q: Question, quality: int) -> Question:
     return q
 
 
-def get_next_question(
-    questions: List[Question], mode="all",
-    tag: Optional[str] = None, exclude_id: Optional[int] = None
-) -> Optional[Question]:
-    now = datetime.now(timezone.utc).replace(tzinfo=None)
-    if   mode == "due":  pool = [q for q in questions if q.next_review and q.next_review <= now]
-    elif mode == "weak": pool = [q for q in questions if (q.total_reviews or 0) > 0 and (q.wrong_count or 0) / (q.total_reviews or 1) > 0.3]
-    elif mode == "tag" and tag: pool = [q for q in questions if tag in (q.tags or [])]
-    else: pool = list(questions)
-
-    if exclude_id:
-        pool = [q for q in pool if q.id != exclude_id]
-    if not pool:
-        return None
-
-    pool.sort(key=lambda q: (
-        0 if q.next_review and q.next_review <= now else 1,
-        -((q.wrong_count or 0) / max(q.total_reviews or 1, 1)),
-        -(q.id or 0),
-    ))
-    return pool[0]
-
-
-def predict_score(questions: List[Question]) -> Dict[str, Any]:
-    if not questions:
+def predict_score(totals: Dict[str, float]) -> Dict[str, Any]:
+    """من مجاميع البنك (_cache.totals أو bank_totals) — O(1)."""
+    if not totals["n"]:
         return {"overall": 0, "confidence": "منخفض"}
-    tr       = sum(q.total_reviews or 0 for q in questions)
-    avg_ef   = sum(q.ease_factor or 2.5 for q in questions) / len(questions)
-    wrong_r  = sum(q.wrong_count or 0 for q in questions) / max(tr, 1)
+    tr       = totals["reviews"]
+    avg_ef   = totals["ease"] / totals["n"]
+    wrong_r  = totals["wrong"] / max(tr, 1)
     score    = max(0, min(100, avg_ef / 2.5 * 100 - wrong_r * 50))
     conf     = "منخفض" if tr < 10 else "متوسط" if tr < 50 else "مرتفع"
     return {"overall": round(score, 1), "confidence": conf}
 
 
-def build_options_display(opts: List[str], correct_idx: int, selected_idx: int = -1) -> str:
-    """يعرض الخيارات بعد الإجابة مع أيقونة لكل خيار."""
-    lines = []
-    for i, opt in enumerate(opts[:6]):
-        body = re.sub(r"^[أ-يa-zA-Z\d]\s*[\)\-\.–—]\s*", "", opt).strip() or opt
-        lbl  = _LABELS[i] if i < len(_LABELS) else str(i + 1)
-        if   i == correct_idx:                    icon = "✅"
-        elif i == selected_idx != correct_idx:    icon = "❌"
-        else:                                      icon = "◻️"
-        lines.append(f"{icon} {lbl}) {body}")
-    return "\n".join(lines)
+def build_options_display(lines: List[str], correct_idx: int, selected_idx: int = -1) -> str:
+    """يعرض الخيارات بعد الإجابة: أسطر "أ) النص" محسوبة مسبقاً، ولا يبقى إلا وضع الأيقونة."""
+    return "\n".join(
+        f"{'✅' if i == correct_idx else '❌' if i == selected_idx else '◻️'} {line}"
+        for i, line in enumerate(lines)
+    )
+
+
+class _RenderCache:
+    """
+    العرض الجاهز لكل سؤال: لوحة الأزرار وأسطر الخيارات "أ) النص" مبنية من بنية العرض المخزنة.
+    المدخل يُطابق ببنية العرض نفسها عند كل قراءة، فتعديل النص أو الخيارات يُبطله تلقائياً.
+    """
+
+    def __init__(self, size: int = 512):
+        self._size = size
+        self._items: "OrderedDict[int, Tuple[Dict[str, Any], InlineKeyboardMarkup, List[str]]]" = OrderedDict()
+
+    def get(self, q: Question) -> Tuple[Dict[str, Any], InlineKeyboardMarkup, List[str]]:
+        """(بنية العرض, لوحة الأزرار, أسطر الخيارات)."""
+        lay = q.layout or q.parse_layout()
+        hit = self._items.get(q.id)
+        if hit is not None and hit[0] == lay:
+            self._items.move_to_end(q.id)
+            return hit
+        lines = [f"{lbl}) {body}" for lbl, body in zip(lay["labels"], lay["bodies"])]
+        rows  = [[InlineKeyboardButton(f"{lbl}) {body[:45]}{'…' if len(body) > 45 else ''}",
+                                       callback_data=f"opt_{q.id}_{i}")]
+                 for i, (lbl, body) in enumerate(zip(lay["labels"], lay["bodies"]))]
+        rows.append([
+            InlineKeyboardButton("⏭ تخطي",  callback_data=f"skip_{q.id}"),
+            InlineKeyboardButton("⏹ إنهاء", callback_data="end_quiz"),
+        ])
+        hit = self._items[q.id] = (lay, InlineKeyboardMarkup(rows), lines)
+        if len(self._items) > self._size:
+            self._items.popitem(last=False)
+        return hit
+
+_renders = _RenderCache()
 
 # ═══════════════════════════════════════════════════
 #  لوحات المفاتيح
@@ -516,12 +786,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.message:
             await update.message.reply_text("⛔ غير مصرح.")
         return
-    all_q  = await _cache.get()
     stats  = await db.get_stats()
-    dates  = [d for q in all_q for d in (q.review_dates or [])]
-    streak = calculate_streak(dates)
-    total  = sum(q.total_reviews or 0 for q in all_q)
-    lv     = get_level_info(total)
+    streak = await db.get_streak()
+    lv     = get_level_info((await _cache.get_totals())["reviews"])
     bar    = "█" * lv["bar"] + "░" * (10 - lv["bar"])
     text   = (
         f"🤖 *Quiz Master Pro 2026*\n\n"
@@ -549,6 +816,8 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/delete رقم — حذف سؤال\n"
         "/tag رقم وسم — إضافة وسم\n"
         "/list — آخر 10 أسئلة\n"
+        "/import — استيراد ملف أسئلة (JSON/NDJSON/CSV)\n"
+        "/dedupe — دمج الأسئلة المكررة في البنك\n"
         "/ping — اختبار الاتصال\n\n"
         "📌 *أرسل أي نص لحفظه تلقائياً*\n"
         "📊 *أرسل استطلاعاً (Poll) لحفظه مع الإجابة*\n"
@@ -576,8 +845,7 @@ async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def _add_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cleaned                   = clean_text(update.message.text)
-    q_text, opts, cidx, expl = extract_options(cleaned)
+    q_text, opts, cidx, expl = parse_message(update.message.text)
     context.user_data["q"]    = {"text": q_text, "options": opts, "correct_index": cidx, "explanation": expl}
     preview = (
         f"📋 *معاينة*\n\n"
@@ -649,9 +917,7 @@ add_conv = ConversationHandler(
 #  عرض السؤال
 # ═══════════════════════════════════════════════════
 async def _send_question(target, question: Question, context: ContextTypes.DEFAULT_TYPE):
-    q_text, ex_opts, _, _ = extract_options(question.text)
-    opts    = ex_opts or question.options or []
-    display = q_text or question.text
+    lay, kb, _ = _renders.get(question)
     tags_tx = f" [{', '.join(question.tags)}]" if question.tags else ""
     auto_tx = " 🤖" if question.auto_captured else ""
 
@@ -662,26 +928,7 @@ async def _send_question(target, question: Question, context: ContextTypes.DEFAU
         f"❌ {question.wrong_count or 0} | "
         f"🔁 {question.total_reviews or 0}\n\n"
     )
-
-    if not opts:
-        text = header + display
-        kb   = InlineKeyboardMarkup([[
-            InlineKeyboardButton("⏭ تخطي",  callback_data=f"skip_{question.id}"),
-            InlineKeyboardButton("⏹ إنهاء", callback_data="end_quiz"),
-        ]])
-    else:
-        rows = []
-        for i, opt in enumerate(opts[:6]):
-            body = re.sub(r"^[أ-يa-zA-Z\d]\s*[\)\-\.–—]\s*", "", opt).strip() or opt
-            lbl  = _LABELS[i] if i < len(_LABELS) else str(i + 1)
-            btn  = f"{lbl}) {body[:45]}{'…' if len(body) > 45 else ''}"
-            rows.append([InlineKeyboardButton(btn, callback_data=f"opt_{question.id}_{i}")])
-        rows.append([
-            InlineKeyboardButton("⏭ تخطي",  callback_data=f"skip_{question.id}"),
-            InlineKeyboardButton("⏹ إنهاء", callback_data="end_quiz"),
-        ])
-        text = header + display
-        kb   = InlineKeyboardMarkup(rows)
+    text = header + lay["stem"]
 
     try:
         if hasattr(target, "edit_message_text"):
@@ -698,8 +945,7 @@ async def _start_quiz(update, context, mode: str, tag: Optional[str] = None):
     q = update.callback_query
     await q.answer()
     context.user_data.update({"quiz_mode": mode, "quiz_tag": tag, "quiz_correct": 0, "quiz_total": 0})
-    all_qs = await _cache.get()
-    nxt    = get_next_question(all_qs, mode=mode, tag=tag)
+    nxt    = await _cache.next_question(mode, tag)
     msgs   = {
         "all":  "📭 البنك فارغ، أضف أسئلة أولاً.",
         "due":  "📆 لا مراجعات مستحقة الآن، عد لاحقاً.",
@@ -721,11 +967,11 @@ async def menu_quiz_weak(u, c): await _start_quiz(u, c, "weak")
 async def menu_quiz_tag(update, context):
     q = update.callback_query
     await q.answer()
-    tags = await db.get_all_tags()
+    tags = await db.get_tag_counts()
     if not tags:
         await q.edit_message_text("🏷️ لا توجد وسوم بعد.", reply_markup=main_keyboard())
         return
-    btns = [[InlineKeyboardButton(f"🏷️ {t}", callback_data=f"tag_{t}")] for t in tags]
+    btns = [[InlineKeyboardButton(f"🏷️ {t} ({n})", callback_data=f"tag_{t}")] for t, n in tags.items()]
     btns.append([InlineKeyboardButton("❌ إلغاء", callback_data="menu_back")])
     await q.edit_message_text("🏷️ اختر المادة:", reply_markup=InlineKeyboardMarkup(btns))
 
@@ -751,18 +997,19 @@ async def quiz_option(update, context):
     correct = (sel == question.correct_index)
     # تطبيق SM-2 فوراً (بدون انتظار تقييم المستخدم)
     quality = 5 if correct else 0
-    updated = sm2_review(question, quality)
-    await db.update_question(updated)
+    now     = datetime.now(timezone.utc).replace(tzinfo=None)
+    before  = question.interval
+    updated = sm2_review(question, quality, now)
+    await db.record_review(updated, quality, before, now)
 
     # تحديث عداد الجلسة
     context.user_data["quiz_total"] = context.user_data.get("quiz_total", 0) + 1
     if correct:
         context.user_data["quiz_correct"] = context.user_data.get("quiz_correct", 0) + 1
 
-    # عرض الخيارات مع أيقونات
-    _, opts, _, _ = extract_options(question.text)
-    all_opts = opts or question.options or []
-    opts_display = build_options_display(all_opts, question.correct_index, sel)
+    # عرض الخيارات مع أيقونات (أسطر جاهزة من _renders — لا إعادة تحليل للنص)
+    _, _, lines  = _renders.get(question)
+    opts_display = build_options_display(lines, question.correct_index, sel)
 
     result_icon = "✅ *صحيح!* 🎉" if correct else "❌ *خطأ!*"
     expl_block  = f"\n\n💡 *شرح:*\n{question.explanation}" if (not correct and question.explanation) else ""
@@ -782,8 +1029,7 @@ async def _next_question(update, context):
     mode    = context.user_data.get("quiz_mode", "all")
     tag     = context.user_data.get("quiz_tag")
     exclude = context.user_data.get("current_qid")
-    all_qs  = await _cache.get()
-    nxt     = get_next_question(all_qs, mode=mode, tag=tag, exclude_id=exclude)
+    nxt     = await _cache.next_question(mode, tag, exclude=(exclude,) if exclude else ())
 
     if not nxt:
         correct = context.user_data.get("quiz_correct", 0)
@@ -843,9 +1089,8 @@ async def menu_stats(update, context):
     q = update.callback_query
     await q.answer()
     stats  = await db.get_stats()
-    all_qs = await _cache.get()
-    pred   = predict_score(all_qs)
-    tags   = await db.get_all_tags()
+    pred   = predict_score(await _cache.get_totals())
+    tags   = await db.get_tag_counts()
     text   = (
         f"📊 *إحصائيات شاملة*\n\n"
         f"📌 إجمالي: *{stats['total']}* | ⏰ مستحقة: *{stats['due']}*\n"
@@ -855,7 +1100,7 @@ async def menu_stats(update, context):
         f"🤖 ملتقطة تلقائياً: *{stats['auto_captured']}*\n"
         f"📈 متوسط Ease Factor: *{stats['avg_ease']}*\n\n"
         f"🎯 درجة متوقعة: *{pred['overall']}%* (ثقة {pred['confidence']})\n"
-        f"🏷️ الوسوم: {', '.join(tags) if tags else 'لا يوجد'}"
+        f"🏷️ الوسوم: {', '.join(f'{t} ({n})' for t, n in tags.items()) if tags else 'لا يوجد'}"
     )
     await q.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=main_keyboard())
 
@@ -863,10 +1108,8 @@ async def menu_stats(update, context):
 async def menu_level(update, context):
     q      = update.callback_query
     await q.answer()
-    all_qs = await _cache.get()
-    total  = sum(item.total_reviews or 0 for item in all_qs)
-    dates  = [d for item in all_qs for d in (item.review_dates or [])]
-    streak = calculate_streak(dates)
+    total  = (await _cache.get_totals())["reviews"]
+    streak = await db.get_streak()
     lv     = get_level_info(total)
     bar    = "█" * lv["bar"] + "░" * (10 - lv["bar"])
     text   = (
@@ -881,24 +1124,93 @@ async def menu_level(update, context):
 async def menu_export(update, context):
     q = update.callback_query
     await q.answer()
-    qs = await _cache.get()
-    if not qs:
+    if not await _cache.get():
         await q.edit_message_text("📂 لا توجد بيانات.", reply_markup=main_keyboard()); return
+    labels = {"ndjson": "📄 NDJSON", "gzip": "🗜 NDJSON.gz", "zstd": "🗜 NDJSON.zst", "parquet": "📊 Parquet"}
+    fmts   = exporter.available_formats()
+    rows   = [[InlineKeyboardButton(labels[f], callback_data=f"export_{f}") for f in fmts[i:i + 2]]
+              for i in range(0, len(fmts), 2)]
+    rows.append([InlineKeyboardButton("🔙 رجوع", callback_data="menu_back")])
+    await q.edit_message_text("📤 اختر صيغة التصدير:", reply_markup=InlineKeyboardMarkup(rows))
+
+
+async def export_run(update, context):
+    """يبث البنك صفحةً بصفحة إلى ملف مؤقت ثم يرسله — لا يُحمَّل البنك كاملاً في الذاكرة."""
+    q   = update.callback_query
+    await q.answer()
+    fmt = q.data[len("export_"):]
+    if fmt not in exporter.available_formats():
+        await q.edit_message_text("❌ صيغة غير متاحة.", reply_markup=main_keyboard()); return
     await q.edit_message_text("📤 جاري التصدير…")
-    data = [item.to_dict() for item in qs]
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False, encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    count = 0
+
+    async def pages():
+        nonlocal count
+        async for page in db.iter_pages():
+            count += len(page)
+            yield page
+
+    with tempfile.NamedTemporaryFile(suffix=exporter.FORMATS[fmt][1], delete=False) as f:
+        async for chunk in exporter.stream(pages(), fmt):
+            f.write(chunk)
         tmp = f.name
-    with open(tmp, "rb") as f:
-        await context.bot.send_document(
-            chat_id=q.message.chat_id,
-            document=InputFile(f, filename=f"quiz_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M')}.json"),
-            caption=f"📦 {len(qs)} سؤال — {datetime.now(timezone.utc).strftime('%Y-%m-%d')}",
-        )
-    os.unlink(tmp)
+    try:
+        with open(tmp, "rb") as f:
+            await context.bot.send_document(
+                chat_id=q.message.chat_id,
+                document=InputFile(f, filename=exporter.filename(fmt)),
+                caption=f"📦 {count} سؤال — {datetime.now(timezone.utc).strftime('%Y-%m-%d')}",
+            )
+    finally:
+        os.unlink(tmp)
     await context.bot.send_message(chat_id=q.message.chat_id, text="✅ تم التصدير.", reply_markup=main_keyboard())
 
 
+async def import_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ALLOWED_USER_ID:
+        return
+    context.user_data["await_import"] = True
+    await update.message.reply_text(
+        "📥 أرسل ملف الأسئلة الآن (JSON / NDJSON / CSV، ويقبل .gz).\n"
+        "الأعمدة: text, options, correct_index, explanation, tags, priority",
+    )
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """استيراد جماعي: تحليل متدفق + extract_options بالتوازي + إدراج بدفعات ثم إعادة بناء الفهرس مرة واحدة."""
+    if update.effective_user.id != ALLOWED_USER_ID:
+        return
+    msg = update.message
+    if not (context.user_data.pop("await_import", False) or (msg.caption or "").startswith("/import")):
+        return
+    status = await msg.reply_text("📥 جاري الاستيراد…")
+    tmp    = tempfile.NamedTemporaryFile(delete=False).name
+    try:
+        await (await msg.document.get_file()).download_to_drive(tmp)
+        texts = [q.text for q in await _cache.get()]
+        stats = await importer.run_import(importer.iter_records(importer.file_chunks(tmp)), texts, db.bulk_add)
+    finally:
+        os.unlink(tmp)
+        await _cache.resync()
+    head = f"⚠️ *توقف الاستيراد:* {stats['error']}" if stats["error"] else "✅ *تم الاستيراد*"
+    await status.edit_text(
+        f"{head}\n➕ أُضيف: *{stats['added']}*\n♻️ مكرر: *{stats['duplicates']}*\n"
+        f"⚠️ غير صالح: *{stats['invalid']}*\n📄 المقروء: *{stats['read']}*",
+        parse_mode=ParseMode.MARKDOWN,
+    )
+
+
+async def dedupe_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تمرير لمرة واحدة يجمع التكرار المخزّن قبل تفعيل الكشف عند الالتقاط ويدمجه."""
+    if update.effective_user.id != ALLOWED_USER_ID:
+        return
+    res = await db.merge_duplicates()
+    await update.message.reply_text(
+        f"♻️ *دمج المكرر*\n🧩 مجموعات: *{res['clusters']}*\n🗑️ بطاقات مدموجة: *{res['merged']}*",
+        parse_mode=ParseMode.MARKDOWN,
+    )
+
+
 async def menu_clear(update, context):
     q = update.callback_query
     await q.answer()
@@ -937,18 +1249,27 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     raw      = msg.text
     is_error = any(m in raw for m in ["#خطأ", "#غلط", "#weak", "#ضعيف"])
-    cleaned  = clean_text(raw)
     for marker in ["#خطأ", "#غلط", "#weak", "#ضعيف"]:
-        cleaned = cleaned.replace(marker, "").strip()
+        raw = raw.replace(marker, "")
 
-    q_text, opts, cidx, expl = extract_options(cleaned)
+    q_text, opts, cidx, expl = parse_message(raw)
     obj = Question(
         text=q_text, options=opts, correct_index=cidx, explanation=expl,
         priority="urgent" if (msg.forward_date or is_error) else "normal",
         tags=["weak"] if is_error else [],
         auto_captured=bool(msg.forward_date),
     )
-    qid   = await db.add_question(obj)
+    # المحوَّل قد يكون إعادة نشر لسؤال محفوظ: يُدمج فيه بدل صف جديد
+    if msg.forward_date:
+        qid, dup = await db.add_or_merge(obj)
+    else:
+        qid, dup = await db.add_question(obj), None
+    if dup:
+        await msg.reply_text(
+            f"♻️ *مكرر* — دُمج في السؤال #️⃣{qid} ({'مطابق' if dup == 'exact' else 'مشابه'})",
+            parse_mode=ParseMode.MARKDOWN,
+        )
+        return
 
     # تعديل هنا: استخدام إضافة نصوص بدلاً من f-string مع \n
     reply = f"✅ *تم الحفظ!* #️⃣{qid} | {priority_text(obj.priority)}\n"
@@ -972,8 +1293,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode=ParseMode.MARKDOWN,
         )
         return
-    cleaned               = clean_text(caption)
-    q_text, opts, cidx, expl = extract_options(cleaned)
+    q_text, opts, cidx, expl = parse_message(caption)
     obj = Question(
         text=q_text, options=opts, correct_index=cidx,
         explanation=expl, priority="normal", auto_captured=True,
@@ -1021,7 +1341,7 @@ async def wrong_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     raw = rep.text or rep.caption or ""
     if not raw:
         await update.message.reply_text("❌ الرسالة لا تحتوي على نص."); return
-    q_text, opts, cidx, expl = extract_options(clean_text(raw))
+    q_text, opts, cidx, expl = parse_message(raw)
     obj = Question(
         text=q_text, options=opts, correct_index=cidx, explanation=expl,
         priority="urgent", tags=["weak"], auto_captured=True,
@@ -1030,19 +1350,48 @@ async def wrong_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"✅ *تم حفظ السؤال كـ ضعيف!* #️⃣{qid}", parse_mode=ParseMode.MARKDOWN)
 
 
+SEARCH_PAGE = 10
+
+
+async def _search_page(term: str, page: int) -> Tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    results = await db.search(term, limit=SEARCH_PAGE + 1, offset=page * SEARCH_PAGE)
+    if not results:
+        return None, None
+    lines = [f"🔍 *نتائج* (صفحة {page + 1}):\n"]
+    for item, snip in results[:SEARCH_PAGE]:
+        short = (snip or item.text).replace("\n", " ")[:90]
+        lines.append(f"*#{item.id}* — {short}")
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("➡️ السابق", callback_data=f"search_page_{page - 1}"))
+    if len(results) > SEARCH_PAGE:
+        nav.append(InlineKeyboardButton("التالي ⬅️", callback_data=f"search_page_{page + 1}"))
+    return "\n".join(lines), InlineKeyboardMarkup([nav]) if nav else None
+
+
 async def search_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ALLOWED_USER_ID:
         return
     if not context.args:
         await update.message.reply_text("اكتب: `/search كلمة`", parse_mode=ParseMode.MARKDOWN); return
-    results = await db.search(" ".join(context.args))
-    if not results:
+    term = " ".join(context.args)
+    context.user_data["search_term"] = term
+    text, kb = await _search_page(term, 0)
+    if not text:
         await update.message.reply_text("❌ لا نتائج."); return
-    lines = [f"🔍 *نتائج:*\n"]
-    for item in results[:15]:
-        short = item.text.replace("\n", " ")[:70]
-        lines.append(f"*#{item.id}* — {short}{'…' if len(item.text) > 70 else ''}")
-    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+    await update.message.reply_text(text, reply_markup=kb, parse_mode=ParseMode.MARKDOWN)
+
+
+async def search_page(update, context):
+    q = update.callback_query
+    await q.answer()
+    term = context.user_data.get("search_term")
+    if not term:
+        await q.edit_message_text("🔍 أرسل `/search كلمة` من جديد.", parse_mode=ParseMode.MARKDOWN); return
+    text, kb = await _search_page(term, int(q.data.rsplit("_", 1)[1]))
+    if not text:
+        await q.edit_message_text("❌ لا نتائج إضافية."); return
+    await q.edit_message_text(text, reply_markup=kb, parse_mode=ParseMode.MARKDOWN)
 
 
 async def delete_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1107,11 +1456,10 @@ async def weak_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def send_daily_report(context: ContextTypes.DEFAULT_TYPE):
     try:
         stats  = await db.get_stats()
-        all_qs = await _cache.get()
-        pred   = predict_score(all_qs)
-        dates  = [d for q in all_qs for d in (q.review_dates or [])]
-        streak = calculate_streak(dates)
-        lv     = get_level_info(sum(q.total_reviews or 0 for q in all_qs))
+        streak = await db.get_streak()
+        totals = await _cache.get_totals()
+        pred   = predict_score(totals)
+        lv     = get_level_info(totals["reviews"])
         text   = (
             f"🌅 *تقرير الصباح — {datetime.now(timezone.utc).strftime('%Y/%m/%d')}*\n\n"
             f"{lv['badge']} المستوى: *{lv['level']}*\n"
@@ -1160,6 +1508,11 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 # ═══════════════════════════════════════════════════
 async def main():
     await init_db()
+    # قناة الإبطال تُفتح قبل التحميل: ما يُكتب بينهما يصل كدلتا، فلا فجوة
+    feed = ChangeFeed(engine.url.database) if IS_SQLITE and engine.url.database not in (None, "", ":memory:") else None
+    if feed:
+        await feed.open()
+    await _cache.resync()
     app = Application.builder().token(BOT_TOKEN).build()
 
     # ── ConversationHandler ───────────────────────
@@ -1171,7 +1524,8 @@ async def main():
         ("ping",   ping_cmd),   ("wrong",  wrong_cmd),
         ("search", search_cmd), ("delete", delete_cmd),
         ("tag",    tag_cmd),    ("list",   list_cmd),
-        ("weak",   weak_cmd),
+        ("weak",   weak_cmd),   ("import", import_cmd),
+        ("dedupe", dedupe_cmd),
     ]:
         app.add_handler(CommandHandler(cmd, fn))
 
@@ -1179,6 +1533,7 @@ async def main():
     for pattern, fn in [
         (r"^opt_\d+_\d+$",    quiz_option),
         (r"^skip_\d+$",       quiz_skip),
+        (r"^search_page_\d+$", search_page),
         (r"^tag_.+$",         quiz_tag_selected),
         (r"^next_question$",  _next_question),
         (r"^end_quiz$",       quiz_end),
@@ -1191,6 +1546,7 @@ async def main():
         (r"^menu_stats$",     menu_stats),
         (r"^menu_level$",     menu_level),
         (r"^menu_export$",    menu_export),
+        (r"^export_\w+$",     export_run),
         (r"^menu_clear$",     menu_clear),
         (r"^menu_back$",      menu_back),
         (r"^clear_(yes|no)$", clear_decision),
@@ -1200,6 +1556,7 @@ async def main():
 
     # ── رسائل ─────────────────────────────────────
     app.add_handler(MessageHandler(filters.POLL,                              handle_poll))
+    app.add_handler(MessageHandler(filters.Document.ALL,                      handle_document))
     app.add_handler(MessageHandler(filters.PHOTO,                             handle_photo))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND,           handle_message))
 
@@ -1217,7 +1574,13 @@ async def main():
     )
 
     logger.info("🚀 Quiz Master Pro 2026 — Started")
-    await app.run_polling(drop_pending_updates=True)
+    if feed:
+        feed.start(_cache.apply_changes)
+    try:
+        await app.run_polling(drop_pending_updates=True)
+    finally:
+        if feed:
+            await feed.stop()
 
-        if __name__ == "__main__":
+if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -2,93 +2,280 @@
 Mini App API — FastAPI
 شغّله: uvicorn mini_app.main:app --host 0.0.0.0 --port 8080 --reload
 """
-import os, sys
+import base64, hashlib, json, os, sys, time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime, timezone
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Awaitable, Callable, Optional, List
 
+from core.changes import ChangeFeed
 from core.database import db
 from core.quiz_engine import engine, get_next_question, get_level_info
 from core.analytics_engine import analytics
+from core import exporter, importer
+from core.models import Question
 
-app = FastAPI(title="Quiz Master Pro", version="2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.init()
+    feed = app.state.feed = ChangeFeed(db.path)   # فهرس التكرار يتبع كتابات الصائد/البوت؛ الحمولات تتبع data_version
+    await feed.open()
+    feed.start(db.apply_changes)
+    try:
+        yield
+    finally:
+        await feed.stop()
+        await db.close()
+
+app = FastAPI(title="Quiz Master Pro", version="2.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"],
                    allow_methods=["*"], allow_headers=["*"])
 
 STATIC = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=STATIC), name="static")
 
+# ── تخزين الاستجابات: ETag قوي (تجزئة المحتوى) + 304، والحمولة محفوظة حتى تتغير نسخة البيانات ──
+PAYLOAD_CACHE = int(os.environ.get("PAYLOAD_CACHE", "256"))
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    tags = request.headers.get("if-none-match", "")
+    return tags.strip() == "*" or etag in (t.strip() for t in tags.split(","))
+
+def _respond(request: Request, body: bytes, etag: str, media_type: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}      # يُخزَّن في المتصفح ويُعاد التحقق كل مرة
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+class _PayloadCache:
+    """(المسار، المعاملات، شريحة الوقت) ← (etag، جسم JSON) لنسخة بيانات واحدة؛ أي كتابة تفرغه."""
+    def __init__(self, size: int = PAYLOAD_CACHE):
+        self.size, self.version = size, None
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, version: int, key: tuple):
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+            return None
+        hit = self._items.get(key)
+        if hit is not None:
+            self._items.move_to_end(key)
+        return hit
+
+    def put(self, key: tuple, value: tuple):
+        self._items[key] = value
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+_payloads = _PayloadCache()
+
+async def _cached(request: Request, compute: Callable[[], Awaitable[Any]], bucket: int = 0) -> Response:
+    """
+    bucket>0 للحمولات التي تتغير مع الوقت دون كتابة (المستحق، السلسلة): تُعاد حسابها مرة كل bucket ثانية على الأكثر.
+    """
+    version = await db.data_version()
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())),
+           int(time.time() // bucket) if bucket else 0)
+    hit = _payloads.get(version, key)
+    if hit is None:
+        _payloads.misses += 1
+        body = json.dumps(jsonable_encoder(await compute()), ensure_ascii=False, separators=(",", ":")).encode()
+        hit = (_etag(body), body)
+        _payloads.put(key, hit)
+    else:
+        _payloads.hits += 1
+    return _respond(request, hit[1], hit[0], "application/json")
+
+_index: Optional[tuple] = None
+
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    with open(os.path.join(STATIC,"index.html"),"r",encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+async def root(request: Request):
+    """index.html من الذاكرة (يُقرأ مرة واحدة)."""
+    global _index
+    if _index is None:
+        with open(os.path.join(STATIC,"index.html"),"rb") as f:
+            body = f.read()
+        _index = (_etag(body), body)
+    return _respond(request, _index[1], _index[0], "text/html; charset=utf-8")
 
-@app.get("/api/questions")
-async def get_questions(mode: str="all", tag: Optional[str]=None, limit: int=20):
-    all_q = await db.all_questions()
-    if tag:
-        all_q = [q for q in all_q if tag in q.tags]
-    now = datetime.now(timezone.utc).isoformat()
-    if mode == "due":
-        all_q = [q for q in all_q if q.next_review and q.next_review <= now]
-    elif mode == "weak":
-        all_q = sorted(all_q, key=lambda q: q.ease_factor)
-    return [{
+def _card(q: Question) -> dict:
+    return {
         "id": q.id, "text": q.text, "options": q.options,
         "correct_index": q.correct_index, "explanation": q.explanation,
         "tags": q.tags, "priority": q.priority, "ease_factor": q.ease_factor,
         "total_reviews": q.total_reviews, "streak": q.streak,
         "auto_captured": q.auto_captured,
-    } for q in all_q[:limit]]
+    }
+
+@app.get("/api/questions")
+async def get_questions(request: Request, mode: str="all", tag: Optional[str]=None, limit: int=20):
+    async def compute():
+        return [_card(q) for q in await db.get_questions(mode, tag, max(1, min(limit, 200)))]
+    return await _cached(request, compute, 60 if mode == "due" else 0)
+
+def _encode_cursor(mode: str, tag: Optional[str], key: Optional[list]) -> Optional[str]:
+    if key is None:
+        return None
+    raw = json.dumps([mode, tag or "", key], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, mode: str, tag: Optional[str]) -> list:
+    try:
+        m, t, key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(400, "مؤشر غير صالح")
+    if (m, t) != (mode, tag or "") or not isinstance(key, list):
+        raise HTTPException(400, "المؤشر لا يطابق الوضع/الوسم")
+    return key
+
+@app.get("/api/session")
+async def get_session(mode: str="all", tag: Optional[str]=None, limit: int=20, cursor: Optional[str]=None):
+    """
+    دفعة البطاقات التالية للوضع/الوسم مع مؤشر للمتابعة — العميل يحتفظ بطابور محلي ويعيد تعبئته بالخلفية.
+    cursor=null في الرد يعني نهاية التمريرة (الطلب التالي بلا مؤشر يبدأ تمريرة جديدة).
+    """
+    key = _decode_cursor(cursor, mode, tag) if cursor else None
+    try:
+        rows, nxt = await db.get_session(mode, tag, max(1, min(limit, 100)), key)
+    except ValueError:
+        raise HTTPException(400, "مؤشر غير صالح")
+    return {"cards": [_card(q) for q in rows], "cursor": _encode_cursor(mode, tag, nxt)}
 
 class ReviewPayload(BaseModel):
     question_id: int
-    quality: int
+    quality: int = Field(ge=0, le=5)
     timestamp: Optional[str] = None
+    client_key: Optional[str] = Field(default=None, max_length=64)
+
+def _replica_card(q: Question) -> dict:
+    """بطاقة النسخة المحلية: حقول العرض + حقول الجدولة التي يرتب بها العميل دون اتصال."""
+    return {**_card(q), "next_review": q.next_review or None, "interval": q.interval,
+            "repetitions": q.repetitions, "correct_count": q.correct_count, "wrong_count": q.wrong_count}
+
+@app.get("/api/changes")
+async def get_changes(since: int=0, limit: int=500):
+    """
+    دلتا للنسخة المحلية في IndexedDB: upserts (بطاقات كاملة) وdeletes (معرّفات) منذ التسلسل since.
+    يكرر العميل الطلب بـ cursor حتى more=false؛ reset=true يعني امسح النسخة وابدأ من 0.
+    """
+    ch = await db.get_changes(max(0, since), max(1, min(limit, 2000)))
+    return {**ch, "upserts": [_replica_card(q) for q in ch["upserts"]]}
 
 @app.post("/api/review")
 async def submit_review(p: ReviewPayload):
-    q = await db.get_question(p.question_id)
-    if not q:
+    res = (await db.apply_reviews([p.model_dump()], engine.replay))[0]
+    if res["status"] == "missing":
         raise HTTPException(404, "السؤال غير موجود")
-    updated = engine.review(q, p.quality)
-    await db.update_question(updated)
-    return {"success": True, "next_review": updated.next_review,
-            "streak": updated.streak, "ease_factor": round(updated.ease_factor,2)}
+    return {"success": True, "duplicate": res["status"] == "duplicate", "stale": res["status"] == "stale",
+            "next_review": res.get("next_review"), "streak": res.get("streak"),
+            "ease_factor": res.get("ease_factor")}
+
+class SyncItem(BaseModel):
+    question_id: int
+    quality: int = Field(ge=0, le=5)
+    timestamp: Optional[str] = None
+    client_key: Optional[str] = Field(default=None, max_length=64)
 
 class SyncPayload(BaseModel):
-    items: List[dict]
+    items: List[Any]        # كل عنصر يُتحقق منه على حدة: عنصر تالف لا يُسقط الدفعة كلها
 
 @app.post("/api/sync")
 async def sync_offline(p: SyncPayload):
-    synced = 0
-    for item in p.items:
+    valid, results = [], [None] * len(p.items)
+    for i, raw in enumerate(p.items):
         try:
-            q = await db.get_question(item["question_id"])
-            if q:
-                await db.update_question(engine.review(q, item["quality"]))
-                synced += 1
-        except: continue
-    return {"synced": synced, "total": len(p.items)}
+            valid.append((i, SyncItem.model_validate(raw).model_dump()))
+        except ValidationError as e:
+            results[i] = {"client_key": raw.get("client_key") if isinstance(raw, dict) else None,
+                          "status": "invalid", "error": e.errors()[0]["msg"]}
+    applied = await db.apply_reviews([it for _, it in valid], engine.replay)
+    for (i, _), res in zip(valid, applied):
+        results[i] = res
+    return {"synced": sum(r["status"] == "applied" for r in results),
+            "total": len(p.items), "results": results}
 
 @app.get("/api/analytics")
-async def get_analytics():
-    return analytics.get_full_report(await db.all_questions())
+async def get_analytics(request: Request, full: bool=False):
+    """من العدادات الجارية؛ full=true يعيد الحساب من البنك كاملاً للتحقق (لقطة NumPy إن توفرت)."""
+    async def compute():
+        if full:
+            snap = await db.snapshot()
+            if snap is not None:
+                return analytics.snapshot_report(snap, await db.get_streak())
+            return analytics.get_full_report(await db.all_questions(), await db.get_streak())
+        return analytics.report(await db.get_analytics_state(), await db.get_streak())
+    return await _cached(request, compute, 60)
+
+@app.get("/api/analytics/cards")
+async def get_card_stats(request: Request, k: int=5):
+    """الأضعف k وتوزيع السهولة وعدد المستحق — مرور كامل، متجه على اللقطة إن توفر NumPy."""
+    k = max(1, min(k, 100))
+    async def compute():
+        snap = await db.snapshot()
+        if snap is not None:
+            return analytics.snapshot_cards(snap, k)
+        return analytics.card_stats(await db.all_questions(), k)
+    return await _cached(request, compute, 60)
+
+@app.get("/api/heatmap")
+async def get_heatmap(days: int=90):
+    return await db.get_heatmap(max(1, min(days, 366)))
+
+@app.get("/api/questions/{qid}/history")
+async def get_history(qid: int, limit: int=100):
+    return [{"ts": e.ts.isoformat(), "quality": e.quality,
+             "interval_before": e.interval_before, "interval_after": e.interval_after}
+            for e in await db.get_history(qid, max(1, min(limit, 1000)))]
+
+@app.get("/api/export")
+async def export_bank(fmt: str="ndjson"):
+    if fmt not in exporter.available_formats():
+        raise HTTPException(400, f"الصيغ المتاحة: {', '.join(exporter.available_formats())}")
+    return StreamingResponse(
+        exporter.stream(db.iter_pages(exporter.EXPORT_CHUNK), fmt), media_type=exporter.FORMATS[fmt][0],
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename(fmt)}"'},
+    )
+
+@app.post("/api/import")
+async def import_bank(request: Request, fmt: Optional[str]=None):
+    """الملف في جسم الطلب مباشرة (JSON/NDJSON/CSV، gzip/zstd اختياري) — يُحلَّل أثناء الاستلام."""
+    async def insert(rows):
+        await db.bulk_add([Question(id=0, **{**r, "explanation": r["explanation"] or ""}) for r in rows])
+    stats = await importer.run_import(importer.iter_records(request.stream(), fmt), await db.all_texts(), insert)
+    # ملف مرفوض من البداية ← 400؛ توقف بعد إدراج دفعات ← 200 مع الأعداد الجزئية وسبب التوقف
+    if stats["error"] and not stats["added"]:
+        raise HTTPException(400, stats["error"])
+    return stats
+
+@app.post("/api/dedupe")
+async def dedupe_bank():
+    """تمرير لمرة واحدة: دمج التكرار المخزّن قبل تفعيل الكشف عند الالتقاط."""
+    return await db.merge_duplicates()
 
 @app.get("/api/stats")
-async def get_stats():
-    return await db.get_stats()
+async def get_stats(request: Request):
+    return await _cached(request, db.get_stats, 60)
 
-@app.get("/api/tags")
-async def get_tags():
-    return await db.get_all_tags()
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    """الكاتب الجماعي (عمق الطابور، حجم الدفعة، زمن التثبيت) + ذاكرة الحمولات + قناة التغييرات."""
+    feed = getattr(request.app.state, "feed", None)
+    return {"writer": db.pool.write_metrics(),
+            "payload_cache": {"hits": _payloads.hits, "misses": _payloads.misses, "items": len(_payloads._items)},
+            "change_feed": feed.stats if feed else {}}
 
-@app.on_event("startup")
-async def startup():
-    await db.init()
+@app.get("/api/tags")
+async def get_tags(request: Request, counts: bool=False):
+    return await _cached(request, db.get_tag_counts if counts else db.get_all_tags)
@@ -9,7 +9,7 @@ if ('serviceWorker' in navigator) {
   });
 }
 
-window.addEventListener('online',  () => { isOnline=true;  toggleBanner(true);  syncQueue(); });
+window.addEventListener('online',  () => { isOnline=true;  toggleBanner(true);  syncQueue().then(pullChanges); });
 window.addEventListener('offline', () => { isOnline=false; toggleBanner(false); });
 
 function toggleBanner(online) {
@@ -66,16 +66,57 @@ function prioTxt(p) {
   return {urgent:'🔥 عاجل',normal:'⚡ متوسط',low:'📖 عادي'}[p]||p;
 }
 
+// طابور الجلسة: دفعة من /api/session تُستهلك محلياً وتُعبّأ بالخلفية حين تقل عن SESSION_LOW
+const SESSION_BATCH = 20, SESSION_LOW = 5;
+const session = {key: null, cards: [], cursor: null, done: false, inflight: null};
+
+function refillSession() {
+  if (session.inflight || session.done) return session.inflight;
+  const key = session.key, [mode, tag] = key.split('|');
+  if (replica.ready) {                                // تمريرة كاملة من النسخة المحلية — بلا شبكة
+    const queued = new Set(session.cards.map(q => q.id));
+    session.cards.push(...localPass(mode, tag).filter(q => !queued.has(q.id) && q.id !== currentQ?.id));
+    session.done = true;
+    return null;
+  }
+  const url = '/api/session?mode='+mode+'&limit='+SESSION_BATCH+(tag?'&tag='+encodeURIComponent(tag):'')
+            + (session.cursor?'&cursor='+session.cursor:'');
+  session.inflight = api(url).then(r => {
+    if (session.key !== key) return;                  // تغيّر الوضع أثناء الطلب
+    session.inflight = null;
+    if (!r?.cards) { session.done = true; return; }
+    const queued = new Set(session.cards.map(q => q.id));
+    session.cards.push(...r.cards.filter(q => !queued.has(q.id) && q.id !== currentQ?.id));
+    session.cursor = r.cursor;
+    session.done   = !r.cursor;
+  });
+  return session.inflight;
+}
+
+async function nextCard() {
+  const key = document.getElementById('quizMode').value+'|'+document.getElementById('quizTag').value;
+  if (session.key !== key) Object.assign(session, {key, cards: [], cursor: null, done: false, inflight: null});
+  if (!session.cards.length) {
+    if (session.done) {                                                    // تمريرة جديدة
+      Object.assign(session, {cursor: null, done: false});
+      pullChanges();
+    }
+    await refillSession();
+  }
+  const q = session.cards.shift() || null;
+  if (session.cards.length < SESSION_LOW) refillSession();
+  return q;
+}
+
 async function loadNextQuestion() {
-  const mode = document.getElementById('quizMode').value;
-  const tag  = document.getElementById('quizTag').value;
-  const data = await api('/api/questions?mode='+mode+'&limit=1'+(tag?'&tag='+tag:''));
-  const box  = document.getElementById('quizContainer');
-  if (!data||!data.length) {
+  const q   = await nextCard();
+  const box = document.getElementById('quizContainer');
+  if (!q) {
+    currentQ = null;
     box.innerHTML = '<div class="card" style="text-align:center;padding:40px"><div style="font-size:48px">🎉</div><p style="margin-top:12px">لا توجد أسئلة في هذا الوضع!</p></div>';
     return;
   }
-  currentQ = data[0];
+  currentQ = q;
   renderQuiz(currentQ, box);
 }
 
@@ -121,10 +162,79 @@ function checkAns(idx, btn) {
   if (rBtns) rBtns.style.display='grid';
 }
 
+// مفتاح فريد لكل مراجعة: يمنع تطبيقها مرتين إذا أُعيد إرسالها من طابور الـ offline
+function reviewItem(question_id, quality) {
+  return {question_id, quality, timestamp: new Date().toISOString(), client_key: crypto.randomUUID()};
+}
+
+// ── النسخة المحلية: كل البنك في IndexedDB، يُحدَّث بدلتا /api/changes (upserts + tombstones) ──
+const replica = {cards: new Map(), cursor: 0, ready: false, pulling: null};
+
+// نفس ترتيب الخادم (get_session): due/urgent بالموعد، weak بالسهولة ثم الأخطاء، all بالمعرّف
+const LOCAL_ORDER = {
+  due:    (a,b) => cmp(a.next_review,b.next_review) || a.id-b.id,
+  urgent: (a,b) => cmp(a.next_review,b.next_review) || a.id-b.id,
+  weak:   (a,b) => a.ease_factor-b.ease_factor || b.wrong_count-a.wrong_count || a.id-b.id,
+};
+function cmp(a,b) { return a===b ? 0 : a==null ? -1 : b==null ? 1 : a<b ? -1 : 1; }
+
+function localPass(mode, tag) {
+  const now = new Date().toISOString();
+  let pool = [...replica.cards.values()];
+  if (mode==='due')    pool = pool.filter(q => q.next_review && q.next_review <= now);
+  if (mode==='urgent') pool = pool.filter(q => q.priority==='urgent');
+  if (tag)             pool = pool.filter(q => q.tags?.includes(tag));
+  return pool.sort(LOCAL_ORDER[mode] || ((a,b) => a.id-b.id));
+}
+
+async function loadReplica() {
+  try {
+    const db = await openIDB();
+    const [cards, cursor] = await Promise.all([
+      idbRequest(db.transaction('questions','readonly').objectStore('questions').getAll()),
+      idbRequest(db.transaction('meta','readonly').objectStore('meta').get('cursor')),
+    ]);
+    cards.forEach(q => replica.cards.set(q.id, q));
+    replica.cursor = cursor || 0;
+    replica.ready  = replica.cursor > 0;
+  } catch {}
+}
+
+// صفحات الدلتا حتى more=false؛ كل صفحة في معاملة واحدة مع المؤشر فلا تُطبّق نصف صفحة
+function pullChanges() {
+  if (replica.pulling) return replica.pulling;
+  replica.pulling = (async () => {
+    try {
+      const db = await openIDB();
+      for (;;) {
+        const r = await api('/api/changes?since='+replica.cursor+'&limit=500');
+        if (!r || !r.cursor && !r.reset) break;
+        const tx = db.transaction(['questions','meta'],'readwrite');
+        const qs = tx.objectStore('questions');
+        if (r.reset) { qs.clear(); replica.cards.clear(); }
+        r.upserts.forEach(q => { qs.put(q); replica.cards.set(q.id, q); });
+        r.deletes.forEach(id => { qs.delete(id); replica.cards.delete(id); });
+        tx.objectStore('meta').put(r.cursor, 'cursor');
+        await new Promise((res,rej) => { tx.oncomplete = res; tx.onerror = () => rej(tx.error); });
+        replica.cursor = r.cursor;
+        if (!r.more && !r.reset) break;
+      }
+      replica.ready = replica.cursor > 0;
+    } catch {} finally { replica.pulling = null; }
+  })();
+  return replica.pulling;
+}
+
+function idbRequest(req) {
+  return new Promise((res,rej) => { req.onsuccess = () => res(req.result); req.onerror = () => rej(req.error); });
+}
+
 async function submitReview(quality) {
   if (!currentQ) return;
-  const r = await api('/api/review','POST',{question_id:currentQ.id,quality});
+  const r = await api('/api/review','POST',reviewItem(currentQ.id, quality));
   const labels = ['Again','','','Hard','Good','Easy'];
+  const local  = replica.cards.get(currentQ.id);     // حتى الدلتا التالية
+  if (local && r?.next_review) Object.assign(local, {next_review: r.next_review, ease_factor: r.ease_factor ?? local.ease_factor});
   if (r?.offline) toast('📴 '+labels[quality]+' — سيُزامَن لاحقاً');
   else toast('✅ '+(labels[quality]||'') + ' — التالي: '+(r?.next_review?.slice(0,10)||'قريباً'));
   setTimeout(() => loadNextQuestion(), 700);
@@ -159,8 +269,8 @@ async function loadFlashcards() {
         const diff = s.touches.startX - s.touches.currentX;
         const q    = data[s.previousIndex];
         if (!q) return;
-        if (diff > 60)  { api('/api/review','POST',{question_id:q.id,quality:0}); toast('❌ صعب — سيُراجع غداً'); }
-        if (diff < -60) { api('/api/review','POST',{question_id:q.id,quality:5}); toast('✅ سهل — مؤجّل!'); }
+        if (diff > 60)  { api('/api/review','POST',reviewItem(q.id,0)); toast('❌ صعب — سيُراجع غداً'); }
+        if (diff < -60) { api('/api/review','POST',reviewItem(q.id,5)); toast('✅ سهل — مؤجّل!'); }
       }
     }
   });
@@ -187,39 +297,65 @@ async function loadAnalytics() {
     </div>`).join('');
 }
 
+// حالات نهائية: تُحذف من الطابور. ما أُضيف أثناء الطلب يبقى للمزامنة التالية
+const SYNC_DONE = new Set(['applied','stale','duplicate','missing','invalid']);
+
 async function syncQueue() {
   try {
-    const db    = await openIDB();
-    const items = await getAllIDB(db);
-    if (!items.length) return;
-    const r = await api('/api/sync','POST',{items});
-    if (r?.synced > 0) {
-      toast('✅ مزامنة '+r.synced+' مراجعة');
-      db.transaction('pending_reviews','readwrite').objectStore('pending_reviews').clear();
-    }
+    const db      = await openIDB();
+    const entries = await getAllIDB(db);
+    if (!entries.length) return;
+    const r = await api('/api/sync','POST',{items: entries.map(e => e.value)});
+    if (!r?.results) return;
+    const done = entries.filter((e,i) => SYNC_DONE.has(r.results[i]?.status)).map(e => e.key);
+    await deleteIDB(db, done);
+    if (r.synced > 0) toast('✅ مزامنة '+r.synced+' مراجعة');
   } catch {}
 }
 
 function openIDB() {
   return new Promise((res,rej) => {
-    const req = indexedDB.open('quiz_offline',1);
-    req.onupgradeneeded = () => req.result.createObjectStore('pending_reviews',{autoIncrement:true});
+    const req = indexedDB.open('quiz_offline',2);     // 2: questions + meta للنسخة المحلية (مثل sw.js)
+    req.onupgradeneeded = () => {
+      const db = req.result;
+      if (!db.objectStoreNames.contains('pending_reviews')) db.createObjectStore('pending_reviews',{autoIncrement:true});
+      if (!db.objectStoreNames.contains('questions'))       db.createObjectStore('questions',{keyPath:'id'});
+      if (!db.objectStoreNames.contains('meta'))            db.createObjectStore('meta');
+    };
     req.onsuccess = () => res(req.result);
     req.onerror   = () => rej(req.error);
   });
 }
 function getAllIDB(db) {
   return new Promise(res => {
-    const req = db.transaction('pending_reviews','readonly').objectStore('pending_reviews').getAll();
-    req.onsuccess = () => res(req.result||[]);
+    const out = [];
+    const req = db.transaction('pending_reviews','readonly').objectStore('pending_reviews').openCursor();
+    req.onsuccess = () => {
+      const c = req.result;
+      if (!c) return res(out);
+      out.push({key: c.key, value: c.value});
+      c.continue();
+    };
+    req.onerror = () => res(out);
+  });
+}
+function deleteIDB(db, keys) {
+  return new Promise(res => {
+    if (!keys.length) return res();
+    const tx    = db.transaction('pending_reviews','readwrite');
+    const store = tx.objectStore('pending_reviews');
+    keys.forEach(k => store.delete(k));
+    tx.oncomplete = tx.onerror = () => res();
   });
 }
 
 (async () => {
   if (!navigator.onLine) toggleBanner(false);
-  const tags = await api('/api/tags');
+  await loadReplica();
+  pullChanges();
+  const tags = await api('/api/tags') || [...new Set([...replica.cards.values()].flatMap(q => q.tags||[]))].sort();
   const sel  = document.getElementById('quizTag');
-  (tags||[]).forEach(t => {
+  tags.forEach(t => {
     const o = document.createElement('option');
     o.value=t; o.textContent='🏷️ '+t; sel.appendChild(o);
   });
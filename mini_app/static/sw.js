@@ -1,8 +1,11 @@
-const CACHE_NAME = 'quiz-pwa-v2';
+const CACHE_NAME = 'quiz-pwa-v6';
 const OFFLINE_URLS = ['/', '/static/index.html', '/static/app.js', '/static/manifest.json'];
 const SYNC_TAG = 'quiz-sync';
 const DB_NAME = 'quiz_offline';
 const STORE_NAME = 'pending_reviews';
+const DB_VERSION = 2;   // 2: نسخة البنك المحلية (questions + meta) — يجب أن يطابق app.js
+// حالات نهائية: تُحذف من الطابور. ما أُضيف أثناء الطلب يبقى للمزامنة التالية
+const SYNC_DONE = new Set(['applied','stale','duplicate','missing','invalid']);
 
 self.addEventListener('install', e => {
   e.waitUntil(
@@ -33,6 +36,19 @@ self.addEventListener('fetch', e => {
     );
     return;
   }
+  // الدلتا والجلسة مرتبطتان بمؤشر: لا تُخزَّن، وفشلها دون اتصال يُعالَج في app.js
+  if (url.pathname === '/api/changes' || url.pathname === '/api/session') return;
+  // بيانات الـ API تتغير مع كل مراجعة: الشبكة أولاً والنسخة المخزنة للعمل دون اتصال فقط
+  if (url.pathname.startsWith('/api/') && e.request.method === 'GET') {
+    e.respondWith(
+      fetch(e.request).then(res => {
+        const clone = res.clone();
+        if (res.ok) caches.open(CACHE_NAME).then(c => c.put(e.request, clone));
+        return res;
+      }).catch(() => caches.match(e.request).then(r => r || Response.error()))
+    );
+    return;
+  }
   e.respondWith(
     caches.match(e.request).then(cached => cached || fetch(e.request).then(res => {
       const clone = res.clone();
@@ -48,34 +64,71 @@ self.addEventListener('sync', e => {
 
 function openDB() {
   return new Promise((res,rej) => {
-    const req = indexedDB.open(DB_NAME,1);
-    req.onupgradeneeded = () => req.result.createObjectStore(STORE_NAME,{autoIncrement:true});
+    const req = indexedDB.open(DB_NAME,DB_VERSION);
+    req.onupgradeneeded = () => upgradeDB(req.result);
     req.onsuccess = () => res(req.result);
     req.onerror   = () => rej(req.error);
   });
 }
 
+function upgradeDB(db) {
+  if (!db.objectStoreNames.contains(STORE_NAME)) db.createObjectStore(STORE_NAME,{autoIncrement:true});
+  if (!db.objectStoreNames.contains('questions')) db.createObjectStore('questions',{keyPath:'id'});
+  if (!db.objectStoreNames.contains('meta'))      db.createObjectStore('meta');
+}
+
 async function saveToQueue(data) {
   const db = await openDB();
   const tx = db.transaction(STORE_NAME,'readwrite');
-  tx.objectStore(STORE_NAME).add({...data, timestamp: new Date().toISOString()});
+  tx.objectStore(STORE_NAME).add({
+    ...data,
+    timestamp:  data.timestamp  || new Date().toISOString(),
+    client_key: data.client_key || crypto.randomUUID(),
+  });
 }
 
-async function syncReviews() {
-  const db    = await openDB();
-  const items = await new Promise(res => {
-    const req = db.transaction(STORE_NAME,'readonly').objectStore(STORE_NAME).getAll();
-    req.onsuccess = () => res(req.result);
+function readQueue(db) {
+  return new Promise(res => {
+    const out = [];
+    const req = db.transaction(STORE_NAME,'readonly').objectStore(STORE_NAME).openCursor();
+    req.onsuccess = () => {
+      const c = req.result;
+      if (!c) return res(out);
+      out.push({key: c.key, value: c.value});
+      c.continue();
+    };
+    req.onerror = () => res(out);
+  });
+}
+
+function deleteFromQueue(db, keys) {
+  return new Promise(res => {
+    if (!keys.length) return res();
+    const tx    = db.transaction(STORE_NAME,'readwrite');
+    const store = tx.objectStore(STORE_NAME);
+    keys.forEach(k => store.delete(k));
+    tx.oncomplete = tx.onerror = () => res();
   });
-  if (!items.length) return;
+}
+
+async function syncReviews() {
+  const db      = await openDB();
+  const entries = await readQueue(db);
+  if (!entries.length) return;
   try {
     const r = await fetch('/api/sync',{
       method:'POST', headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({items})
+      body: JSON.stringify({items: entries.map(e => e.value)})
     });
     if (r.ok) {
-      db.transaction(STORE_NAME,'readwrite').objectStore(STORE_NAME).clear();
-      console.log('Synced', items.length, 'reviews');
+      const {results = []} = await r.json();
+      const done = entries.filter((e,i) => SYNC_DONE.has(results[i]?.status)).map(e => e.key);
+      await deleteFromQueue(db, done);
+      console.log('Synced', done.length, 'of', entries.length, 'reviews');
+    } else if (r.status >= 400 && r.status < 500 && r.status !== 408 && r.status !== 429) {
+      // دفعة مرفوضة كلياً لن تُقبل بإعادة المحاولة — تُسقط بدل التكرار إلى الأبد
+      await deleteFromQueue(db, entries.map(e => e.key));
+      console.warn('Sync rejected', r.status, '— dropped', entries.length, 'reviews');
     }
   } catch(err) { console.error('Sync failed:',err); }
 }
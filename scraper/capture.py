@@ -0,0 +1,147 @@
+"""
+كتابة متأخرة (write-behind) لالتقاطات الصائد: المعالجات تضع السؤال في طابور محدود وتعود فوراً.
+مهمة كاتبة واحدة تفرّغ الطابور على دفعات صغيرة (N عنصر أو T ميلي ثانية، أيهما أسبق) بمعاملة واحدة لكل دفعة،
+والتنبيهات تُجمع في رسالة ملخّص يرسلها مُرسِل مستقل بمعدل أقصاه رسالة كل NOTIFY_INTERVAL.
+"""
+import asyncio, logging, os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from core.models import Question
+
+CAPTURE_QUEUE       = int(os.environ.get("CAPTURE_QUEUE", "1000"))
+CAPTURE_BATCH       = int(os.environ.get("CAPTURE_BATCH", "50"))
+CAPTURE_WAIT_MS     = int(os.environ.get("CAPTURE_WAIT_MS", "200"))
+CAPTURE_PUT_TIMEOUT = float(os.environ.get("CAPTURE_PUT_TIMEOUT", "2"))    # انتظار مكان في الطابور قبل الإسقاط
+NOTIFY_INTERVAL     = float(os.environ.get("NOTIFY_INTERVAL", "30"))
+NOTIFY_MAX_LINES    = 10
+
+logger = logging.getLogger("userbot")
+
+
+def digest_text(items: List[Tuple[int, str]]) -> str:
+    """رسالة واحدة لعدة التقاطات: سطر لكل سؤال (أول سطر من نصه) حتى NOTIFY_MAX_LINES."""
+    if len(items) == 1:
+        qid, text = items[0]
+        return f"🤖 *الصائد التقط سؤالاً خطأ!*\n🆔 #{qid}\n```\n{text[:200]}\n```"
+    lines = [f"#{qid} {(text.splitlines() or [''])[0][:80]}" for qid, text in items[:NOTIFY_MAX_LINES]]
+    more  = f"\n… و{len(items) - NOTIFY_MAX_LINES} أخرى" if len(items) > NOTIFY_MAX_LINES else ""
+    return f"🤖 *الصائد التقط {len(items)} أسئلة خطأ!*\n```\n" + "\n".join(lines) + f"\n```{more}"
+
+
+class CaptureQueue:
+    def __init__(self, db, send: Callable[[str], Awaitable[None]], maxsize: int = CAPTURE_QUEUE,
+                 batch: int = CAPTURE_BATCH, wait_ms: int = CAPTURE_WAIT_MS,
+                 put_timeout: float = CAPTURE_PUT_TIMEOUT, notify_interval: float = NOTIFY_INTERVAL):
+        self.db, self.send = db, send
+        self.batch, self.wait, self.put_timeout, self.notify_interval = batch, wait_ms / 1000, put_timeout, notify_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        # backpressure: مرات امتلاء الطابور عند الإضافة، dropped: ما أُسقط بعد انتهاء مهلة الانتظار
+        self.stats = {"queued": 0, "written": 0, "merged": 0, "failed": 0, "batches": 0,
+                      "backpressure": 0, "dropped": 0, "notified": 0, "digests": 0}
+        self._digest: List[Tuple[int, str]] = []
+        self._wake   = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._notifier_task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def submit(self, q: Question, notify: bool = False) -> bool:
+        """يضيف التقاطاً دون انتظار الكتابة؛ False إن أُسقط لأن الطابور بقي ممتلئاً."""
+        item = (q, notify)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["backpressure"] += 1
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                logger.warning(f"⚠️ طابور الالتقاط ممتلئ ({self.depth}) — أُسقط سؤال")
+                return False
+        self.stats["queued"] += 1
+        return True
+
+    def start(self):
+        self._writer_task   = asyncio.create_task(self._writer())
+        self._notifier_task = asyncio.create_task(self._notifier())
+
+    async def stop(self):
+        """إغلاق نظيف: يُكتب كل ما في الطابور ثم يُرسل آخر ملخّص."""
+        if self._writer_task is None:
+            return
+        await self.queue.put(None)
+        await self._writer_task
+        self._closed.set()
+        self._wake.set()
+        await self._notifier_task
+        self._writer_task = self._notifier_task = None
+        logger.info(f"📊 الالتقاط: {self.stats}")
+
+    # ── الكاتب ─────────────────────────────────────────
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch, done, deadline = [item], False, loop.time() + self.wait
+            while len(batch) < self.batch:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    left = deadline - loop.time()
+                    if left <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), left)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+            if done:
+                return
+
+    async def _write(self, batch: List[Tuple[Question, bool]]):
+        try:
+            results = await self.db.add_or_merge_many([q for q, _ in batch])
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error(f"❌ فشل كتابة دفعة ({len(batch)}): {e}")
+            return
+        self.stats["batches"] += 1
+        for (q, notify), (qid, dup) in zip(batch, results):
+            self.stats["merged" if dup else "written"] += 1
+            if dup:
+                logger.info(f"♻️ مكرر ({dup}) دُمج في #{qid} من {q.source_channel}")
+            else:
+                logger.info(f"📥 سؤال #{qid} من {q.source_channel}")
+            if notify:
+                self._digest.append((qid, q.text))
+        if self._digest:
+            self._wake.set()
+
+    # ── مُرسل الملخّص ──────────────────────────────────
+    async def _notifier(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            items, self._digest = self._digest, []
+            if items:
+                try:
+                    await self.send(digest_text(items))
+                    self.stats["digests"]  += 1
+                    self.stats["notified"] += len(items)
+                except Exception as e:
+                    logger.error(f"Notify error: {e}")
+            if self._closed.is_set():
+                return
+            try:                                    # حد المعدل: رسالة واحدة على الأكثر كل فترة
+                await asyncio.wait_for(self._closed.wait(), self.notify_interval)
+            except asyncio.TimeoutError:
+                pass
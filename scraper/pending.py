@@ -0,0 +1,166 @@
+"""
+الاستطلاعات المنتظرة لإجابة المستخدم: ذاكرة محدودة (LRU + TTL) فوق جدول pending_polls.
+المفتاح (chat_id, msg_id) — معرّف الرسالة وحده يتكرر بين القنوات.
+المعالجات الحيّة لا تنتظر SQLite: put_nowait و discard يعدّلان الذاكرة ويسجّلان التغيير في مخزن مؤقت،
+ومهمة تفريغ واحدة تكتبه دفعةً (معاملة واحدة) كل PENDING_FLUSH_MS. ما يُطرد من الذاكرة أو يضيع بإعادة
+التشغيل يبقى في الجدول قابلاً للاسترجاع حتى انتهاء TTL؛ stop() يفرّغ ما تبقّى قبل الإغلاق.
+"""
+import asyncio, logging, os, time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+PENDING_MAX      = int(os.environ.get("PENDING_POLLS_MAX", "2000"))          # مدخلات في الذاكرة
+PENDING_TTL      = int(os.environ.get("PENDING_POLLS_TTL", str(7 * 86400)))  # ثوانٍ
+PENDING_FLUSH_MS = int(os.environ.get("PENDING_FLUSH_MS", "200"))
+PRUNE_EVERY      = 3600
+
+Key = Tuple[int, int]
+
+logger = logging.getLogger("userbot")
+
+
+class PendingPolls:
+    def __init__(self, db, max_items: int = PENDING_MAX, ttl: int = PENDING_TTL,
+                 clock: Callable[[], float] = time.time, flush_ms: int = PENDING_FLUSH_MS):
+        self.db, self.max_items, self.ttl, self.clock = db, max_items, ttl, clock
+        self.wait = flush_ms / 1000
+        self._mem: "OrderedDict[Key, Tuple[dict, int]]" = OrderedDict()
+        # تغييرات لم تُكتب بعد: (data, created) إدراج، None حذف — آخر تغيير للمفتاح هو ما يُكتب
+        self._dirty: Dict[Key, Optional[Tuple[dict, int]]] = {}
+        self._flushing: Dict[Key, Optional[Tuple[dict, int]]] = {}      # الدفعة قيد الكتابة الآن
+        self._pruned = 0
+        self._wake   = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"flushes": 0, "written": 0, "deleted": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def __contains__(self, key: Key) -> bool:
+        hit = self._mem.get(key)
+        return hit is not None and hit[1] >= self._cutoff()
+
+    def _cutoff(self) -> int:
+        return int(self.clock()) - self.ttl
+
+    def _remember(self, key: Key, data: dict, created: int):
+        self._mem[key] = (data, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)           # يبقى في الجدول حتى TTL
+
+    async def load(self) -> int:
+        """تعبئة الذاكرة بأحدث المدخلات غير المنتهية عند الإقلاع."""
+        rows = await self.db.load_pending_polls(self._cutoff(), self.max_items)
+        for chat_id, msg_id, data, created in reversed(rows):
+            self._remember((chat_id, msg_id), data, created)
+        return len(rows)
+
+    # ── المعالجات الحيّة: بلا SQLite ───────────────────
+    def put_nowait(self, key: Key, data: dict):
+        now = int(self.clock())
+        self._remember(key, data, now)
+        self._dirty[key] = (data, now)
+        self._wake.set()
+
+    def discard(self, key: Key):
+        """أُجيب الاستطلاع: يُحذف من الذاكرة الآن ومن الجدول في التفريغ التالي."""
+        self._mem.pop(key, None)
+        self._dirty[key] = None
+        self._wake.set()
+
+    def _deleted(self, key: Key) -> bool:
+        """حذف لم يصل إلى الجدول بعد: قراءة الجدول الآن قد تعيد ما أُجيب."""
+        for changes in (self._dirty, self._flushing):
+            if key in changes:
+                return changes[key] is None
+        return False
+
+    def peek(self, key: Key) -> Tuple[bool, Optional[dict]]:
+        """(True, data|None) إن حُسم الجواب من الذاكرة؛ (False, None): قد يكون في الجدول وحده — get() يقرؤه."""
+        if self._deleted(key):
+            return True, None
+        hit = self._mem.get(key)
+        if hit is None:
+            return False, None
+        if hit[1] < self._cutoff():
+            del self._mem[key]
+            return True, None
+        self._mem.move_to_end(key)
+        return True, hit[0]
+
+    # ── التعبئة والقراءة من الجدول ─────────────────────
+    async def put_many(self, items: Iterable[Tuple[Key, dict]]):
+        """كتابة فورية (مسار التعبئة): الصفحة تُحفظ قبل تقدّم مؤشرها."""
+        now, rows = int(self.clock()), []
+        for key, data in items:
+            self._remember(key, data, now)
+            self._dirty.pop(key, None)
+            rows.append((*key, data, now))
+        await self.db.save_pending_polls(rows)
+        await self._maybe_prune(now)
+
+    async def get(self, key: Key) -> Optional[dict]:
+        known, data = self.peek(key)
+        if known:
+            return data
+        row = await self.db.get_pending_poll(*key, since=self._cutoff())
+        if row is None or self._deleted(key):       # حُذف أثناء القراءة
+            return None
+        self._remember(key, *row)
+        return row[0]
+
+    # ── التفريغ ────────────────────────────────────────
+    def start(self):
+        self._closed = False
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        """يكتب ما تبقّى في المخزن المؤقت ثم يوقف المهمة."""
+        if self._task is not None:
+            self._closed = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"🗳️ الاستطلاعات المنتظرة: {self.stats}")
+
+    async def _flusher(self):
+        while not self._closed:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._closed:
+                await asyncio.sleep(self.wait)      # تجميع ما يصل خلال النافذة في معاملة واحدة
+            await self.flush()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch = self._flushing = self._dirty
+        self._dirty = {}
+        rows    = [(*k, *v) for k, v in batch.items() if v is not None]
+        deletes = [k for k, v in batch.items() if v is None]
+        try:
+            await self.db.save_pending_polls(rows, deletes)
+        except Exception as e:
+            self._flushing = {}
+            self.stats["failed"] += 1
+            logger.error(f"❌ فشل حفظ الاستطلاعات المنتظرة ({len(batch)}): {e}")
+            for k, v in batch.items():              # يُعاد في التفريغ التالي ما لم يحلّ محله تغيير أحدث
+                self._dirty.setdefault(k, v)
+            return
+        self._flushing = {}
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(rows)
+        self.stats["deleted"] += len(deletes)
+        await self._maybe_prune(int(self.clock()))
+
+    async def _maybe_prune(self, now: int):
+        if now - self._pruned < PRUNE_EVERY:
+            return
+        self._pruned = now
+        cutoff = now - self.ttl
+        for key in [k for k, (_, t) in self._mem.items() if t < cutoff]:
+            del self._mem[key]
+        await self.db.prune_pending_polls(cutoff)
@@ -1,20 +1,32 @@
 """
 الصائد الصامت — UserBot بـ Telethon
 شغّله منفصلاً: python -m scraper.userbot
+تعبئة السجل القديم للقنوات المراقبة ثم الخروج: python -m scraper.userbot --backfill
 """
-import asyncio, logging, re, sys, os
+import asyncio, logging, re, sys, os, time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError
 from config.settings import settings
+from core.changes import ChangeFeed
 from core.database import db
 from core.models import Question
+from core.parser import LABELS
+from scraper.capture import CaptureQueue
+from scraper.pending import PendingPolls
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [USERBOT] %(message)s")
 logger = logging.getLogger("userbot")
 
 client = TelegramClient(settings.SESSION_NAME, settings.API_ID, settings.API_HASH)
-pending_polls: dict = {}
+pending_polls = PendingPolls(db)          # مفتاحه (chat_id, msg_id)، محدود في الذاكرة ومحفوظ في SQLite
+
+BACKFILL_PAGE      = int(os.environ.get("BACKFILL_PAGE", "100"))
+BACKFILL_DELAY     = float(os.environ.get("BACKFILL_DELAY", "1.0"))     # ثوانٍ بين الصفحات في الوضع العادي
+BACKFILL_MAX_DELAY = 60.0
+
+_OPTION_LINE = re.compile(r"^[أبجدهو]\)", re.MULTILINE)
 
 def clean_text(raw: str) -> str:
     lines = raw.splitlines()
@@ -30,88 +42,191 @@ def clean_text(raw: str) -> str:
         cleaned.append(line)
     return "\n".join(cleaned)
 
-async def notify_bot(text: str, qid: int):
-    try:
-        await client.send_message(
-            settings.ALLOWED_USER_ID,
-            f"🤖 *الصائد التقط سؤالاً خطأ!*\n🆔 #{qid}\n```\n{text[:200]}\n```",
-            parse_mode="markdown"
-        )
-    except Exception as e:
-        logger.error(f"Notify error: {e}")
+def poll_data(msg) -> dict:
+    """نص الاستطلاع بصيغة الأسئلة (أ) ب) …) مع خياراته والإجابة الصحيحة إن كانت معلنة."""
+    poll   = msg.poll.poll
+    lines  = [poll.question.text]
+    opts   = []
+    for i, a in enumerate(poll.answers):
+        label = LABELS[i] if i < len(LABELS) else str(i+1)
+        lines.append(f"{label}) {a.text.text}")
+        opts.append(a.text.text)
+    correct_id = getattr(msg.poll.results, "correct_option_id", None)
+    if correct_id is not None and 0 <= correct_id < len(poll.answers):
+        cl = LABELS[correct_id] if correct_id < len(LABELS) else str(correct_id+1)
+        lines.append(f"\n✅ الإجابة: {cl}) {poll.answers[correct_id].text.text}")
+    return {"text": "\n".join(lines), "options": opts, "correct_index": correct_id or 0}
+
+def answered_wrong(results):
+    """True إن اختار المستخدم خياراً خاطئاً، False إن أصاب، None إن لم يُجب (أو لا إجابة معلنة)."""
+    if not results or not results.results: return None
+    chosen = next((r for r in results.results if getattr(r,"chosen",False)), None)
+    correct_id = getattr(results, "correct_option_id", None)
+    if not chosen or correct_id is None: return None
+    return getattr(chosen, "option", None) != correct_id
+
+def text_question(msg, channel: str):
+    """سؤال نصي من رسالة القناة، أو None إن لم تبدُ سؤالاً (قصيرة أو بلا أسطر خيارات)."""
+    text = msg.text or msg.message or ""
+    if not text or len(text) < 20: return None
+    if not _OPTION_LINE.search(text): return None
+    return Question(id=0, text=clean_text(text), source_channel=channel,
+                    auto_captured=True, priority="normal")
+
+def wrong_poll_question(poll: dict, channel: str) -> Question:
+    return Question(
+        id=0, text=poll["text"],
+        options=poll["options"],
+        correct_index=poll.get("correct_index",0),
+        source_channel=channel,
+        auto_captured=True, priority="urgent"
+    )
+
+def _chat_name(chat) -> str:
+    return getattr(chat,"username","") or getattr(chat,"title","") or ""
+
+async def notify_bot(text: str):
+    await client.send_message(settings.ALLOWED_USER_ID, text, parse_mode="markdown")
+
+# المعالجات لا تنتظر SQLite ولا Telegram: الكتابة والتنبيه عبر طابور الالتقاط، والاستطلاعات المنتظرة
+# تُحفظ وتُحذف عبر مخزن PendingPolls المؤقت؛ الاستطلاع غير الموجود في الذاكرة يُبحث عنه في مهمة خلفية
+capture = CaptureQueue(db, lambda text: notify_bot(text))
+_lookups: set = set()
 
 @client.on(events.NewMessage(chats=settings.WATCHED_CHANNELS or None))
 async def on_new_message(event):
     msg = event.message
     if msg.poll:
-        poll = msg.poll.poll
-        labels = ["أ","ب","ج","د","هـ","و"]
-        lines  = [poll.question.text]
-        opts   = []
-        for i, a in enumerate(poll.answers):
-            label = labels[i] if i < len(labels) else str(i+1)
-            lines.append(f"{label}) {a.text.text}")
-            opts.append(a.text.text)
-        correct_id = getattr(msg.poll.results, "correct_option_id", None)
-        if correct_id is not None and 0 <= correct_id < len(poll.answers):
-            cl = labels[correct_id] if correct_id < len(labels) else str(correct_id+1)
-            lines.append(f"\n✅ الإجابة: {cl}) {poll.answers[correct_id].text.text}")
-        pending_polls[msg.id] = {
-            "text": "\n".join(lines), "options": opts,
-            "correct_index": correct_id or 0
-        }
+        pending_polls.put_nowait((msg.chat_id, msg.id), poll_data(msg))
         return
 
-    text = msg.text or msg.message or ""
-    if not text or len(text) < 20: return
-    if not re.search(r"^[أبجدهو]\)", text, re.MULTILINE): return
-    cleaned = clean_text(text)
     channel = ""
     try:
-        chat = await event.get_chat()
-        channel = getattr(chat,"username","") or getattr(chat,"title","")
+        channel = _chat_name(await event.get_chat())
     except: pass
-    q = Question(id=0, text=cleaned, source_channel=channel,
-                 auto_captured=True, priority="normal")
-    qid = await db.add_question(q)
-    logger.info(f"📥 سؤال نصي #{qid} من {channel}")
+    q = text_question(msg, channel)
+    if q is None: return
+    await capture.submit(q)
 
 @client.on(events.MessageEdited(chats=settings.WATCHED_CHANNELS or None))
 async def on_poll_answered(event):
     msg = event.message
     if not msg.poll: return
-    poll_data = pending_polls.get(msg.id)
-    if not poll_data: return
-    results = msg.poll.results
-    if not results or not results.results: return
-    chosen  = next((r for r in results.results if getattr(r,"chosen",False)), None)
-    if not chosen: return
-    correct_id = getattr(results, "correct_option_id", None)
-    chosen_id  = getattr(chosen, "option", None)
-    if correct_id is not None and chosen_id != correct_id:
+    verdict = answered_wrong(msg.poll.results)
+    if verdict is None: return
+    key = (msg.chat_id, msg.id)
+    known, data = pending_polls.peek(key)
+    if known:
+        if data:
+            await _poll_answered(event, key, data, verdict)
+        return
+    task = asyncio.create_task(_stored_poll_answered(event, key, verdict))   # مطرود من الذاكرة أو قبل إعادة التشغيل
+    _lookups.add(task)
+    task.add_done_callback(_lookups.discard)
+
+async def _stored_poll_answered(event, key, verdict: bool):
+    try:
+        data = await pending_polls.get(key)
+        if data:
+            await _poll_answered(event, key, data, verdict)
+    except Exception as e:
+        logger.error(f"Poll lookup error: {e}")
+
+async def _poll_answered(event, key, data: dict, verdict: bool):
+    if verdict:
         channel = ""
         try:
-            chat = await event.get_chat()
-            channel = getattr(chat,"username","") or getattr(chat,"title","")
+            channel = _chat_name(await event.get_chat())
         except: pass
-        q = Question(
-            id=0, text=poll_data["text"],
-            options=poll_data["options"],
-            correct_index=poll_data.get("correct_index",0),
-            source_channel=channel,
-            auto_captured=True, priority="urgent"
-        )
-        qid = await db.add_question(q)
-        await notify_bot(poll_data["text"], qid)
-        logger.info(f"❗ سؤال خاطئ #{qid} محفوظ")
-        del pending_polls[msg.id]
+        if not await capture.submit(wrong_poll_question(data, channel), notify=True):
+            return                              # أُسقط الالتقاط: يبقى منتظراً فيُلتقط عند تعديل لاحق
+        logger.info(f"❗ سؤال خاطئ من {channel}")
+    pending_polls.discard(key)                 # أُجيب (خطأً أو صواباً): لم يعد منتظراً
+
+# ═══════════════════════════════════════════════════
+#  تعبئة السجل القديم (backfill)
+# ═══════════════════════════════════════════════════
+async def backfill_channel(tg, channel: str, page: int = BACKFILL_PAGE) -> dict:
+    """
+    يمشي سجل القناة من الأحدث إلى الأقدم حتى علامة الماء العالية المحفوظة (آخر رسالة عولجت سابقاً).
+    كل صفحة: تحليل الاستطلاعات والنصوص ثم إدراج واحد مع حفظ المؤشر في المعاملة نفسها،
+    فالانقطاع في أي لحظة يُستأنف من آخر صفحة مكتوبة. FloodWait يضاعف الفاصل بين الصفحات،
+    وكل صفحة ناجحة تُنقصه تدريجياً حتى BACKFILL_DELAY.
+    """
+    entity = await tg.get_entity(channel)
+    name   = _chat_name(entity) or str(channel)
+    high, top, cursor = await db.get_backfill_state(str(channel))
+    delay, scanned, kept, started = BACKFILL_DELAY, 0, 0, time.monotonic()
+    while True:
+        try:
+            msgs = [m async for m in tg.iter_messages(entity, limit=page, offset_id=cursor or 0, min_id=high)]
+        except FloodWaitError as e:
+            delay = min(max(delay * 2, 1.0), BACKFILL_MAX_DELAY)
+            logger.warning(f"⏳ FloodWait {e.seconds}ث على {name} — الفاصل الآن {delay:.1f}ث")
+            await asyncio.sleep(e.seconds + delay)
+            continue
+        if not msgs:
+            break
+        top, cursor = top or msgs[0].id, msgs[-1].id
+        found, waiting = [], []
+        for m in msgs:
+            if m.poll:
+                data    = poll_data(m)
+                verdict = answered_wrong(m.poll.results)
+                if verdict:
+                    found.append(wrong_poll_question(data, name))
+                elif verdict is None:
+                    waiting.append(((m.chat_id, m.id), data))   # لم يُجب بعد: قد تصل الإجابة حيّة لاحقاً
+            else:
+                q = text_question(m, name)
+                if q is not None:
+                    found.append(q)
+        await pending_polls.put_many(waiting)
+        await db.add_or_merge_many(found, checkpoint=(str(channel), high, top, cursor))
+        scanned += len(msgs)
+        kept    += len(found)
+        if len(msgs) < page:
+            break
+        await asyncio.sleep(delay)
+        delay = max(BACKFILL_DELAY, delay * 0.75)
+    await db.save_backfill_state(str(channel), max(high, top or 0))
+    elapsed = max(time.monotonic() - started, 1e-9)
+    logger.info(f"📚 تعبئة {name}: {scanned} رسالة ({scanned / elapsed:.1f}/ث)، {kept} سؤال")
+    return {"channel": name, "scanned": scanned, "kept": kept, "seconds": round(elapsed, 2)}
+
+async def backfill(tg=None, channels=None) -> list:
+    tg = tg or client
+    return [await backfill_channel(tg, ch) for ch in (channels or settings.WATCHED_CHANNELS)]
 
 async def main():
     logger.info("🚀 الصائد الصامت يبدأ...")
     await db.init()
-    await client.start(phone=settings.PHONE_NUMBER)
-    logger.info(f"✅ متصل — يراقب: {settings.WATCHED_CHANNELS or 'كل القنوات'}")
-    await client.run_until_disconnected()
+    index = await db.dedupe_index()
+    logger.info(f"♻️ فهرس التكرار: {len(index)} سؤال")
+    feed = ChangeFeed(db.path)                 # إضافات البوت/الـ Mini App تصل إلى فهرس التكرار
+    await feed.open()
+    logger.info(f"🗳️ استطلاعات منتظرة: {await pending_polls.load()}")
+    try:
+        await client.start(phone=settings.PHONE_NUMBER)
+        if "--backfill" in sys.argv:
+            if not settings.WATCHED_CHANNELS:
+                logger.error("❌ التعبئة تحتاج WATCHED_CHANNELS")
+            else:
+                await backfill()
+            return
+        logger.info(f"✅ متصل — يراقب: {settings.WATCHED_CHANNELS or 'كل القنوات'}")
+        capture.start()
+        pending_polls.start()
+        feed.start(db.apply_changes)
+        await client.run_until_disconnected()
+    finally:
+        await feed.stop()
+        if _lookups:
+            await asyncio.gather(*_lookups, return_exceptions=True)
+        await capture.stop()                   # يفرّغ الطابور ويرسل آخر ملخّص قبل إغلاق القاعدة
+        await pending_polls.stop()
+        logger.info(f"✍️ الكاتب: {db.pool.write_metrics()}")
+        await db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,52 @@
+import asyncio, os, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# main.py يتحقق من هذه المتغيرات عند الاستيراد، وقاعدة البوت يجب ألا تلمس ملف الإنتاج
+_TMP = tempfile.mkdtemp(prefix="quiz-tests-")
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("ALLOWED_USER_ID", "1")
+os.environ.setdefault("DB_PATH", os.path.join(_TMP, "quiz.db"))
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_TMP, 'bot.db')}")
+# scraper.userbot يبني TelegramClient عند الاستيراد (ملف الجلسة يُنشأ فوراً)
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("SESSION_NAME", os.path.join(_TMP, "userbot"))
+
+import pytest
+
+
+@pytest.fixture
+def run_db(tmp_path):
+    """يشغّل fn(db) على قاعدة نواة جديدة داخل حلقة واحدة ويغلقها (خيوط aiosqlite ليست daemon)."""
+    from core.database import Database
+
+    def run(fn, path=None):
+        async def go():
+            db = Database(path or str(tmp_path / "quiz.db"))
+            await db.init()
+            try:
+                return await fn(db)
+            finally:
+                await db.close()
+        return asyncio.run(go())
+    return run
+
+
+@pytest.fixture
+def run_bot():
+    """يشغّل fn(main) على قاعدة البوت بعد تفريغها؛ المحرك يُغلق في نهاية الحلقة."""
+    import main
+
+    def run(fn):
+        async def go():
+            await main.init_db()
+            await main.db.clear_all()
+            await main._cache.resync()
+            try:
+                return await fn(main)
+            finally:
+                await main.engine.dispose()
+        return asyncio.run(go())
+    return run
@@ -0,0 +1,90 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core.analytics_engine import analytics
+from core.database import CREATE_SQL
+from core.models import Question
+from core.quiz_engine import engine
+
+TAGS = ["فيزياء", "كيمياء", "أحياء", "رياضيات"]
+
+
+def _random_bank(rng, n):
+    return [Question(id=0, text=f"سؤال رقم {i} في البنك", tags=rng.sample(TAGS, rng.randint(0, 2)),
+                     total_reviews=0, correct_count=0) for i in range(n)]
+
+
+def test_running_counters_match_full_recompute(run_db):
+    rng = random.Random(19)
+    now = datetime.now(timezone.utc)
+
+    async def go(db):
+        checks = []
+
+        async def check():
+            qs = await db.all_questions()
+            checks.append((analytics.report(await db.get_analytics_state(), 3),
+                           analytics.get_full_report(qs, 3)))
+        await check()                                               # بنك فارغ
+        ids = await db.bulk_add(_random_bank(rng, 40))
+        for i in range(5):
+            ids.append(await db.add_question(Question(id=0, text=f"مفرد {i}", tags=[TAGS[i % 4]])))
+        items = [{"question_id": rng.choice(ids), "quality": rng.choice([1, 3, 4, 5]),
+                  "timestamp": (now - timedelta(hours=rng.randint(0, 200))).isoformat()} for _ in range(300)]
+        await db.apply_reviews(items, engine.replay)
+        await check()
+        for qid in rng.sample(ids, 8):                              # تعديل الوسوم: إلى/من بلا وسوم
+            q = await db.get_question(qid)
+            q.tags = [] if q.tags else [TAGS[0], "جديد"]
+            await db.update_question(q)
+        for qid in rng.sample(ids, 5):
+            await db.delete_question(qid)
+        await check()
+        await db.add_question(Question(id=0, text="سؤال رقم 3 في البنك", tags=["مكرر"],
+                                       total_reviews=4, correct_count=3, ease_factor=2.6))
+        await db.merge_duplicates()
+        await check()
+        return checks
+
+    for fast, full in run_db(go):
+        assert fast == full
+
+
+def test_counters_are_backfilled_for_existing_banks(run_db, tmp_path):
+    path = str(tmp_path / "legacy.db")
+    con = sqlite3.connect(path)
+    con.executescript(CREATE_SQL)
+    rows = [("س1", '["أ", "ب"]', 5, 4, 2.6), ("س2", '["أ"]', 2, 1, 2.5), ("س3", "[]", 3, 0, 1.3)]
+    con.executemany("INSERT INTO questions (text, tags, total_reviews, correct_count, ease_factor) VALUES (?,?,?,?,?)",
+                    rows)
+    con.commit()
+    con.close()
+
+    async def go(db):
+        return (analytics.report(await db.get_analytics_state()),
+                analytics.get_full_report(await db.all_questions()), await db.get_analytics_state())
+
+    fast, full, state = run_db(go, path)
+    assert fast == full
+    assert state["tags"] == {"أ": (5, 7), "ب": (4, 5)} and state["untagged"] == (0, 3)
+    assert state["strong"] == 1
+
+
+def test_bot_running_totals_match_full_pass(run_bot):
+    async def go(m):
+        ids = [await m.db.add_question(m.Question(text=f"س{i}", tags=[])) for i in range(6)]
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for i, qid in enumerate(ids * 2):
+            q = await m.db.get_question(qid)
+            before = q.interval
+            await m.db.record_review(m.sm2_review(q, 5 if i % 3 else 0, now), 5 if i % 3 else 0, before, now)
+        await m.db.delete_question(ids[0])
+        totals = dict(await m._cache.get_totals())
+        full   = m.bank_totals(await m.db.all_questions_raw())
+        return totals, full, m.predict_score(totals), m.predict_score(full), await m.db.get_streak()
+
+    totals, full, fast, slow, streak = run_bot(go)
+    assert totals["n"] == full["n"] == 5 and totals["reviews"] == full["reviews"] == 10
+    assert abs(totals["ease"] - full["ease"]) < 1e-9 and totals["wrong"] == full["wrong"]
+    assert fast == slow and streak == 1
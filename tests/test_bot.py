@@ -0,0 +1,85 @@
+def test_search_snippet_shows_stored_text(run_bot):
+    async def go(m):
+        await m.db.add_question(m.Question(text="ما عاصمة فرنسا؟", options=["أ) باريس"], tags=[]))
+        return await m.db.search("عاصمه")
+    (q, snip), = run_bot(go)
+    assert snip == "ما «عاصمة» فرنسا؟"
+
+
+def test_index_keeps_writes_that_land_during_resync(run_bot, monkeypatch):
+    async def go(m):
+        await m.db.add_question(m.Question(text="قديم", tags=[]))
+        real = m._Database.all_questions_raw
+
+        async def slow_snapshot():
+            rows = await real()
+            # كتابة تلتزم بعد قراءة اللقطة وقبل تركيبها
+            await m.db.add_question(m.Question(text="جديد", tags=["x"]))
+            q = await m.db.get_question(rows[0].id)
+            q.priority = "urgent"
+            await m.db.update_question(q)
+            return rows
+
+        monkeypatch.setattr(m._Database, "all_questions_raw", staticmethod(slow_snapshot))
+        await m._cache.resync()
+        return [(q.text, q.priority) for q in await m._cache.get()], m._cache._sched.tag_counts()
+    rows, tags = run_bot(go)
+    assert rows == [("قديم", "urgent"), ("جديد", "normal")]
+    assert tags == {"x": 1}
+
+
+def test_index_list_stays_sorted_without_resort(run_bot):
+    async def go(m):
+        ids = [await m.db.add_question(m.Question(text=f"س{i}", tags=[])) for i in range(5)]
+        await m.db.delete_question(ids[2])
+        q = await m.db.get_question(ids[1])
+        q.text = "معدل"
+        await m.db.update_question(q)
+        return ids, [(q.id, q.text) for q in await m._cache.get()]
+    ids, rows = run_bot(go)
+    assert rows == [(ids[0], "س0"), (ids[1], "معدل"), (ids[3], "س3"), (ids[4], "س4")]
+
+
+class _FakeQuery:
+    def __init__(self, data):
+        self.data, self.sent = data, []
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, **kw):
+        self.sent.append((text, kw.get("reply_markup")))
+
+
+def test_layout_is_parsed_at_ingest_and_backfilled(run_bot):
+    async def go(m):
+        qid = await m.db.add_question(m.Question(text="سؤال؟\nأ) نعم\nب) لا ✅", options=[], correct_index=1, tags=[]))
+        stored = (await m.db.get_question(qid)).layout
+        async with m.async_session() as s:
+            await s.execute(m.Question.__table__.update().values(layout=None))
+            await s.commit()
+        await m.init_db()
+        return stored, (await m.db.get_question(qid)).layout
+    stored, backfilled = run_bot(go)
+    assert stored == backfilled == {"stem": "سؤال؟", "labels": ["أ", "ب"], "bodies": ["نعم", "لا"]}
+
+
+def test_answer_tap_does_not_reparse_question_text(run_bot, monkeypatch):
+    async def go(m):
+        qid = await m.db.add_question(m.Question(text="ما عاصمة فرنسا؟", options=["أ) باريس", "ب) روما"],
+                                                 correct_index=0, tags=[]))
+        shown = _FakeQuery("menu_quiz_all")
+        await m._send_question(shown, await m.db.get_question(qid), None)
+
+        def boom(*_):
+            raise AssertionError("reparsed on tap")
+        monkeypatch.setattr("core.parser.extract_options", boom)
+        monkeypatch.setattr(m, "question_layout", boom)
+        tap = _FakeQuery(f"opt_{qid}_1")
+        ctx = type("Ctx", (), {"user_data": {}})()
+        await m.quiz_option(type("U", (), {"callback_query": tap})(), ctx)
+        return shown.sent[0], tap.sent[0][0], (await m.db.get_question(qid)).wrong_count
+    (text, kb), answer, wrong = run_bot(go)
+    assert text.endswith("ما عاصمة فرنسا؟")
+    assert [r[0].text for r in kb.inline_keyboard[:2]] == ["أ) باريس", "ب) روما"]
+    assert "✅ أ) باريس\n❌ ب) روما" in answer and wrong == 1
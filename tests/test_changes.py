@@ -0,0 +1,162 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from core.database import CREATE_SQL, db
+from core.models import Question
+from mini_app.main import app
+
+
+def _replay(db_, limit=3):
+    """يطبّق الدلتا صفحة صفحة على «نسخة عميل» (قاموس) كما يفعل app.js."""
+    async def go(replica, cursor):
+        while True:
+            ch = await db_.get_changes(cursor, limit)
+            replica.update({q.id: q for q in ch["upserts"]})
+            for qid in ch["deletes"]:
+                replica.pop(qid, None)
+            cursor = ch["cursor"]
+            if not ch["more"]:
+                return cursor
+    return go
+
+
+def test_deltas_rebuild_and_update_a_replica(run_db):
+    async def go(d):
+        ids = [await d.add_question(Question(id=0, text=f"دلتا {i}", tags=["أ"])) for i in range(7)]
+        replica = {}
+        cursor = await _replay(d)(replica, 0)
+        q = await d.get_question(ids[2])
+        q.text = "معدّل"
+        await d.update_question(q)
+        await d.delete_question(ids[4])
+        new = await d.add_question(Question(id=0, text="جديد"))
+        delta = await d.get_changes(cursor)
+        cursor = await _replay(d)(replica, cursor)
+        full = {x.id: x for x in await d.all_questions()}
+        async with d.pool.reader() as r:
+            async with r.execute("SELECT COUNT(*) FROM change_log") as c:
+                log = (await c.fetchone())[0]
+        return replica, full, delta, new, ids, log, await d.get_changes(cursor + 100)
+
+    replica, full, delta, new, ids, log, ahead = run_db(go)
+    assert replica == full
+    assert sorted(q.id for q in delta["upserts"]) == sorted([ids[2], new]) and delta["deletes"] == [ids[4]]
+    assert log == 8                                              # مضغوط: صف لكل سؤال (7 + جديد)
+    assert ahead["reset"] and ahead["cursor"] == 0
+
+
+def test_change_log_is_backfilled_and_served(tmp_path, run_db):
+    path = str(tmp_path / "legacy.db")
+    con = sqlite3.connect(path)
+    con.executescript(CREATE_SQL)
+    con.executemany("INSERT INTO questions (text) VALUES (?)", [("أ",), ("ب",)])
+    con.commit()
+    con.close()
+
+    async def go(d):
+        replica = {}
+        await _replay(d)(replica, 0)
+        return sorted(replica)
+    assert run_db(go, path) == [1, 2]
+
+    with TestClient(app) as c:
+        c.portal.call(db.clear_all)
+        for i in range(3):
+            c.portal.call(db.add_question, Question(id=0, text=f"س{i}"))
+        page = c.get("/api/changes", params={"since": 0, "limit": 2}).json()
+        rest = c.get("/api/changes", params={"since": page["cursor"]}).json()
+        assert page["more"] and not rest["more"] and len(rest["upserts"]) + len(page["upserts"]) >= 3
+        assert {"next_review", "wrong_count", "interval"} <= set(rest["upserts"][-1])
+
+
+def _external(path):
+    from core.fts import register_functions
+    con = sqlite3.connect(path)
+    register_functions(con)                                         # مشغلات FTS تستدعي arabic_norm
+    return con
+
+
+def test_feed_carries_other_process_writes_to_the_dedupe_index(run_db):
+    from core.changes import ChangeFeed
+
+    async def go(d):
+        kept = await d.add_question(Question(id=0, text="ما هي عاصمة مصر؟", options=["القاهرة", "الجيزة"]))
+        await d.dedupe_index()
+        feed = ChangeFeed(d.path)
+        try:
+            await feed.open()
+            idle = await feed.poll()
+            con = _external(d.path)                                 # عملية أخرى: إضافة وحذف
+            cur = con.execute("INSERT INTO questions (text, options) VALUES (?, ?)",
+                              ("ما هي عاصمة فرنسا؟", '["باريس", "ليون"]'))
+            other = cur.lastrowid
+            con.execute("DELETE FROM questions WHERE id=?", (kept,))
+            con.commit()
+            ch = await feed.poll()
+            await d.apply_changes(ch)
+            dup = await d.add_or_merge(Question(id=0, text="ما هي عاصمة فرنسا؟", options=["باريس", "ليون"]))
+            fresh = await d.add_or_merge(Question(id=0, text="ما هي عاصمة مصر؟", options=["القاهرة", "الجيزة"]))
+            con.execute("DELETE FROM change_log")                   # قاعدة أعيد إنشاؤها: التسلسل رجع للخلف
+            con.commit()
+            con.close()
+            reset = await feed.poll()
+            return idle, ch, other, kept, dup, fresh, reset
+        finally:
+            await feed.close()                                      # خيط aiosqlite ليس daemon
+
+    idle, ch, other, kept, dup, fresh, reset = run_db(go)
+    assert idle is None
+    assert ch.upserts == [other] and ch.deletes == [kept]
+    assert dup == (other, "exact") and fresh[1] is None
+    assert reset.reset
+
+
+def test_bot_index_applies_feed_deltas(run_bot):
+    from core.changes import ChangeFeed
+
+    async def go(m):
+        qid = await m.db.add_question(m.Question(text="قديم", tags=["أ"]))
+        feed = ChangeFeed(m.engine.url.database)
+        await feed.open()
+        try:
+            con = _external(m.engine.url.database)
+            con.execute("UPDATE questions SET text='معدّل', wrong_count=3, total_reviews=4 WHERE id=?", (qid,))
+            new = con.execute("INSERT INTO questions (text, options, tags, total_reviews, wrong_count, ease_factor) "
+                              "VALUES ('خارجي', '[]', '[]', 0, 0, 2.5)").lastrowid
+            con.commit()
+            con.close()
+            await m._cache.apply_changes(await feed.poll())
+        finally:
+            await feed.close()
+        by_id = {q.id: q for q in await m._cache.get()}
+        return by_id[qid].text, new in by_id, dict(await m._cache.get_totals())
+
+    text, seen, totals = run_bot(go)
+    assert text == "معدّل" and seen and totals["n"] == 2 and totals["wrong"] == 3
+
+
+def test_feed_connection_waits_for_locks_and_bot_schema_matches_the_migration(run_db, run_bot):
+    from core.changes import ChangeFeed
+
+    def schema(path):
+        con = sqlite3.connect(path)
+        rows = con.execute("""SELECT name, sql FROM sqlite_master
+                              WHERE name LIKE 'change_log%' ORDER BY name""").fetchall()
+        con.close()
+        return rows
+
+    async def core_side(d):
+        feed = ChangeFeed(d.path)
+        await feed.open()
+        async with feed._conn.execute("PRAGMA busy_timeout") as c:
+            timeout = (await c.fetchone())[0]
+        await feed.close()
+        return timeout, schema(d.path)
+
+    async def bot_side(m):
+        return schema(m.engine.url.database)
+
+    timeout, core_schema = run_db(core_side)
+    assert timeout == 5000
+    assert run_bot(bot_side) == core_schema
@@ -0,0 +1,51 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from core.analytics_engine import analytics
+from core.columns import BankSnapshot
+from core.models import Question
+from core.quiz_engine import engine
+
+TAGS = ["فيزياء", "كيمياء", "أحياء", "رياضيات"]
+
+
+def test_snapshot_matches_python_full_pass(run_db):
+    rng = random.Random(20)
+    now = datetime.now(timezone.utc)
+
+    async def go(db):
+        ids = await db.bulk_add([Question(id=0, text=f"سؤال عمودي {i}", tags=rng.sample(TAGS, rng.randint(0, 2)),
+                                          auto_captured=i % 7 == 0) for i in range(60)])
+        items = [{"question_id": rng.choice(ids), "quality": rng.choice([0, 2, 3, 5]),
+                  "timestamp": (now - timedelta(hours=rng.randint(0, 300))).isoformat()} for _ in range(400)]
+        await db.apply_reviews(items, engine.replay)
+        snap = await db.snapshot()
+        cached = await db.snapshot()
+        qs = await db.all_questions()
+        ts = now.timestamp()
+        out = [(analytics.snapshot_report(snap, 2), analytics.get_full_report(qs, 2),
+                analytics.snapshot_cards(snap, 7, ts), analytics.card_stats(qs, 7, ts))]
+        await db.delete_question(ids[0])
+        fresh = await db.snapshot()
+        return out, snap is cached, fresh is not snap and len(fresh) == len(snap) - 1
+
+    out, cached, rebuilt = run_db(go)
+    for fast, full, cards, py_cards in out:
+        assert fast == full and fast["prediction"]["by_tag"]
+        assert cards == py_cards and len(cards["weakest"]) == 7
+    assert cached and rebuilt
+
+
+def test_weakest_breaks_ease_ties_like_python():
+    qs = [Question(id=i, text="", ease_factor=(1.3, 2.5)[i % 2], wrong_count=i % 3,
+                   next_review=None if i % 5 == 0 else "2026-01-01T00:00:00") for i in range(1, 41)]
+    snap = BankSnapshot.from_questions(qs)
+    for k in (1, 3, 19, 20, 21, 40, 60):
+        assert snap.weakest(k) == analytics.card_stats(qs, k, 0)["weakest"]
+    assert analytics.snapshot_cards(snap, 5, 2e9) == analytics.card_stats(qs, 5, 2e9)
+    empty = BankSnapshot.from_questions([])
+    assert analytics.snapshot_report(empty) == analytics.get_full_report([]) and empty.weakest(5) == []
@@ -0,0 +1,134 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.database import CREATE_SQL, MIGRATIONS
+from core.models import Question
+from core.quiz_engine import engine
+
+
+async def _plan(db, sql, params=()):
+    async with db.pool.reader() as d:
+        async with d.execute("EXPLAIN QUERY PLAN " + sql, params) as c:
+            return " ".join(r[3] for r in await c.fetchall())
+
+
+def test_modes_use_indexes(run_db):
+    async def go(db):
+        for i in range(5):
+            await db.add_question(Question(id=0, text=f"q{i}", priority="urgent" if i % 2 else "normal"))
+        urgent = await db.get_questions("urgent", limit=10)
+        return urgent, await _plan(db, "SELECT * FROM questions WHERE priority=? ORDER BY next_review LIMIT 5",
+                                   ("urgent",))
+    urgent, plan = run_db(go)
+    assert [q.priority for q in urgent] == ["urgent", "urgent"]
+    assert "ix_questions_priority" in plan
+
+
+def test_migrations_upgrade_legacy_db(run_db, tmp_path):
+    path = str(tmp_path / "legacy.db")
+    con = sqlite3.connect(path)
+    con.executescript(CREATE_SQL)
+    con.execute(
+        "INSERT INTO questions (text, tags, review_dates, priority, total_reviews) VALUES (?,?,?,?,?)",
+        ("ما عاصمة فرنسا؟", '["جغرافيا", "عام"]', '["2026-01-01T10:00:00", "2026-01-02T10:00:00"]', "urgent", 2),
+    )
+    con.commit()
+    con.close()
+
+    async def go(db):
+        async with db.pool.reader() as d:
+            async with d.execute("PRAGMA user_version") as c:
+                version = (await c.fetchone())[0]
+            async with d.execute("SELECT name FROM pragma_table_info('questions')") as c:
+                cols = {r[0] for r in await c.fetchall()}
+            async with d.execute("SELECT COUNT(*) FROM review_events") as c:
+                events = (await c.fetchone())[0]
+        return (version, cols, events, await db.get_tag_counts(),
+                [q.id for q in await db.search("عاصمه")], await db.get_stats())
+
+    version, cols, events, tags, hits, stats = run_db(go, path)
+    assert version == len(MIGRATIONS)
+    assert "review_dates" not in cols
+    assert events == 2
+    assert tags == {"جغرافيا": 1, "عام": 1}
+    assert hits == [1]
+    assert stats["by_priority"] == {"urgent": 1} and stats["total_reviews"] == 2
+
+
+def test_streak_and_heatmap_from_review_events(run_db):
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=1, microsecond=0)
+
+    async def go(db):
+        qid = await db.add_question(Question(id=0, text="س", next_review="", last_review=None))
+        items = [{"question_id": qid, "quality": 4, "timestamp": (today - timedelta(days=d)).isoformat()}
+                 for d in (4, 2, 1, 0)]
+        await db.apply_reviews(items, engine.replay)
+        return await db.get_streak(), await db.get_heatmap(7), await db.get_history(qid)
+    streak, heat, history = run_db(go)
+    assert streak == 3
+    assert sorted(heat.values()) == [1, 1, 1, 1] and len(heat) == 4
+    assert [e.interval_before for e in reversed(history)][:2] == [0, 1.0]
+
+
+def test_materialized_stats_match_the_aggregate(run_db):
+    rng = random.Random(7)
+    now = datetime.now(timezone.utc)
+    prio = ["urgent", "normal", "low"]
+
+    async def go(db):
+        checks = []
+
+        async def check():
+            async with db.pool.reader() as d:
+                async with d.execute("""SELECT priority, n, total_reviews, auto_captured, ease_sum
+                                        FROM question_stats WHERE n > 0 ORDER BY priority""") as c:
+                    table = [tuple(r) for r in await c.fetchall()]
+                async with d.execute("""SELECT COALESCE(priority,'normal'), COUNT(*), SUM(total_reviews),
+                                               SUM(auto_captured), SUM(ease_factor)
+                                        FROM questions GROUP BY 1 ORDER BY 1""") as c:
+                    full = [tuple(r) for r in await c.fetchall()]
+            checks.append((await db.get_stats(), await db.get_stats(materialized=False), table, full))
+
+        def card(i, text=None):
+            return Question(id=0, text=text or f"سؤال إحصاء رقم {i} مستقل عن غيره", priority=rng.choice(prio),
+                            auto_captured=rng.random() < 0.3, ease_factor=round(rng.uniform(1.3, 3.0), 2),
+                            total_reviews=rng.randint(0, 5))
+        await check()                                               # بنك فارغ
+        ids = await db.bulk_add([card(i) for i in range(30)])
+        for step in range(80):
+            op = rng.random()
+            if op < 0.2:
+                ids.append(await db.add_question(card(100 + step)))
+            elif op < 0.45 and ids:
+                q = await db.get_question(rng.choice(ids))
+                q.priority, q.total_reviews = rng.choice(prio), q.total_reviews + 1
+                await db.update_question(q)
+            elif op < 0.65 and ids:
+                await db.apply_reviews([{"question_id": rng.choice(ids), "quality": rng.choice([0, 3, 5]),
+                                         "timestamp": (now - timedelta(hours=rng.randint(0, 48))).isoformat()}
+                                        for _ in range(4)], engine.replay)
+            elif op < 0.8 and ids:
+                await db.delete_question(ids.pop(rng.randrange(len(ids))))
+            elif ids:                                               # نسخة مكررة: تُدمج عند الالتقاط أو دفعةً
+                src = await db.get_question(rng.choice(ids))
+                if rng.random() < 0.5:
+                    await db.add_or_merge(card(0, src.text))
+                else:
+                    ids.append(await db.add_question(card(0, src.text)))
+            if step % 10 == 9:
+                await db.merge_duplicates()
+                ids = [q.id for q in await db.all_questions()]
+                await check()
+        await db.bulk_add([card(200 + i) for i in range(10)])
+        await check()
+        await db.clear_all()
+        await check()
+        return checks
+
+    for fast, slow, table, full in run_db(go):
+        assert fast == slow
+        assert [r[:4] for r in table] == [r[:4] for r in full]
+        assert [r[4] for r in table] == pytest.approx([r[4] for r in full])
@@ -0,0 +1,109 @@
+import time
+
+from core.dedupe import DedupeIndex, merge_card
+from core.models import Question
+
+STEM = "أيّ العناصر التالية يُعدّ من الغازات النبيلة في الجدول الدوري الحديث؟"
+OPTS = ["أ) الهيليوم", "ب) الأكسجين", "ج) النيتروجين"]
+
+
+def test_exact_match_ignores_diacritics_hamza_and_labels():
+    ix = DedupeIndex()
+    ix.add(1, STEM + "\n" + "\n".join(OPTS))
+    reposted = "اي العناصر التاليه يعد من الغازات النبيله في الجدول الدوري الحديث\n1- الهيليوم\n2- الأكسجين\n3- النيتروجين ✅"
+    assert ix.find(reposted) == (1, "exact")
+    assert ix.find(STEM, ["الهيليوم", "الأكسجين", "النيتروجين"]) == (1, "exact")
+
+
+def test_near_match_and_unrelated_text():
+    ix = DedupeIndex()
+    ix.add(7, STEM + "\n" + "\n".join(OPTS))
+    edited = STEM.replace("الحديث", "المعاصر") + "\n" + "\n".join(OPTS)
+    assert ix.find(edited) == (7, "near")
+    assert ix.find("ما عاصمة المملكة العربية السعودية وأكبر مدنها من حيث عدد السكان؟") is None
+
+
+def test_templated_questions_with_other_numbers_are_not_merged():
+    ix = DedupeIndex()
+    for i in range(200):
+        ix.add(i, f"احسب ناتج جمع العددين {i} و {i + 3} ثم اقسم الناتج على اثنين وأعطِ النتيجة")
+    assert ix.find(f"احسب ناتج جمع العددين 10 و 13 ثم اقسم الناتج على اثنين وأعط النتيجة") == (10, "exact")
+    assert ix.find(f"احسب ناتج جمع العددين 10 و 99 ثم اقسم الناتج على اثنين وأعطِ النتيجة") is None
+    assert ix.clusters() == []
+
+
+def test_clusters_remove_and_unchanged_readd():
+    ix = DedupeIndex()
+    ix.add(3, STEM)
+    ix.add(1, STEM + " ")
+    ix.add(2, "سؤال مختلف تماماً عن أي شيء آخر مخزن في البنك")
+    assert ix.clusters() == [[1, 3]]
+    ix.remove(1)
+    assert ix.clusters() == [] and len(ix) == 2
+    ix.add(3, STEM)                       # نفس النص: لا إعادة حساب ولا تغيير
+    assert ix.find(STEM) == (3, "exact")
+
+
+def test_find_is_sub_millisecond():
+    ix = DedupeIndex()
+    for i in range(2000):
+        ix.add(i, f"{STEM} رقم {i}\n" + "\n".join(OPTS))
+    start = time.perf_counter()
+    for i in range(200):
+        ix.find(f"{STEM} رقم {i}", OPTS)
+    assert (time.perf_counter() - start) / 200 < 1e-3
+
+
+def test_merge_card_keeps_schedule_and_unions_metadata():
+    dst = Question(id=1, text=STEM, tags=["كيمياء"], priority="normal", correct_index=-1,
+                   total_reviews=3, correct_count=2, wrong_count=1, interval=6)
+    src = Question(id=0, text=STEM, options=["x", "y"], correct_index=1, tags=["weak", "كيمياء"],
+                   priority="urgent", explanation="شرح", total_reviews=1, wrong_count=1)
+    merge_card(dst, src)
+    assert (dst.priority, dst.tags, dst.options, dst.correct_index, dst.explanation) == \
+           ("urgent", ["كيمياء", "weak"], ["x", "y"], 1, "شرح")
+    assert (dst.total_reviews, dst.correct_count, dst.wrong_count, dst.interval) == (4, 2, 2, 6)
+
+
+def test_core_add_or_merge_and_batch_merge(run_db):
+    async def go(db):
+        a = await db.add_question(Question(id=0, text=STEM, tags=["قديم"]))
+        b = await db.add_question(Question(id=0, text=STEM + " ✅"))
+        c = await db.add_question(Question(id=0, text="سؤال آخر لا علاقة له بالسابق أبداً في أي شيء"))
+        from core.models import ReviewEvent
+        from datetime import datetime, timezone
+        from core.database import _EVENT_INSERT_SQL, _event_params
+        async with db.pool.writer() as d:
+            await d.execute(_EVENT_INSERT_SQL, _event_params(ReviewEvent(b, datetime.now(timezone.utc), 4)))
+        merged = await db.add_or_merge(Question(id=0, text=STEM, tags=["weak"], priority="urgent"))
+        fresh = await db.add_or_merge(Question(id=0, text="سؤال جديد كلياً عن الفيزياء والطاقة الحركية"))
+        res = await db.merge_duplicates()
+        again = await db.merge_duplicates()
+        return (a, b, c, merged, fresh, res, again, [q.id for q in await db.all_questions()],
+                await db.get_question(a), [e.question_id for e in await db.get_history(a)],
+                await db.get_tag_counts())
+
+    a, b, c, merged, fresh, res, again, ids, keep, history, tags = run_db(go)
+    assert merged == (a, "exact") and fresh[1] is None
+    assert res == {"clusters": 1, "merged": 1} and again == {"clusters": 0, "merged": 0}
+    assert ids == [a, c, fresh[0]]
+    assert keep.priority == "urgent" and keep.tags == ["قديم", "weak"]
+    assert history == [a]
+    assert tags == {"قديم": 1, "weak": 1}
+
+
+def test_bot_add_or_merge_and_batch_merge(run_bot):
+    async def go(main):
+        db = main.db
+        a = await db.add_question(main.Question(text=STEM, options=[], tags=[]))
+        b = await db.add_question(main.Question(text=STEM + " ✅", options=[], tags=["t"]))
+        merged = await db.add_or_merge(main.Question(text=STEM, options=[], tags=["weak"], priority="urgent",
+                                                     explanation="شرح"))
+        res = await db.merge_duplicates()
+        keep = await db.get_question(a)
+        return a, b, merged, res, keep, [q.id for q in await main._cache.get()], await db.get_tag_counts()
+
+    a, b, merged, res, keep, cached, tags = run_bot(go)
+    assert merged == (a, "exact") and res == {"clusters": 1, "merged": 1}
+    assert cached == [a] and keep.priority == "urgent" and keep.explanation == "شرح"
+    assert sorted(keep.tags) == ["t", "weak"] and tags == {"t": 1, "weak": 1}
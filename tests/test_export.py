@@ -0,0 +1,56 @@
+import asyncio, gzip, io, json
+
+import pytest
+
+from core import exporter
+from core.models import Question
+
+
+def _export(run_db, fmt, n=7, chunk=3):
+    async def go(db):
+        for i in range(n):
+            await db.add_question(Question(id=0, text=f"سؤال {i}", options=["أ", "ب"],
+                                           tags=[f"t{i % 2}"], priority="urgent" if i % 3 else "normal"))
+        return b"".join([c async for c in exporter.stream(db.iter_pages(chunk), fmt)])
+    return run_db(go)
+
+
+def _rows(fmt, data):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(io.BytesIO(data)).to_pylist()
+    if fmt == "gzip":
+        data = gzip.decompress(data)
+    elif fmt == "zstd":
+        import zstandard
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+@pytest.mark.parametrize("fmt", list(exporter.FORMATS))
+def test_export_round_trips_every_row(run_db, fmt):
+    if fmt not in exporter.available_formats():
+        pytest.skip(f"{fmt} unavailable")
+    rows = _rows(fmt, _export(run_db, fmt))
+    # صفحات keyset بحجم 3 على 7 صفوف: لا صف مكرر ولا مفقود وبالترتيب
+    assert [r["id"] for r in rows] == list(range(1, 8))
+    assert rows[4]["text"] == "سؤال 4" and list(rows[4]["options"]) == ["أ", "ب"]
+    assert list(rows[1]["tags"]) == ["t1"] and rows[1]["priority"] == "urgent"
+
+
+def test_export_of_empty_bank_is_readable(run_db):
+    assert _rows("ndjson", _export(run_db, "ndjson", n=0)) == []
+    if "parquet" in exporter.available_formats():
+        assert _rows("parquet", _export(run_db, "parquet", n=0)) == []
+
+
+def test_unknown_format_is_rejected():
+    async def go():
+        async for _ in exporter.stream(_empty(), "xml"):
+            pass
+
+    async def _empty():
+        if False:
+            yield []
+    with pytest.raises(ValueError):
+        asyncio.run(go())
@@ -0,0 +1,30 @@
+from core.arabic import normalize_arabic
+from core.fts import fts_query, highlight
+from core.models import Question
+
+
+def test_normalize_folds_hamza_taa_and_diacritics():
+    assert normalize_arabic("أَإِآٱ ؤ ئ ى ة ـ") == "اااا و ي ي ه "
+    assert normalize_arabic("Paris") == "paris"
+
+
+def test_query_expands_definite_article():
+    q = fts_query("العاصمة")
+    assert '"عاصمه"*' in q and '"العاصمه"*' in q
+
+
+def test_highlight_keeps_original_text():
+    text = "ما عاصمة فرنسا؟ أ) باريس"
+    assert highlight(text, "عاصمه") == "ما «عاصمة» فرنسا؟ أ) باريس"
+    assert highlight("Capital of FRANCE", "france") == "Capital of «FRANCE»"
+    assert highlight("وَالْعَاصِمَةُ هنا", "عاصمة") == "«وَالْعَاصِمَةُ» هنا"
+
+
+def test_search_returns_original_snippets(run_db):
+    async def go(db):
+        await db.add_question(Question(id=0, text="ما عاصمة فرنسا؟", options=["أ) باريس", "ب) روما"]))
+        await db.add_question(Question(id=0, text="سؤال آخر"))
+        return await db.search_snippets("العاصمه"), await db.search("باريس")
+    hits, by_option = run_db(go)
+    assert [(q.id, snip) for q, snip in hits] == [(1, "ما «عاصمة» فرنسا؟")]
+    assert [q.id for q in by_option] == [1]
@@ -0,0 +1,40 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from core.database import db
+from core.models import Question
+from mini_app import main as mini
+from mini_app.main import app
+
+
+def test_read_endpoints_revalidate_with_etag_until_a_write():
+    with TestClient(app) as c:
+        c.portal.call(db.clear_all)
+        qid = c.portal.call(db.add_question, Question(id=0, text="س1", tags=["أ"]))
+        first = c.get("/api/stats")
+        etag = first.headers["etag"]
+        hits = mini._payloads.hits
+        again = c.get("/api/stats", headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.headers["etag"] == etag and not again.content
+        assert mini._payloads.hits == hits + 1                      # لم يُعد الحساب
+
+        assert c.post("/api/review", json={"question_id": qid, "quality": 5}).status_code == 200
+        after = c.get("/api/stats", headers={"If-None-Match": etag})
+        assert after.status_code == 200 and after.headers["etag"] != etag
+        assert after.json()["total_reviews"] == first.json()["total_reviews"] + 1
+
+        tags = c.get("/api/tags")
+        con = sqlite3.connect(db.path)                              # كتابة من عملية أخرى (الصائد مثلاً)
+        con.execute("INSERT INTO question_tags (question_id, tag) VALUES (?, ?)", (qid, "ب"))
+        con.commit()
+        con.close()
+        fresh = c.get("/api/tags", headers={"If-None-Match": tags.headers["etag"]})
+        assert fresh.status_code == 200 and "ب" in fresh.json()
+
+
+def test_index_is_served_from_memory_with_etag():
+    with TestClient(app) as c:
+        page = c.get("/")
+        assert page.status_code == 200 and page.headers["content-type"].startswith("text/html")
+        assert c.get("/", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
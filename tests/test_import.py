@@ -0,0 +1,112 @@
+import asyncio, gzip, json
+
+from fastapi.testclient import TestClient
+
+from core import exporter, importer
+from core.database import db
+from core.models import Question
+from mini_app.main import app
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _run(data: bytes, existing=(), batch=3):
+    rows = []
+
+    async def insert(batch_rows):
+        rows.extend(batch_rows)
+    stats = asyncio.run(importer.run_import(importer.iter_records(_chunks(data)), existing, insert, batch))
+    return stats, rows
+
+
+def test_bad_records_are_counted_and_import_continues():
+    data = "\n".join([
+        json.dumps({"text": "س1", "options": ["أ", "ب"]}, ensure_ascii=False),
+        "{not json",
+        json.dumps({"text": "س2", "options": 5}),
+        json.dumps(["not", "a", "dict"]),
+        json.dumps({"text": "  "}),
+        json.dumps({"text": " س1 "}, ensure_ascii=False),
+        json.dumps({"question": "س3\nأ) نعم\nب) لا ✅"}, ensure_ascii=False),
+    ]).encode()
+    stats, rows = _run(data)
+    assert stats == {"read": 7, "added": 2, "duplicates": 1, "invalid": 4, "error": None}
+    assert rows[-1]["options"] == ["أ) نعم", "ب) لا"] and rows[-1]["correct_index"] == 1
+
+
+def test_truncated_gzip_keeps_what_was_read():
+    lines = "".join(json.dumps({"text": f"سؤال {i}"}, ensure_ascii=False) + "\n" for i in range(50))
+    data = gzip.compress(lines.encode())
+    stats, rows = _run(data[:len(data) // 2])
+    assert stats["error"] and stats["added"] == len(rows) > 0
+    assert stats["invalid"] <= 1          # السطر الأخير قد يُقطع في منتصفه
+
+
+def test_csv_with_multiline_fields():
+    data = ('text,options,correct_index,tags\n'
+            '"سطر أول\nسطر ثانٍ",أ|ب|ج,2,"a,b"\n'
+            'سؤال آخر,,,\n').encode()
+    stats, rows = _run(data)
+    assert stats["added"] == 2 and stats["invalid"] == 0
+    assert rows[0]["text"] == "سطر أول\nسطر ثانٍ" and rows[0]["options"] == ["أ", "ب", "ج"]
+    assert rows[0]["correct_index"] == 2 and rows[0]["tags"] == ["a", "b"]
+
+
+def test_export_then_import_round_trip(run_db, tmp_path):
+    async def go(src):
+        for i in range(12):
+            await src.add_question(Question(id=0, text=f"سؤال {i}", options=["أ", "ب"], correct_index=i % 2,
+                                            tags=[f"t{i % 3}"], priority="urgent" if i % 4 == 0 else "normal"))
+        blob = b"".join([c async for c in exporter.stream(src.iter_pages(5), "gzip")])
+        dst = type(src)(str(tmp_path / "copy.db"))
+        await dst.init()
+        try:
+            async def insert(rows):
+                await dst.bulk_add([Question(id=0, **{**r, "explanation": r["explanation"] or ""}) for r in rows])
+            first  = await importer.run_import(importer.iter_records(_chunks(blob, 64)), [], insert, 5)
+            second = await importer.run_import(importer.iter_records(_chunks(blob, 64)),
+                                               await dst.all_texts(), insert, 5)
+            return first, second, await src.all_questions(), await dst.all_questions(), await dst.get_tag_counts()
+        finally:
+            await dst.close()
+
+    first, second, src, dst, tags = run_db(go)
+    assert first["added"] == 12 and second == {**second, "added": 0, "duplicates": 12}
+    pick = lambda q: (q.text, q.options, q.correct_index, q.tags, q.priority)
+    assert [pick(q) for q in dst] == [pick(q) for q in src]
+    assert tags == {"t0": 4, "t1": 4, "t2": 4}
+
+
+def test_bulk_add_ids_match_rows(run_db):
+    async def go(d):
+        await d.add_question(Question(id=0, text="قديم"))
+        await d.delete_question(1)
+        ids = await d.bulk_add([Question(id=0, text=f"ن{i}", tags=[f"t{i}"]) for i in range(3)])
+        return ids, {q.id: q.text for q in await d.all_questions()}, await d.get_by_tag("t2")
+    ids, texts, by_tag = run_db(go)
+    assert [texts[i] for i in ids] == ["ن0", "ن1", "ن2"]
+    assert [q.id for q in by_tag] == [ids[2]]
+
+
+def test_bot_bulk_add_returns_ids_in_row_order(run_bot):
+    async def go(main):
+        rows = [{"text": f"ب{i}", "options": [], "correct_index": -1, "explanation": None,
+                 "tags": [f"t{i}"], "priority": "normal", "source_channel": "", "auto_captured": False}
+                for i in range(3)]
+        ids = await main.db.bulk_add(rows)
+        return ids, [(q.id, q.text) for q in await main.db.all_questions_raw()], await main.db.get_tag_counts()
+    ids, stored, tags = run_bot(go)
+    assert stored == list(zip(ids, ["ب0", "ب1", "ب2"]))
+    assert tags == {"t0": 1, "t1": 1, "t2": 1}
+
+
+def test_api_import_rejects_bad_file_and_reports_partial_stats():
+    with TestClient(app) as c:
+        c.portal.call(db.clear_all)
+        r = c.post("/api/import", content="{broken".encode(), params={"fmt": "json"})
+        assert r.status_code == 400
+        ok = c.post("/api/import", content='{"text": "أ"}\n{"text": "ب"}\n'.encode())
+        assert ok.status_code == 200 and ok.json()["added"] == 2
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from benchmarks.bench_parser import legacy_clean_text, legacy_extract_options, make_corpus
+from core.parser import clean_text, extract_options, parse_message
+
+# حالات حدّية مكتوبة يدوياً: كل فرع في المحلل القديم مغطى بمثال واحد على الأقل
+GOLDEN = [
+    "",
+    "\n\n",
+    "سؤال بلا خيارات",
+    "ما عاصمة السعودية؟\nأ) الرياض ✅\nب) جدة",
+    "سؤال\nأ) واحد ✅\nب) اثنان ✅\nج) ثلاثة",                      # آخر ✅ يفوز
+    "سؤال\nأ) ✅",                                                   # خيار ✅ بلا نص بعد القص
+    "سؤال\nأ) س\nب) ص\nالإجابة الصحيحة: ب",
+    "سؤال\na) x\nb) y\nc) z\nالجواب الصحيح c",
+    "سؤال\n1- x\n2- y\n✅ 2",
+    "سؤال\nأ) x\nب) y\n✅ الإجابة هي ب",
+    "سؤال\nأ) x\nب) y\n✅ 12",
+    "سؤال\nأ) x\nب) y\n✅ !!",                                       # ✅ بلا تسمية: السطر مستبعد والفهرس -1
+    "سؤال\nأ) x\nب) y\n✅ هـ",
+    "سؤال\nأ x\nب y\nج z\n✅ ب",                                     # خيارات بلا فاصل
+    "سؤال\nأ x ✅\nب y",
+    "سؤال\nالإجابة الصحيحة: ج\nأ) x\nب) y ✅",                      # ✅ في خيار يتقدم على سطر الإجابة
+    "سؤال\nأ) x\nب) y\n\nشرح: لأن كذا\nوسطر ثانٍ\n\nسطر بعد الشرح",
+    "سؤال حيث المعطيات كذا\nأ) x\nب) y",                             # كلمة شرح ضمن السؤال
+    "سؤال\nأ) x\n💡 تلميح\nب) y\n\nنص أخير",
+    "⏳ 10 ثانية\nسؤال\n00:15\nأ) x\nب) y ✅\nالوقت المتبقي 3",
+    "سؤال\nأ) x\nب) y\nthis line has sec in a very long sentence that exceeds thirty chars",
+    "  سؤال بمسافات  \n\tأ)   x  \n  ب) y ✅  ",
+    "Q?\nA. one\nB. two\nC. three ✅\nD. four",
+    "سؤال\nأ) x\nب) y\nملاحظة\n\n\nلذلك",
+    "أ) خيار فقط\nب) وخيار ✅",
+    "سؤال\r\nأ) x\r\nب) y ✅\r\n",
+]
+
+
+@pytest.mark.parametrize("text", GOLDEN)
+def test_golden_cases_match_legacy(text):
+    assert extract_options(text) == legacy_extract_options(text)
+    assert clean_text(text) == legacy_clean_text(text)
+    assert parse_message(text) == legacy_extract_options(legacy_clean_text(text))
+
+
+def test_generated_corpus_matches_legacy():
+    for msg in make_corpus(3000, random.Random(14)):
+        assert parse_message(msg) == legacy_extract_options(legacy_clean_text(msg)), msg
+        assert extract_options(msg) == legacy_extract_options(msg), msg
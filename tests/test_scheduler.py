@@ -0,0 +1,31 @@
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.bench_scheduler import TAGS, legacy_next, make_bank, make_scheduler
+
+
+def test_matches_legacy_ordering_under_updates():
+    rng = random.Random(7)
+    now = datetime(2026, 1, 1, 12)
+    bank = make_bank(400, now, rng)
+    sched = make_scheduler()
+    for q in bank:
+        sched.update(q)
+    live = {q.id: q for q in bank}
+    for step in range(300):
+        now += timedelta(hours=1)
+        q = live[rng.choice(list(live))]
+        if rng.random() < 0.1:
+            del live[q.id]
+            sched.remove(q.id)
+        else:
+            q.total_reviews += 1
+            q.wrong_count += rng.random() < 0.4
+            q.next_review = now + timedelta(hours=rng.randint(-5, 48))
+            q.tags = rng.sample(TAGS, rng.randint(0, 2))
+            sched.update(q)
+        exclude = rng.choice(list(live))
+        for mode, tag in [("all", None), ("due", None), ("weak", None), ("tag", rng.choice(TAGS))]:
+            ref = legacy_next(list(live.values()), mode, tag, exclude_id=exclude, now=now)
+            got = sched.next(mode, now, tag=tag, exclude=(exclude,))
+            assert got == (ref.id if ref else None), (step, mode, tag)
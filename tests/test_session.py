@@ -0,0 +1,52 @@
+import random
+
+from fastapi.testclient import TestClient
+
+from core.database import db
+from core.models import Question
+from mini_app.main import app
+
+
+def _bank(rng, n):
+    return [Question(id=0, text=f"جلسة {i}", tags=["أ"] if i % 3 else [], priority="urgent" if i % 4 else "normal",
+                     ease_factor=rng.choice([1.3, 2.0, 2.5]), wrong_count=rng.randint(0, 3),
+                     next_review=rng.choice(["", "2020-01-01T00:00:00", "2020-06-01T00:00:00", "2099-01-01T00:00:00"]))
+            for i in range(n)]
+
+
+def test_session_pages_walk_the_same_order_as_get_questions(run_db):
+    async def go(db):
+        await db.bulk_add(_bank(random.Random(21), 57))
+        async with db.pool.writer() as d:                   # next_review فارغ ← NULL (مثل البنوك المستوردة)
+            await d.execute("UPDATE questions SET next_review=NULL WHERE next_review=''")
+        out = []
+        for mode, tag in [("all", None), ("due", None), ("weak", None), ("urgent", None), ("weak", "أ")]:
+            ref = [q.id for q in await db.get_questions(mode, tag, limit=1000)]
+            got, after, pages = [], None, 0
+            while True:
+                rows, after = await db.get_session(mode, tag, 8, after)
+                got += [q.id for q in rows]
+                pages += 1
+                if after is None:
+                    break
+            out.append((mode, ref, got, pages))
+        return out
+
+    for mode, ref, got, pages in run_db(go):
+        assert got == ref and len(set(got)) == len(got), mode
+        assert pages == len(ref) // 8 + 1
+
+
+def test_session_endpoint_cursor_roundtrip():
+    with TestClient(app) as c:
+        c.portal.call(db.clear_all)
+        for q in _bank(random.Random(3), 12):
+            c.portal.call(db.add_question, q)
+        first = c.get("/api/session", params={"mode": "weak", "limit": 5}).json()
+        second = c.get("/api/session", params={"mode": "weak", "limit": 5, "cursor": first["cursor"]}).json()
+        ids = [q["id"] for q in first["cards"] + second["cards"]]
+        assert ids == [q["id"] for q in c.get("/api/questions", params={"mode": "weak", "limit": 10}).json()]
+        assert c.get("/api/session", params={"mode": "due", "cursor": first["cursor"]}).status_code == 400
+        assert c.get("/api/session", params={"cursor": "%%%"}).status_code == 400
+        rest = c.get("/api/session", params={"mode": "weak", "limit": 50, "cursor": second["cursor"]}).json()
+        assert len(rest["cards"]) == 2 and rest["cursor"] is None
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from core.database import db
+from core.models import Question
+from mini_app.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        c.portal.call(db.clear_all)
+        for i in range(2):
+            c.portal.call(db.add_question, Question(id=0, text=f"س{i}"))
+        yield c
+
+
+def _ids(c):
+    return [q.id for q in c.portal.call(db.all_questions)]
+
+
+def test_sync_is_idempotent_per_client_key(client):
+    a, b = _ids(client)
+    items = [
+        {"question_id": a, "quality": 4, "timestamp": "2026-01-02T00:00:00Z", "client_key": "k1"},
+        {"question_id": a, "quality": 0, "timestamp": "2026-01-01T00:00:00Z", "client_key": "k2"},
+        {"question_id": 999, "quality": 4, "client_key": "k3"},
+        {"question_id": b, "quality": 9, "client_key": "k4"},
+        "not-a-dict",
+        {"question_id": b, "quality": 5, "client_key": "k1"},
+    ]
+    r = client.post("/api/sync", json={"items": items}).json()
+    assert [x["status"] for x in r["results"]] == ["applied", "applied", "missing", "invalid", "invalid", "duplicate"]
+    again = client.post("/api/sync", json={"items": items}).json()
+    assert again["synced"] == 0
+    assert [x["status"] for x in again["results"]][:3] == ["duplicate", "duplicate", "missing"]
+    q = client.portal.call(db.get_question, a)
+    assert (q.total_reviews, q.wrong_count, q.correct_count) == (2, 1, 1)
+
+
+def test_sync_reports_each_items_own_outcome(client):
+    a, _ = _ids(client)
+    r = client.post("/api/sync", json={"items": [
+        {"question_id": a, "quality": 5, "timestamp": "2026-01-03T00:00:00Z", "client_key": "late"},
+        {"question_id": a, "quality": 0, "timestamp": "2026-01-01T00:00:00Z", "client_key": "early"},
+    ]}).json()
+    late, early = r["results"]
+    # المراجعة المبكرة (خطأ) طُبّقت أولاً: سلسلتها 0 واستحقاقها بعد يوم من وقتها
+    assert early["streak"] == 0 and early["next_review"].startswith("2026-01-02")
+    assert late["streak"] == 1 and late["next_review"].startswith("2026-01-04")
+
+
+def test_offline_review_older_than_last_review_does_not_rewind(client):
+    a, _ = _ids(client)
+    first = client.post("/api/review", json={"question_id": a, "quality": 5, "client_key": "now"}).json()
+    before = client.portal.call(db.get_question, a)
+    r = client.post("/api/sync", json={"items": [
+        {"question_id": a, "quality": 0, "timestamp": "2026-01-01T00:00:00Z", "client_key": "old"},
+    ]}).json()
+    after = client.portal.call(db.get_question, a)
+    assert r["results"][0]["status"] == "stale" and r["synced"] == 0
+    assert (after.last_review, after.next_review, after.streak) == (before.last_review, first["next_review"], 1)
+    history = client.get(f"/api/questions/{a}/history").json()
+    assert [h["quality"] for h in history] == [5, 0]
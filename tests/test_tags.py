@@ -0,0 +1,97 @@
+import random
+
+from fastapi.testclient import TestClient
+
+from core.database import db as core_db
+from core.models import Question
+from mini_app.main import app
+
+TAGS = ["فيزياء", "كيمياء", "أحياء", "weak", ""]
+
+
+def _text(i):
+    return f"سؤال الوسوم رقم {i} عن موضوع مستقل تماماً عن غيره"
+
+
+def _expected(bank):
+    """الوسم ← المعرّفات كما يقولها عمود JSON tags (المرجع)."""
+    out = {}
+    for q in bank:
+        for t in set(q.tags or []):
+            if t:
+                out.setdefault(t, set()).add(q.id)
+    return {t: sorted(ids) for t, ids in sorted(out.items())}
+
+
+async def _churn(db, rng, make, n=40):
+    """إضافات فردية ودفعية، إعادة وسم، حذف، دمج عند الالتقاط ودمج دفعي — كل ما يمس question_tags."""
+    ids = [await db.add_question(make(_text(i), rng.sample(TAGS, rng.randint(0, 3)))) for i in range(n)]
+    for _ in range(60):
+        op = rng.random()
+        if op < 0.4 and ids:
+            q = await db.get_question(rng.choice(ids))
+            q.tags = rng.sample(TAGS, rng.randint(0, 3))
+            await db.update_question(q)
+        elif op < 0.6 and ids:
+            qid = ids.pop(rng.randrange(len(ids)))
+            await db.delete_question(qid)
+        elif op < 0.8 and ids:
+            src = await db.get_question(rng.choice(ids))
+            await db.add_or_merge(make(src.text, rng.sample(TAGS, rng.randint(1, 2))))
+        else:
+            src = await db.get_question(rng.choice(ids)) if ids else None
+            if src is not None:                     # نسخة مكررة تبقى حتى merge_duplicates
+                ids.append(await db.add_question(make(src.text, rng.sample(TAGS, rng.randint(1, 2)))))
+    await db.merge_duplicates()
+
+
+def test_core_question_tags_follow_the_json_column(run_db):
+    async def go(db):
+        await _churn(db, random.Random(3), lambda text, tags: Question(id=0, text=text, tags=tags))
+        await db.bulk_add([Question(id=0, text=_text(100 + i), tags=["كيمياء", "كيمياء", ""]) for i in range(5)])
+        bank = await db.all_questions()
+        async with db.pool.reader() as d:
+            async with d.execute("SELECT tag, question_id FROM question_tags ORDER BY tag, question_id") as c:
+                rows = await c.fetchall()
+        table = {}
+        for t, qid in rows:
+            table.setdefault(t, []).append(qid)
+        by_tag = {t: [q.id for q in await db.get_by_tag(t)] for t in table}
+        filtered = {t: sorted(q.id for q in await db.get_questions("all", t, limit=1000)) for t in table}
+        return bank, table, await db.get_all_tags(), await db.get_tag_counts(), by_tag, filtered
+
+    bank, table, tags, counts, by_tag, filtered = run_db(go)
+    expected = _expected(bank)
+    assert table == expected and by_tag == expected and filtered == expected
+    assert tags == list(expected) and counts == {t: len(ids) for t, ids in expected.items()}
+
+
+def test_api_tag_filter_matches_the_json_column():
+    with TestClient(app) as c:
+        c.portal.call(core_db.clear_all)
+        c.portal.call(_churn, core_db, random.Random(5), lambda text, tags: Question(id=0, text=text, tags=tags), 20)
+        expected = _expected(c.portal.call(core_db.all_questions))
+        got = {t: sorted(q["id"] for q in c.get("/api/questions", params={"tag": t, "limit": 200}).json())
+               for t in expected}
+        counts = c.get("/api/tags", params={"counts": "true"}).json()
+    assert got == expected
+    assert counts == {t: len(ids) for t, ids in expected.items()}
+
+
+def test_bot_question_tags_follow_the_json_column(run_bot):
+    async def go(m):
+        await _churn(m.db, random.Random(4), lambda text, tags: m.Question(text=text, options=[], tags=tags))
+        await m.db.bulk_add([{"text": _text(100 + i), "options": [], "tags": ["كيمياء", ""]} for i in range(3)])
+        await m._cache.resync()
+        async with m.async_session() as s:
+            rows = (await s.execute(m.select(m.QuestionTag.tag, m.QuestionTag.question_id))).all()
+        table = {}
+        for t, qid in sorted(rows):
+            table.setdefault(t, []).append(qid)
+        bank = await m._cache.get()
+        return bank, table, await m.db.get_all_tags(), await m.db.get_tag_counts(), m._cache._sched.tag_counts()
+
+    bank, table, tags, counts, sched = run_bot(go)
+    expected = _expected(bank)
+    assert table == expected and sched == {t: len(ids) for t, ids in expected.items()}
+    assert tags == list(expected) and counts == {t: len(ids) for t, ids in expected.items()}
@@ -0,0 +1,267 @@
+import asyncio
+from types import SimpleNamespace as NS
+
+import pytest
+from telethon.errors import FloodWaitError
+
+from scraper import userbot
+from scraper.capture import CaptureQueue, digest_text
+from scraper.pending import PendingPolls
+
+
+def _text(i):
+    return NS(id=i, chat_id=-100, poll=None, text=f"سؤال رقم {i} عن موضوع مختلف في القناة\nأ) نعم\nب) لا",
+              message=None)
+
+
+def _poll(i, chosen=None, chat_id=-100):
+    answers = [NS(text=NS(text=t)) for t in ("صح", "خطأ")]
+    votes   = [NS(option=chosen, chosen=True)] if chosen is not None else []
+    return NS(id=i, chat_id=chat_id, text="", message=None,
+              poll=NS(poll=NS(question=NS(text=f"استطلاع رقم {i} عن شيء ما"), answers=answers),
+                      results=NS(correct_option_id=0, results=votes)))
+
+
+class FakeClient:
+    """يحاكي get_entity و iter_messages في Telethon: الأحدث أولاً، offset_id حصري، min_id حصري."""
+
+    def __init__(self, messages, fail_on=None):
+        self.messages, self.fail_on, self.calls = sorted(messages, key=lambda m: -m.id), fail_on or {}, []
+
+    async def get_entity(self, channel):
+        return NS(username=channel, title="")
+
+    async def iter_messages(self, entity, limit, offset_id=0, min_id=0):
+        self.calls.append((offset_id, min_id))
+        err = self.fail_on.pop(len(self.calls), None)
+        if err is not None:
+            raise err
+        page = [m for m in self.messages if (not offset_id or m.id < offset_id) and m.id > min_id][:limit]
+        for m in page:
+            yield m
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    sleeps = []
+
+    async def sleep(s):
+        sleeps.append(s)
+    monkeypatch.setattr(userbot, "asyncio", NS(sleep=sleep))
+    monkeypatch.setattr(userbot, "BACKFILL_DELAY", 0.5)
+    return sleeps
+
+
+def _use(monkeypatch, db, send=None, **kw):
+    monkeypatch.setattr(userbot, "db", db)
+    monkeypatch.setattr(userbot, "pending_polls", PendingPolls(db, **kw))
+    monkeypatch.setattr(userbot, "capture", CaptureQueue(db, send or _ignore, notify_interval=0))
+    return userbot.pending_polls
+
+
+async def _ignore(text):
+    pass
+
+
+def test_backfill_resumes_after_crash_and_stops_at_high_water(run_db, monkeypatch, bot):
+    history = [_text(i) for i in range(1, 121)] + [_poll(121, chosen=1), _poll(122), _poll(123, chosen=0),
+                                                 NS(id=124, chat_id=-100, poll=None, text="قصير", message=None)]
+
+    async def go(db):
+        _use(monkeypatch, db)
+        crash = FakeClient(history, fail_on={3: RuntimeError("انقطع الاتصال")})
+        with pytest.raises(RuntimeError):
+            await userbot.backfill_channel(crash, "chan", page=40)
+        mid = await db.get_backfill_state("chan")
+        bot.clear()
+        resumed = FakeClient(history, fail_on={1: FloodWaitError(request=None, capture=3)})
+        stats = await userbot.backfill_channel(resumed, "chan", page=40)
+        done  = await db.get_backfill_state("chan")
+        more  = FakeClient(history + [_text(i) for i in range(125, 131)])
+        again = await userbot.backfill_channel(more, "chan", page=40)
+        return (mid, resumed.calls, stats, done, more.calls, again, await db.all_questions(),
+                await db.load_pending_polls(0, 10))
+
+    mid, calls, stats, done, more_calls, again, rows, waiting = run_db(go)
+    assert mid == (0, 124, 45)                       # صفحتان كُتبتا: 124..85 ثم 84..45
+    assert calls[0] == calls[1] == (45, 0)           # FloodWait: الصفحة نفسها تُعاد
+    assert bot[0] == 3 + 1.0                         # انتظار FloodWait + الفاصل المضاعف
+    assert stats["scanned"] == 44 and done == (124, None, None)
+    assert more_calls[0] == (0, 124) and again["scanned"] == 6 and again["kept"] == 6
+    texts = [q.text for q in rows]
+    assert len(texts) == len(set(texts)) == 120 + 1 + 6
+    wrong = [q for q in rows if q.priority == "urgent"]
+    assert [q.text.splitlines()[0] for q in wrong] == ["استطلاع رقم 121 عن شيء ما"]
+    assert [(c, m) for c, m, _, _ in waiting] == [(-100, 122)]
+
+
+def test_backfill_pacing_backs_off_and_recovers(run_db, monkeypatch, bot):
+    history = [_text(i) for i in range(1, 31)]
+
+    async def go(db):
+        _use(monkeypatch, db)
+        flood = lambda: FloodWaitError(request=None, capture=0)
+        tg = FakeClient(history, fail_on={1: flood(), 2: flood()})
+        return await userbot.backfill_channel(tg, "c2", page=10)
+
+    stats = run_db(go)
+    assert stats["kept"] == 30
+    # فاصلان مضاعفان بعد FloodWait ثم تناقص تدريجي مع الصفحات الناجحة
+    assert bot == [1.0, 2.0, 2.0, 1.5, 1.125]
+
+
+def test_pending_polls_are_bounded_expire_and_survive_restart(run_db, tmp_path):
+    now = [1_000_000]
+
+    async def go(db):
+        store = PendingPolls(db, max_items=3, ttl=100, clock=lambda: now[0])
+        await store.put_many([((-1, i), {"text": f"س{i}"}) for i in range(10)])
+        store.put_nowait((-2, 5), {"text": "قناة أخرى"})         # msg_id نفسه في قناة أخرى
+        await store.flush()
+        in_memory = len(store)
+        spilled   = await store.get((-1, 0))                    # مطرود من الذاكرة، يُقرأ من الجدول
+        restarted = PendingPolls(db, max_items=3, ttl=100, clock=lambda: now[0])
+        loaded    = (await restarted.load(), len(restarted))
+        both      = (await restarted.get((-1, 5)), await restarted.get((-2, 5)))
+        restarted.discard((-1, 5))
+        gone      = await restarted.get((-1, 5))            # الحذف لم يُكتب بعد: لا يُعاد من الجدول
+        await restarted.flush()
+        gone      = (gone, await db.get_pending_poll(-1, 5))
+        now[0]   += 101
+        expired   = (await restarted.get((-1, 6)), (-2, 5) in restarted)
+        return in_memory, spilled, loaded, len(restarted), both, gone, expired
+
+    in_memory, spilled, loaded, size, both, gone, expired = run_db(go)
+    assert in_memory == 3 and spilled == {"text": "س0"}
+    assert loaded == (3, 3) and size <= 3
+    assert both == ({"text": "س5"}, {"text": "قناة أخرى"})
+    assert gone == (None, None) and expired == (None, False)
+
+
+def test_live_poll_answer_is_captured_after_restart(run_db, monkeypatch):
+    sent = []
+
+    async def send(text):
+        sent.append(text)
+
+    async def go(db):
+        _use(monkeypatch, db)
+        event = lambda m: NS(message=m, get_chat=lambda: _chat())
+        await userbot.on_new_message(event(_poll(7, chat_id=-100)))
+        await userbot.on_new_message(event(_poll(7, chat_id=-200)))
+        await userbot.pending_polls.stop()                       # الإغلاق يفرّغ المخزن المؤقت
+        fresh = _use(monkeypatch, db, send=send, max_items=1)    # إعادة تشغيل: واحد فقط في الذاكرة
+        await fresh.load()
+        userbot.capture.start()
+        fresh.start()
+        await userbot.on_poll_answered(event(_poll(7, chosen=1, chat_id=-200)))
+        await userbot.on_poll_answered(event(_poll(7, chosen=0, chat_id=-100)))
+        await asyncio.gather(*userbot._lookups)                 # غير الموجود في الذاكرة: بحث في الخلفية
+        await userbot.capture.stop()
+        await fresh.stop()
+        return await db.all_questions(), await db.load_pending_polls(0, 10)
+
+    async def _chat():
+        return NS(username="chan", title="")
+
+    rows, waiting = run_db(go)
+    assert [(q.priority, q.source_channel) for q in rows] == [("urgent", "chan")]
+    assert sent == [digest_text([(rows[0].id, rows[0].text)])] and waiting == []
+
+
+def test_capture_queue_batches_writes_and_coalesces_notifications(run_db):
+    sent, batches = [], []
+
+    async def send(text):
+        sent.append(text)
+
+    async def go(db):
+        real = db.add_or_merge_many
+
+        async def counted(qs, checkpoint=None):
+            batches.append(len(qs))
+            return await real(qs, checkpoint)
+        db.add_or_merge_many = counted
+        cq = CaptureQueue(db, send, batch=20, wait_ms=50, notify_interval=60)
+        for i in range(45):                                     # قبل بدء الكاتب: الطابور يتجمع
+            await cq.submit(_q(i), notify=i % 3 == 0)
+        cq.start()
+        await cq.stop()                                         # الإغلاق يكتب الكل ويرسل ملخّصاً أخيراً
+        return cq.stats, len(await db.all_questions())
+
+    stats, stored = run_db(go)
+    assert batches == [20, 20, 5] and stored == 45
+    assert stats["written"] == 45 and stats["batches"] == 3 and stats["dropped"] == 0
+    assert len(sent) <= 2 and stats["notified"] == 15        # 15 تنبيهاً في ملخّص أو اثنين لا 15 رسالة
+    assert sum(t.count("\n#") for t in sent) == 15
+
+
+def test_capture_queue_backpressure_and_drops(run_db):
+    async def go(db):
+        cq = CaptureQueue(db, _ignore, maxsize=2, put_timeout=0.01)
+        ok = [await cq.submit(_q(i)) for i in range(4)]           # لا كاتب: المكان لا يتحرر
+        cq.start()
+        await cq.stop()
+        return ok, cq.stats, len(await db.all_questions())
+
+    ok, stats, stored = run_db(go)
+    assert ok == [True, True, False, False]
+    assert stats["backpressure"] == 2 and stats["dropped"] == 2 and stored == 2
+
+
+def _q(i):
+    return userbot.text_question(_text(i), "chan")
+
+
+def test_poll_handlers_do_not_wait_on_sqlite(run_db, monkeypatch):
+    async def go(db):
+        store = _use(monkeypatch, db)
+        event = lambda m: NS(message=m, get_chat=lambda: _chat())
+        calls = []
+        for name in ("save_pending_polls", "get_pending_poll", "add_or_merge_many"):
+            real = getattr(db, name)
+
+            async def spy(*a, _real=real, _name=name, **kw):
+                calls.append(_name)
+                return await _real(*a, **kw)
+            monkeypatch.setattr(db, name, spy)
+        for i in range(5):
+            await userbot.on_new_message(event(_poll(i)))
+        await userbot.on_poll_answered(event(_poll(0, chosen=0)))   # صواب: يُحذف فقط
+        await userbot.on_poll_answered(event(_poll(1, chosen=1)))   # خطأ: يُلتقط ويُحذف
+        inline = list(calls)
+        await store.flush()
+        await userbot.capture._write([userbot.capture.queue.get_nowait()])
+        return inline, calls, await db.load_pending_polls(0, 10), len(await db.all_questions())
+
+    async def _chat():
+        return NS(username="chan", title="")
+
+    inline, calls, waiting, stored = run_db(go)
+    assert inline == []                                      # لا SQLite داخل المعالجات
+    assert calls.count("save_pending_polls") == 1            # الإضافات والحذف في دفعة واحدة
+    assert sorted(m for _, m, _, _ in waiting) == [2, 3, 4] and stored == 1
+
+
+def test_dropped_capture_keeps_the_poll_pending(run_db, monkeypatch):
+    async def go(db):
+        store = _use(monkeypatch, db)
+        monkeypatch.setattr(userbot, "capture", CaptureQueue(db, _ignore, maxsize=1, put_timeout=0.01))
+        event = lambda m: NS(message=m, get_chat=lambda: _chat())
+        await userbot.on_new_message(event(_poll(9)))
+        await userbot.capture.submit(_q(1))                  # الطابور ممتلئ ولا كاتب
+        await userbot.on_poll_answered(event(_poll(9, chosen=1)))
+        dropped = (userbot.capture.stats["dropped"], await store.get((-100, 9)))
+        userbot.capture.start()
+        await userbot.on_poll_answered(event(_poll(9, chosen=1)))    # تعديل لاحق بعد تحرر الطابور
+        await userbot.capture.stop()
+        await store.flush()
+        return dropped, await store.get((-100, 9)), await db.load_pending_polls(0, 10), \
+            [q.priority for q in await db.all_questions()]
+
+    async def _chat():
+        return NS(username="chan", title="")
+
+    dropped, after, waiting, rows = run_db(go)
+    assert dropped[0] == 1 and dropped[1] is not None
+    assert after is None and waiting == [] and sorted(rows) == ["normal", "urgent"]
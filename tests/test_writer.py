@@ -0,0 +1,71 @@
+import asyncio
+
+from core.models import Question
+from core.writer import GroupCommitWriter
+
+
+def test_concurrent_writes_share_commits_and_failures_stay_isolated(run_db):
+    async def go(db):
+        async def boom():
+            async with db.pool.writer() as d:
+                await d.execute("INSERT INTO questions (text) VALUES ('يتراجع')")
+                raise RuntimeError("x")
+
+        tasks = [db.add_question(Question(id=0, text=f"متزامن {i}")) for i in range(40)]
+        tasks.insert(20, boom())
+        res = await asyncio.gather(*tasks, return_exceptions=True)
+        texts = [q.text for q in await db.all_questions()]
+        return res, texts, db.pool.write_metrics()
+
+    res, texts, m = run_db(go)
+    assert isinstance(res[20], RuntimeError) and all(isinstance(r, int) for r in res[:20] + res[21:])
+    assert len(texts) == 40 and "يتراجع" not in texts
+    assert m["commits"] < 40 and m["max_batch"] > 1 and m["failed"] == 1
+    assert m["queue_depth"] == 0 and m["commit_ms_max"] >= m["commit_ms_avg"] > 0
+
+
+def test_cancelled_waiter_does_not_stall_the_writer(run_db):
+    async def go(db):
+        release = asyncio.Event()
+
+        async def holder():
+            async with db.pool.writer() as d:
+                await d.execute("INSERT INTO questions (text) VALUES ('أول')")
+                await release.wait()
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(db.add_question(Question(id=0, text="ملغى")))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        release.set()
+        await first
+        qid = await asyncio.wait_for(db.add_question(Question(id=0, text="بعده")), 5)
+        return qid, sorted(q.text for q in await db.all_questions())
+
+    qid, texts = run_db(go)
+    assert qid and texts == ["أول", "بعده"]
+
+
+def test_max_batch_bounds_each_commit(tmp_path):
+    import aiosqlite
+
+    async def go():
+        conn = await aiosqlite.connect(str(tmp_path / "w.db"))
+        await conn.execute("CREATE TABLE t (x INTEGER)")
+        await conn.commit()
+        w = GroupCommitWriter(conn, window_ms=50, max_batch=4)
+
+        async def put(i):
+            async with w.intent() as d:
+                await d.execute("INSERT INTO t VALUES (?)", (i,))
+        try:
+            await asyncio.gather(*(put(i) for i in range(10)))
+            await w.close()
+            async with conn.execute("SELECT COUNT(*) FROM t") as c:
+                return (await c.fetchone())[0], w.metrics()
+        finally:
+            await conn.close()
+
+    n, m = asyncio.run(go())
+    assert n == 10 and m["max_batch"] == 4 and m["commits"] == 3